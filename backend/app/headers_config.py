@@ -375,7 +375,8 @@ class BlockHeaders:
         ],
         'M205': ['REG', 'NUM_CAMPO', 'COD_REC', 'VL_DEBITO'],
         'M210': [
-            'REG', 'COD_CONT', 'VL_REC_BRT', 'VL_BC_CONT', 'ALIQ_PIS', 'QUANT_BC_PIS',
+            'REG', 'COD_CONT', 'VL_REC_BRT', 'VL_BC_CONT', 'VL_AJUS_ACRES_BC_PIS',
+            'VL_AJUS_REDUC_BC_PIS', 'VL_BC_CONT_AJUS', 'ALIQ_PIS', 'QUANT_BC_PIS',
             'ALIQ_PIS_QUANT', 'VL_CONT_APUR', 'VL_AJUS_ACRES', 'VL_AJUS_REDUC',
             'VL_CONT_DIFER', 'VL_CONT_DIFER_ANT', 'VL_CONT_PER'
         ],
@@ -428,7 +429,8 @@ class BlockHeaders:
         ],
         'M605': ['REG', 'NUM_CAMPO', 'COD_REC', 'VL_DEBITO'],
         'M610': [
-            'REG', 'COD_CONT', 'VL_REC_BRT', 'VL_BC_CONT', 'ALIQ_COFINS', 
+            'REG', 'COD_CONT', 'VL_REC_BRT', 'VL_BC_CONT', 'VL_AJUS_ACRES_BC_COFINS',
+            'VL_AJUS_REDUC_BC_COFINS', 'VL_BC_CONT_AJUS', 'ALIQ_COFINS',
             'QUANT_BC_COFINS', 'ALIQ_COFINS_QUANT', 'VL_CONT_APUR',
             'VL_AJUS_ACRES', 'VL_AJUS_REDUC', 'VL_CONT_DIFER', 'VL_CONT_DIFER_ANT', 
             'VL_CONT_PER'
@@ -547,7 +549,94 @@ class BlockHeaders:
         '9999': ['REG', 'QTD_LIN'],
     }
 
+    # Parent record of each child record (SPED record hierarchy). A child line
+    # belongs to the closest preceding line of its parent record.
+    PARENT_BLOCKS = {
+        # Block 0
+        '0111': '0110',
+        '0145': '0140', '0150': '0140', '0190': '0140', '0200': '0140',
+        '0400': '0140', '0450': '0140',
+        '0205': '0200', '0206': '0200', '0208': '0200',
 
+        # Block A
+        'A100': 'A010',
+        'A110': 'A100', 'A111': 'A100', 'A120': 'A100', 'A170': 'A100',
+
+        # Block C
+        'C100': 'C010', 'C180': 'C010', 'C190': 'C010', 'C380': 'C010',
+        'C395': 'C010', 'C400': 'C010', 'C490': 'C010', 'C500': 'C010',
+        'C600': 'C010', 'C800': 'C010', 'C860': 'C010',
+        'C110': 'C100', 'C111': 'C100', 'C120': 'C100', 'C170': 'C100', 'C175': 'C100',
+        'C181': 'C180', 'C185': 'C180', 'C188': 'C180',
+        'C191': 'C190', 'C195': 'C190', 'C198': 'C190', 'C199': 'C190',
+        'C381': 'C380', 'C385': 'C380',
+        'C396': 'C395',
+        'C405': 'C400', 'C481': 'C405', 'C485': 'C405', 'C489': 'C400',
+        'C491': 'C490', 'C495': 'C490',
+        'C890': 'C860',
+
+        # Block D
+        'D100': 'D010', 'D200': 'D010', 'D300': 'D010', 'D350': 'D010',
+        'D500': 'D010', 'D600': 'D010',
+        'D101': 'D100', 'D105': 'D100', 'D111': 'D100',
+        'D201': 'D200', 'D205': 'D200', 'D209': 'D200',
+        'D309': 'D300',
+        'D359': 'D350',
+        'D501': 'D500', 'D505': 'D500', 'D509': 'D500',
+        'D601': 'D600', 'D605': 'D600', 'D609': 'D600',
+
+        # Block F
+        'F100': 'F010', 'F120': 'F010', 'F130': 'F010', 'F150': 'F010',
+        'F200': 'F010', 'F500': 'F010', 'F510': 'F010', 'F525': 'F010',
+        'F550': 'F010', 'F560': 'F010', 'F600': 'F010', 'F700': 'F010',
+        'F800': 'F010',
+        'F111': 'F100', 'F129': 'F120', 'F139': 'F130',
+        'F205': 'F200', 'F210': 'F200', 'F211': 'F200',
+        'F509': 'F500', 'F519': 'F510', 'F559': 'F550', 'F569': 'F560',
+
+        # Block I
+        'I100': 'I010', 'I199': 'I100', 'I200': 'I100', 'I299': 'I200',
+        'I300': 'I200', 'I399': 'I300',
+
+        # Block M
+        'M105': 'M100', 'M110': 'M100', 'M115': 'M110',
+        'M205': 'M200', 'M210': 'M200',
+        'M211': 'M210', 'M215': 'M210', 'M220': 'M210', 'M230': 'M210', 'M225': 'M220',
+        'M410': 'M400',
+        'M505': 'M500', 'M510': 'M500', 'M515': 'M510',
+        'M605': 'M600', 'M610': 'M600',
+        'M611': 'M610', 'M615': 'M610', 'M620': 'M610', 'M630': 'M610', 'M625': 'M620',
+        'M810': 'M800',
+
+        # Block P
+        'P100': 'P010', 'P200': 'P010',
+        'P110': 'P100', 'P199': 'P100', 'P210': 'P200',
+
+        # Block 1
+        '1101': '1100', '1102': '1101',
+        '1210': '1200', '1220': '1200',
+        '1501': '1500', '1502': '1501',
+        '1610': '1600', '1620': '1600',
+        '1809': '1800',
+    }
+
+    # Headers that changed between layout versions: files whose COD_VER is
+    # lower than the key use these instead of BLOCK_HEADERS.
+    HEADERS_BEFORE_VERSION = {
+        '006': {
+            'M210': [
+                'REG', 'COD_CONT', 'VL_REC_BRT', 'VL_BC_CONT', 'ALIQ_PIS', 'QUANT_BC_PIS',
+                'ALIQ_PIS_QUANT', 'VL_CONT_APUR', 'VL_AJUS_ACRES', 'VL_AJUS_REDUC',
+                'VL_CONT_DIFER', 'VL_CONT_DIFER_ANT', 'VL_CONT_PER'
+            ],
+            'M610': [
+                'REG', 'COD_CONT', 'VL_REC_BRT', 'VL_BC_CONT', 'ALIQ_COFINS',
+                'QUANT_BC_COFINS', 'ALIQ_COFINS_QUANT', 'VL_CONT_APUR',
+                'VL_AJUS_ACRES', 'VL_AJUS_REDUC', 'VL_CONT_DIFER', 'VL_CONT_DIFER_ANT',
+                'VL_CONT_PER'
+            ],
+        },
+    }
 
     @classmethod
     def get_headers(cls, block_type: str) -> list:
@@ -562,6 +651,38 @@ class BlockHeaders:
         """
         return cls.BLOCK_HEADERS.get(block_type, [])
 
+    @classmethod
+    def get_version_headers(cls, block_type: str, version: str) -> list:
+        """
+        Retrieve headers for a block type as laid out in a given layout version
+
+        Args:
+            block_type (str): The block type identifier
+            version (str): The file's COD_VER, e.g. "006"
+
+        Returns:
+            list: A list of headers for the specified block type and version
+        """
+        for before_version in sorted(cls.HEADERS_BEFORE_VERSION):
+            if version and version < before_version:
+                headers = cls.HEADERS_BEFORE_VERSION[before_version].get(block_type)
+                if headers is not None:
+                    return headers
+        return cls.get_headers(block_type)
+
+    @classmethod
+    def get_parent(cls, block_type: str) -> str:
+        """
+        Retrieve the parent record of a block type
+
+        Args:
+            block_type (str): The block type identifier
+
+        Returns:
+            str: The parent block type, or None for top-level records
+        """
+        return cls.PARENT_BLOCKS.get(block_type)
+
     @classmethod
     def get_all_block_types(cls) -> list:
         """
@@ -570,4 +691,258 @@ class BlockHeaders:
         Returns:
             list: A list of all block type identifiers
         """
-        return list(cls.BLOCK_HEADERS.keys())
\ No newline at end of file
+        return list(cls.BLOCK_HEADERS.keys())
+
+
+class IcmsIpiBlockHeaders(BlockHeaders):
+    """
+    Block headers for the EFD ICMS/IPI layout (SpedEFD files)
+    """
+
+    BLOCK_HEADERS = {
+        # Block 0
+        '0000': [
+            'REG', 'COD_VER', 'COD_FIN', 'DT_INI', 'DT_FIN', 'NOME', 'CNPJ', 'CPF',
+            'UF', 'IE', 'COD_MUN', 'IM', 'SUFRAMA', 'IND_PERFIL', 'IND_ATIV'
+        ],
+        '0001': ['REG', 'IND_MOV'],
+        '0002': ['REG', 'CLAS_ESTAB_IND'],
+        '0005': [
+            'REG', 'FANTASIA', 'CEP', 'END', 'NUM', 'COMPL', 'BAIRRO', 'FONE',
+            'FAX', 'EMAIL'
+        ],
+        '0015': ['REG', 'UF_ST', 'IE_ST'],
+        '0100': [
+            'REG', 'NOME', 'CPF', 'CRC', 'CNPJ', 'CEP', 'END', 'NUM',
+            'COMPL', 'BAIRRO', 'FONE', 'FAX', 'EMAIL', 'COD_MUN'
+        ],
+        '0150': [
+            'REG', 'COD_PART', 'NOME', 'COD_PAIS', 'CNPJ', 'CPF', 'IE',
+            'COD_MUN', 'SUFRAMA', 'END', 'NUM', 'COMPL', 'BAIRRO'
+        ],
+        '0175': ['REG', 'DT_ALT', 'NR_CAMPO', 'CONT_ANT'],
+        '0190': ['REG', 'UNID', 'DESCR'],
+        '0200': [
+            'REG', 'COD_ITEM', 'DESCR_ITEM', 'COD_BARRA', 'COD_ANT_ITEM',
+            'UNID_INV', 'TIPO_ITEM', 'COD_NCM', 'EX_IPI', 'COD_GEN',
+            'COD_LST', 'ALIQ_ICMS', 'CEST'
+        ],
+        '0205': ['REG', 'DESCR_ANT_ITEM', 'DT_INI', 'DT_FIM', 'COD_ANT_ITEM'],
+        '0206': ['REG', 'COD_COMB'],
+        '0210': ['REG', 'COD_ITEM_COMP', 'QTD_COMP', 'PERDA'],
+        '0220': ['REG', 'UNID_CONV', 'FAT_CONV'],
+        '0300': ['REG', 'COD_IND_BEM', 'IDENT_MERC', 'DESCR_ITEM', 'COD_PRNC', 'COD_CTA', 'NR_PARC'],
+        '0305': ['REG', 'COD_CCUS', 'FUNC', 'VIDA_UTIL'],
+        '0400': ['REG', 'COD_NAT', 'DESCR_NAT'],
+        '0450': ['REG', 'COD_INF', 'TXT'],
+        '0460': ['REG', 'COD_OBS', 'TXT'],
+        '0500': ['REG', 'DT_ALT', 'COD_NAT_CC', 'IND_CTA', 'NIVEL', 'COD_CTA', 'NOME_CTA'],
+        '0600': ['REG', 'DT_ALT', 'COD_CCUS', 'CCUS'],
+        '0990': ['REG', 'QTD_LIN_0'],
+
+        # Block B
+        'B001': ['REG', 'IND_DAD'],
+        'B990': ['REG', 'QTD_LIN_B'],
+
+        # Block C
+        'C001': ['REG', 'IND_MOV'],
+        'C100': [
+            'REG', 'IND_OPER', 'IND_EMIT', 'COD_PART', 'COD_MOD', 'COD_SIT',
+            'SER', 'NUM_DOC', 'CHV_NFE', 'DT_DOC', 'DT_E_S', 'VL_DOC', 'IND_PGTO',
+            'VL_DESC', 'VL_ABAT_NT', 'VL_MERC', 'IND_FRT', 'VL_FRT', 'VL_SEG',
+            'VL_OUT_DA', 'VL_BC_ICMS', 'VL_ICMS', 'VL_BC_ICMS_ST', 'VL_ICMS_ST',
+            'VL_IPI', 'VL_PIS', 'VL_COFINS', 'VL_PIS_ST', 'VL_COFINS_ST'
+        ],
+        'C101': ['REG', 'VL_FCP_UF_DEST', 'VL_ICMS_UF_DEST', 'VL_ICMS_UF_REM'],
+        'C110': ['REG', 'COD_INF', 'TXT_COMPL'],
+        'C111': ['REG', 'NUM_PROC', 'IND_PROC'],
+        'C112': ['REG', 'COD_DA', 'UF', 'NUM_DA', 'COD_AUT', 'VL_DA', 'DT_VCTO', 'DT_PGTO'],
+        'C113': [
+            'REG', 'IND_OPER', 'IND_EMIT', 'COD_PART', 'COD_MOD', 'SER', 'SUB',
+            'NUM_DOC', 'DT_DOC', 'CHV_DOCE'
+        ],
+        'C114': ['REG', 'COD_MOD', 'ECF_FAB', 'ECF_CX', 'NUM_DOC', 'DT_DOC'],
+        'C120': ['REG', 'COD_DOC_IMP', 'NUM_DOC_IMP', 'PIS_IMP', 'COFINS_IMP', 'NUM_ACDRAW'],
+        'C170': [
+            'REG', 'NUM_ITEM', 'COD_ITEM', 'DESCR_COMPL', 'QTD', 'UNID', 'VL_ITEM',
+            'VL_DESC', 'IND_MOV', 'CST_ICMS', 'CFOP', 'COD_NAT', 'VL_BC_ICMS',
+            'ALIQ_ICMS', 'VL_ICMS', 'VL_BC_ICMS_ST', 'ALIQ_ST', 'VL_ICMS_ST',
+            'IND_APUR', 'CST_IPI', 'COD_ENQ', 'VL_BC_IPI', 'ALIQ_IPI', 'VL_IPI',
+            'CST_PIS', 'VL_BC_PIS', 'ALIQ_PIS', 'QUANT_BC_PIS', 'ALIQ_PIS_QUANT',
+            'VL_PIS', 'CST_COFINS', 'VL_BC_COFINS', 'ALIQ_COFINS',
+            'QUANT_BC_COFINS', 'ALIQ_COFINS_QUANT', 'VL_COFINS', 'COD_CTA',
+            'VL_ABAT_NT'
+        ],
+        'C175': ['REG', 'IND_VEIC_OPER', 'CNPJ', 'UF', 'CHASSI_VEIC'],
+        'C190': [
+            'REG', 'CST_ICMS', 'CFOP', 'ALIQ_ICMS', 'VL_OPR', 'VL_BC_ICMS',
+            'VL_ICMS', 'VL_BC_ICMS_ST', 'VL_ICMS_ST', 'VL_RED_BC', 'VL_IPI', 'COD_OBS'
+        ],
+        'C191': ['REG', 'VL_FCP_OP', 'VL_FCP_ST', 'VL_FCP_RET'],
+        'C195': ['REG', 'COD_OBS', 'TXT_COMPL'],
+        'C197': [
+            'REG', 'COD_AJ', 'DESCR_COMPL_AJ', 'COD_ITEM', 'VL_BC_ICMS',
+            'ALIQ_ICMS', 'VL_ICMS', 'VL_OUTROS'
+        ],
+        'C500': [
+            'REG', 'IND_OPER', 'IND_EMIT', 'COD_PART', 'COD_MOD', 'COD_SIT', 'SER',
+            'SUB', 'COD_CONS', 'NUM_DOC', 'DT_DOC', 'DT_E_S', 'VL_DOC', 'VL_DESC',
+            'VL_FORN', 'VL_SERV_NT', 'VL_TERC', 'VL_DA', 'VL_BC_ICMS', 'VL_ICMS',
+            'VL_BC_ICMS_ST', 'VL_ICMS_ST', 'COD_INF', 'VL_PIS', 'VL_COFINS',
+            'TP_LIGACAO', 'COD_GRUPO_TENSAO'
+        ],
+        'C590': [
+            'REG', 'CST_ICMS', 'CFOP', 'ALIQ_ICMS', 'VL_OPR', 'VL_BC_ICMS',
+            'VL_ICMS', 'VL_BC_ICMS_ST', 'VL_ICMS_ST', 'VL_RED_BC', 'COD_OBS'
+        ],
+        'C990': ['REG', 'QTD_LIN_C'],
+
+        # Block D
+        'D001': ['REG', 'IND_MOV'],
+        'D100': [
+            'REG', 'IND_OPER', 'IND_EMIT', 'COD_PART', 'COD_MOD', 'COD_SIT', 'SER',
+            'SUB', 'NUM_DOC', 'CHV_CTE', 'DT_DOC', 'DT_A_P', 'TP_CTE', 'CHV_CTE_REF',
+            'VL_DOC', 'VL_DESC', 'IND_FRT', 'VL_SERV', 'VL_BC_ICMS', 'VL_ICMS',
+            'VL_NT', 'COD_INF', 'COD_CTA', 'COD_MUN_ORIG', 'COD_MUN_DEST'
+        ],
+        'D190': [
+            'REG', 'CST_ICMS', 'CFOP', 'ALIQ_ICMS', 'VL_OPR', 'VL_BC_ICMS',
+            'VL_ICMS', 'VL_RED_BC', 'COD_OBS'
+        ],
+        'D990': ['REG', 'QTD_LIN_D'],
+
+        # Block E
+        'E001': ['REG', 'IND_MOV'],
+        'E100': ['REG', 'DT_INI', 'DT_FIN'],
+        'E110': [
+            'REG', 'VL_TOT_DEBITOS', 'VL_AJ_DEBITOS', 'VL_TOT_AJ_DEBITOS',
+            'VL_ESTORNOS_CRED', 'VL_TOT_CREDITOS', 'VL_AJ_CREDITOS',
+            'VL_TOT_AJ_CREDITOS', 'VL_ESTORNOS_DEB', 'VL_SLD_CREDOR_ANT',
+            'VL_SLD_APURADO', 'VL_TOT_DED', 'VL_ICMS_RECOLHER',
+            'VL_SLD_CREDOR_TRANSPORTAR', 'DEB_ESP'
+        ],
+        'E111': ['REG', 'COD_AJ_APUR', 'DESCR_COMPL_AJ', 'VL_AJ_APUR'],
+        'E112': ['REG', 'NUM_DA', 'NUM_PROC', 'IND_PROC', 'PROC', 'TXT_COMPL'],
+        'E113': [
+            'REG', 'COD_PART', 'COD_MOD', 'SER', 'SUB', 'NUM_DOC', 'DT_DOC',
+            'COD_ITEM', 'VL_AJ_ITEM', 'CHV_DOCE'
+        ],
+        'E115': ['REG', 'COD_INF_ADIC', 'VL_INF_ADIC', 'DESCR_COMPL_AJ'],
+        'E116': [
+            'REG', 'COD_OR', 'VL_OR', 'DT_VCTO', 'COD_REC', 'NUM_PROC',
+            'IND_PROC', 'PROC', 'TXT_COMPL', 'MES_REF'
+        ],
+        'E200': ['REG', 'UF', 'DT_INI', 'DT_FIN'],
+        'E210': [
+            'REG', 'IND_MOV_ST', 'VL_SLD_CRED_ANT_ST', 'VL_DEVOL_ST',
+            'VL_RESSARC_ST', 'VL_OUT_CRED_ST', 'VL_AJ_CREDITOS_ST',
+            'VL_RETENCAO_ST', 'VL_OUT_DEB_ST', 'VL_AJ_DEBITOS_ST',
+            'VL_SLD_DEV_ANT_ST', 'VL_DEDUCOES_ST', 'VL_ICMS_RECOL_ST',
+            'VL_SLD_CRED_ST_TRANSPORTAR', 'DEB_ESP_ST'
+        ],
+        'E220': ['REG', 'COD_AJ_APUR', 'DESCR_COMPL_AJ', 'VL_AJ_APUR'],
+        'E250': [
+            'REG', 'COD_OR', 'VL_OR', 'DT_VCTO', 'COD_REC', 'NUM_PROC',
+            'IND_PROC', 'PROC', 'TXT_COMPL', 'MES_REF'
+        ],
+        'E300': ['REG', 'UF', 'DT_INI', 'DT_FIN'],
+        'E310': [
+            'REG', 'IND_MOV_FCP_DIFAL', 'VL_SLD_CRED_ANT_DIFAL', 'VL_TOT_DEBITOS_DIFAL',
+            'VL_OUT_DEB_DIFAL', 'VL_TOT_CREDITOS_DIFAL', 'VL_OUT_CRED_DIFAL',
+            'VL_SLD_DEV_ANT_DIFAL', 'VL_DEDUCOES_DIFAL', 'VL_RECOL_DIFAL',
+            'VL_SLD_CRED_TRANSPORTAR_DIFAL', 'DEB_ESP_DIFAL', 'VL_SLD_CRED_ANT_FCP',
+            'VL_TOT_DEB_FCP', 'VL_OUT_DEB_FCP', 'VL_TOT_CRED_FCP', 'VL_OUT_CRED_FCP',
+            'VL_SLD_DEV_ANT_FCP', 'VL_DEDUCOES_FCP', 'VL_RECOL_FCP',
+            'VL_SLD_CRED_TRANSPORTAR_FCP', 'DEB_ESP_FCP'
+        ],
+        'E316': [
+            'REG', 'COD_OR', 'VL_OR', 'DT_VCTO', 'COD_REC', 'NUM_PROC',
+            'IND_PROC', 'PROC', 'TXT_COMPL', 'MES_REF'
+        ],
+        'E500': ['REG', 'IND_APUR', 'DT_INI', 'DT_FIN'],
+        'E510': ['REG', 'CFOP', 'CST_IPI', 'VL_CONT_IPI', 'VL_BC_IPI', 'VL_IPI'],
+        'E520': [
+            'REG', 'VL_SD_ANT_IPI', 'VL_DEB_IPI', 'VL_CRED_IPI', 'VL_OD_IPI',
+            'VL_OC_IPI', 'VL_SC_IPI', 'VL_SD_IPI'
+        ],
+        'E530': ['REG', 'IND_AJ', 'VL_AJ', 'COD_AJ', 'IND_DOC', 'NUM_DOC', 'DESCR_AJ'],
+        'E990': ['REG', 'QTD_LIN_E'],
+
+        # Block G
+        'G001': ['REG', 'IND_MOV'],
+        'G990': ['REG', 'QTD_LIN_G'],
+
+        # Block H
+        'H001': ['REG', 'IND_MOV'],
+        'H005': ['REG', 'DT_INV', 'VL_INV', 'MOT_INV'],
+        'H010': [
+            'REG', 'COD_ITEM', 'UNID', 'QTD', 'VL_UNIT', 'VL_ITEM', 'IND_PROP',
+            'COD_PART', 'TXT_COMPL', 'COD_CTA', 'VL_ITEM_IR'
+        ],
+        'H020': ['REG', 'CST_ICMS', 'BC_ICMS', 'VL_ICMS'],
+        'H990': ['REG', 'QTD_LIN_H'],
+
+        # Block K
+        'K001': ['REG', 'IND_MOV'],
+        'K100': ['REG', 'DT_INI', 'DT_FIN'],
+        'K200': ['REG', 'DT_EST', 'COD_ITEM', 'QTD', 'IND_EST', 'COD_PART'],
+        'K990': ['REG', 'QTD_LIN_K'],
+
+        # Block 1
+        '1001': ['REG', 'IND_MOV'],
+        '1010': [
+            'REG', 'IND_EXP', 'IND_CCRF', 'IND_COMB', 'IND_USINA', 'IND_VA',
+            'IND_EE', 'IND_CART', 'IND_FORM', 'IND_AER', 'IND_GIAF1',
+            'IND_GIAF3', 'IND_GIAF4', 'IND_REST_RESSARC_COMPL_ICMS'
+        ],
+        '1990': ['REG', 'QTD_LIN_1'],
+
+        # Block 9
+        '9001': ['REG', 'IND_MOV'],
+        '9900': ['REG', 'REG_BLC', 'QTD_REG_BLC'],
+        '9990': ['REG', 'QTD_LIN_9'],
+        '9999': ['REG', 'QTD_LIN'],
+    }
+
+    PARENT_BLOCKS = {
+        # Block 0
+        '0175': '0150',
+        '0205': '0200', '0206': '0200', '0210': '0200', '0220': '0200',
+        '0305': '0300',
+
+        # Block C
+        'C101': 'C100', 'C110': 'C100', 'C120': 'C100', 'C170': 'C100',
+        'C190': 'C100', 'C195': 'C100',
+        'C111': 'C110', 'C112': 'C110', 'C113': 'C110', 'C114': 'C110',
+        'C175': 'C170',
+        'C191': 'C190',
+        'C197': 'C195',
+        'C590': 'C500',
+
+        # Block D
+        'D190': 'D100',
+
+        # Block E
+        'E110': 'E100', 'E111': 'E110', 'E112': 'E111', 'E113': 'E111',
+        'E115': 'E110', 'E116': 'E110',
+        'E210': 'E200', 'E220': 'E210', 'E250': 'E210',
+        'E310': 'E300', 'E316': 'E310',
+        'E510': 'E500', 'E520': 'E500', 'E530': 'E520',
+
+        # Block H
+        'H010': 'H005', 'H020': 'H010',
+
+        # Block K
+        'K200': 'K100',
+    }
+
+    HEADERS_BEFORE_VERSION = {
+        # CEST was added to 0200 with layout 011.
+        '011': {
+            '0200': [
+                'REG', 'COD_ITEM', 'DESCR_ITEM', 'COD_BARRA', 'COD_ANT_ITEM',
+                'UNID_INV', 'TIPO_ITEM', 'COD_NCM', 'EX_IPI', 'COD_GEN',
+                'COD_LST', 'ALIQ_ICMS'
+            ],
+        },
+    }
@@ -3,21 +3,27 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from beanie import init_beanie
-from mongodb import db, check_mongo_connection
+from mongodb import db, check_mongo_connection, ensure_indexes
 from routers.auth import auth_router  
 from routers.user import user_router 
 from routers.business import business_router
 from routers.upload import router as upload_router
 from routers.export import export_router
+from services.parse_pool import shutdown_executor
+from services.ingest_jobs import start_worker, stop_worker
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await check_mongo_connection()  # your own MongoDB connection check
+    await ensure_indexes()
     # Initialize beanie for your User collection
+    await start_worker()  # background ingest worker, resumes unfinished jobs
     yield
-    # Shutdown logic if needed
+    # Shutdown
+    await stop_worker()
+    shutdown_executor()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -12,6 +12,9 @@ db = client["Tax-Track_PROD"]
 documents_collection = db.get_collection("Documents")
 business_collection = db.get_collection("business")
 users_collection = db.get_collection("users")
+ingest_jobs_collection = db.get_collection("ingest_jobs")
+sheet_chunks_collection = db.get_collection("sheet_chunks")
+sheet_edits_collection = db.get_collection("sheet_edits")
 
 def business_helper(business) -> dict:
     return {
@@ -32,6 +35,37 @@ def business_helper(business) -> dict:
         "created_at": business.get("created_at"),
     }
 
+def job_helper(job) -> dict:
+    return {
+        "id": str(job["_id"]),
+        "company_id": job["company_id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "files": job.get("files", []),
+        "errors": job.get("errors", []),
+        "doc_id": job.get("doc_id"),
+        "summary": job.get("summary"),
+        "created_at": job.get("created_at"),
+        "updated_at": job.get("updated_at"),
+    }
+
+async def ensure_indexes():
+    """
+    Creates the indexes the sheet chunk and edit journal queries rely on (no-op if they exist).
+    """
+    await sheet_chunks_collection.create_index(
+        [("doc_id", 1), ("block", 1), ("file_seq", 1), ("block_seq", 1), ("chunk", 1)]
+    )
+    await sheet_chunks_collection.create_index(
+        [("doc_id", 1), ("file_ids.ID_CNPJ", 1), ("file_ids.ID_DT_INI", 1), ("file_ids.ID_DT_FIN", 1)]
+    )
+    await sheet_chunks_collection.create_index([("doc_id", 1), ("partition", 1), ("generation", 1)])
+    await sheet_chunks_collection.create_index([("doc_id", 1), ("generation", 1), ("file_seq", 1)])
+    await sheet_chunks_collection.create_index(
+        [("doc_id", 1), ("sheet", 1), ("file_seq", 1), ("block_seq", 1), ("chunk", 1)]
+    )
+    await sheet_edits_collection.create_index([("doc_id", 1), ("version", 1)], unique=True)
+
 async def check_mongo_connection():
     """
     Asynchronously check if MongoDB is connected by issuing a ping command.
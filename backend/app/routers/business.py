@@ -1,10 +1,13 @@
 # business_routes.py
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Request
+from fastapi.responses import StreamingResponse
 from datetime import datetime
 from bson import ObjectId
 
 from mongodb import business_collection, business_helper, documents_collection
 from models.models import BusinessBase, BusinessUpdate
+from services.document_store import document_catalog
+from services.streaming import StreamedList, document_sheets, encode, negotiate
 
 business_router = APIRouter(prefix="/business", tags=["Business"])
 
@@ -90,22 +93,37 @@ async def delete_business(business_id: str):
 # GET /business/{business_id}/files - Return all documents for a given business
 #
 @business_router.get("/{business_id}/files")
-async def list_business_files(business_id: str):
+async def list_business_files(business_id: str, request: Request, catalog: bool = False):
     """
     Return all 'documents' that belong to a specific business/company.
-    Each doc might have a "sheets" array or other metadata.
+
+    With `catalog=true` only metadata is returned (each sheet's block, period,
+    CNPJ, row and column counts, size and last change), without reading any
+    sheet data; otherwise each doc comes with its full "sheets" array, streamed
+    document by document and chunk by chunk (JSON, or MessagePack with
+    `Accept: application/x-msgpack`).
     """
-    docs = []
     try:
-        # If you store 'company_id' as a *string*, it must match the actual 'business_id' string:
-        cursor = documents_collection.find({"company_id": business_id})
-        async for doc in cursor:
-            docs.append({
-                "id": str(doc["_id"]),
-                "company_id": doc["company_id"],
-                "sheets": doc["sheets"],
-                # add "file_names": doc.get("file_names", []) if you want
-            })
+        media_type = negotiate(request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+
+    # If you store 'company_id' as a *string*, it must match the actual 'business_id' string:
+    query = {"company_id": business_id}
+    try:
+        count = await documents_collection.count_documents(query)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    return docs
+
+    async def batches():
+        async for doc in documents_collection.find(query):
+            if catalog:
+                yield [{"id": str(doc["_id"]), "company_id": doc["company_id"], **await document_catalog(doc)}]
+            else:
+                yield [{
+                    "id": str(doc["_id"]),
+                    "company_id": doc["company_id"],
+                    "sheets": await document_sheets(doc, "celldata"),
+                }]
+
+    return StreamingResponse(encode(StreamedList(batches, count), media_type), media_type=media_type)
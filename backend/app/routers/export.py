@@ -1,51 +1,230 @@
 # export.py
-import io
-import zipfile
-from fastapi import APIRouter, HTTPException, Response
-from typing import List, Dict
-from services.export_utils import export_file, export_file_to_xlsx, export_file_to_csv
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Dict, Optional, Tuple, Union
+from bson import ObjectId
+
+from mongodb import documents_collection
+from services.columnar_export import ARROW_STREAM_MEDIA_TYPE, arrow_stream, parquet_parts, require_pyarrow
+from services.document_store import GROUP_BY_FILE_IDS, GROUP_BY_SHEET, document_catalog
+from services.layouts import field_type
+from services.raw_export import raw_txt_parts
+from services.export_utils import (
+    CSV_DECIMALS, CSV_DELIMITERS, csv_parts, document_batches, file_batches, iterate, txt_parts, xlsx_parts,
+)
+from services.streaming import ZIP_MEDIA_TYPE, zip_stream
 
 export_router = APIRouter()
 
-def create_zip_response(file_dicts: List[Dict], export_fn, file_extension: str, zip_filename: str) -> Response:
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for file_obj in file_dicts:
-            exported = export_fn(file_obj)
-            # If the export function returns a dictionary (file id -> content),
-            # add each file separately.
-            if isinstance(exported, dict):
-                for file_name, file_content in exported.items():
-                    if not file_name.endswith(file_extension):
-                        file_name += file_extension
-                    zip_file.writestr(file_name, file_content)
-            else:
-                # Otherwise, treat it as a single file.
-                file_name = file_obj.get("file_name", "exported_file")
-                if not file_name.endswith(file_extension):
-                    file_name += file_extension
-                zip_file.writestr(file_name, exported)
-    zip_buffer.seek(0)
-    return Response(
-        content=zip_buffer.read(),
-        media_type="application/zip",
+def _file_name(file_obj: Dict, file_extension: str) -> str:
+    file_name = file_obj.get("file_name", "exported_file")
+    return file_name if file_name.endswith(file_extension) else file_name + file_extension
+
+def _csv_options(delimiter: str, decimal: str) -> Dict[str, str]:
+    if delimiter not in CSV_DELIMITERS:
+        raise HTTPException(status_code=400, detail=f"Invalid delimiter, use one of: {' '.join(CSV_DELIMITERS)}")
+    if decimal not in CSV_DECIMALS:
+        raise HTTPException(status_code=400, detail=f"Invalid decimal separator, use one of: {' '.join(CSV_DECIMALS)}")
+    return {"delimiter": delimiter, "decimal": decimal}
+
+async def _uploaded_parts(updated_files: List[Dict], export_format: str,
+                          csv_options: Optional[Dict] = None) -> AsyncIterator[Tuple[str, Union[str, bytes]]]:
+    """Files exported from the sheets sent by the client, one piece at a time (see zip_stream)."""
+    for file_obj in updated_files:
+        if export_format == "txt":
+            # One file per file-level IDs.
+            async for part in txt_parts(iterate(file_batches(file_obj, GROUP_BY_FILE_IDS))):
+                yield part
+        elif export_format == "csv":
+            batches = iterate(file_batches(file_obj, GROUP_BY_SHEET, selected=True))
+            # One folder per uploaded file, one CSV per block and period.
+            async for part in csv_parts(batches, prefix=_file_name(file_obj, "/"), **csv_options):
+                yield part
+        else:
+            batches = iterate(file_batches(file_obj, GROUP_BY_SHEET, selected=True))
+            async for part in xlsx_parts(batches, _file_name(file_obj, ".xlsx")):
+                yield part
+
+def _zip_response(parts: AsyncIterator[Tuple[str, Union[str, bytes]]], zip_filename: str) -> StreamingResponse:
+    """Streams the files as a ZIP archive, compressed while they are produced."""
+    return StreamingResponse(
+        zip_stream(parts),
+        media_type=ZIP_MEDIA_TYPE,
         headers={"Content-Disposition": f"attachment; filename={zip_filename}"}
     )
 
 @export_router.post("/export/")
-async def export_txt(updated_files: List[Dict]) -> Response:
+async def export_txt(updated_files: List[Dict]) -> StreamingResponse:
     if not updated_files:
         raise HTTPException(status_code=400, detail="No file data provided for export.")
-    return create_zip_response(updated_files, export_file, ".txt", "exported_files.zip")
+    return _zip_response(_uploaded_parts(updated_files, "txt"), "exported_files.zip")
 
 @export_router.post("/export/xlsx/")
-async def export_xlsx(updated_files: List[Dict]) -> Response:
+async def export_xlsx(updated_files: List[Dict]) -> StreamingResponse:
     if not updated_files:
         raise HTTPException(status_code=400, detail="No file data provided for export.")
-    return create_zip_response(updated_files, export_file_to_xlsx, ".xlsx", "exported_files.xlsx.zip")
+    return _zip_response(_uploaded_parts(updated_files, "xlsx"), "exported_files.xlsx.zip")
 
 @export_router.post("/export/csv/")
-async def export_csv(updated_files: List[Dict]) -> Response:
+async def export_csv(updated_files: List[Dict], delimiter: str = ",", decimal: str = ".") -> StreamingResponse:
     if not updated_files:
         raise HTTPException(status_code=400, detail="No file data provided for export.")
-    return create_zip_response(updated_files, export_file_to_csv, ".csv", "exported_files.csv.zip")
+    parts = _uploaded_parts(updated_files, "csv", _csv_options(delimiter, decimal))
+    return _zip_response(parts, "exported_files.csv.zip")
+
+async def _find_document(doc_id: str) -> Dict:
+    try:
+        obj_id = ObjectId(doc_id)
+    except:
+        raise HTTPException(status_code=400, detail="Invalid doc id format")
+
+    doc = await documents_collection.find_one({"_id": obj_id})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return doc
+
+# Export formats of stored documents.
+EXPORT_FORMATS = ("txt", "csv", "xlsx", "parquet")
+
+def _file_id_filters(periods: Optional[List[str]], cnpjs: Optional[List[str]]) -> Dict[str, List[str]]:
+    """
+    File ID filters from the query: periods as ID_DT_INI ("01042021") or
+    ID_DT_INI-ID_DT_FIN ("01042021-30042021"), CNPJs as ID_CNPJ. Values may be
+    repeated or comma-separated.
+    """
+    def split(values):
+        return [value.strip() for item in values or [] for value in item.split(",") if value.strip()]
+
+    file_ids = {}
+    period_values = split(periods)
+    if period_values:
+        file_ids["ID_DT_INI"] = [period.split("-")[0] for period in period_values]
+        ends = [period.split("-")[1] for period in period_values if "-" in period]
+        if ends:
+            file_ids["ID_DT_FIN"] = ends
+    if split(cnpjs):
+        file_ids["ID_CNPJ"] = split(cnpjs)
+    return file_ids
+
+async def _document_parts(doc: Dict, export_format: str, blocks: Optional[List[str]], file_ids: Dict,
+                          csv_options: Dict) -> AsyncIterator[Tuple[str, Union[str, bytes]]]:
+    """Files exported from a stored document (same layout as the POST exports), chunk by chunk."""
+    base_name = doc["company_id"]
+    if export_format == "txt":
+        # Byte-exact copies of the uploaded files, with the edits made since.
+        async for part in raw_txt_parts(doc, blocks, file_ids):
+            yield part
+    elif export_format == "csv":
+        async for part in csv_parts(document_batches(doc, GROUP_BY_SHEET, blocks, file_ids), **csv_options):
+            yield part
+    elif export_format == "parquet":
+        async for part in parquet_parts(document_batches(doc, GROUP_BY_SHEET, blocks, file_ids)):
+            yield part
+    else:
+        async for part in xlsx_parts(document_batches(doc, GROUP_BY_SHEET, blocks, file_ids), f"{base_name}.xlsx"):
+            yield part
+
+def _require_pyarrow() -> None:
+    try:
+        require_pyarrow()
+    except ValueError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+async def _prepend(first, parts: AsyncIterator) -> AsyncIterator:
+    yield first
+    async for part in parts:
+        yield part
+
+async def _export_document(doc: Dict, export_format: str, periods, cnpjs, blocks,
+                           csv_options: Dict) -> StreamingResponse:
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format, use one of: {', '.join(EXPORT_FORMATS)}")
+    if export_format == "parquet":
+        _require_pyarrow()
+    # Only the chunks of the selected blocks, periods and CNPJs are read.
+    parts = _document_parts(
+        doc,
+        export_format,
+        [block for item in blocks or [] for block in item.split(",") if block] or None,
+        _file_id_filters(periods, cnpjs),
+        csv_options,
+    )
+    # The first piece tells whether anything matched, before the response starts.
+    first = await anext(parts, None)
+    if first is None:
+        raise HTTPException(status_code=404, detail="No data matches the selected filters.")
+    return _zip_response(_prepend(first, parts), f"{doc['company_id']}.{export_format}.zip")
+
+#
+# GET /export/documents/{doc_id}/{export_format} : Export a stored document (txt, csv, xlsx or parquet)
+#
+@export_router.get("/export/documents/{doc_id}/{export_format}")
+async def export_document(
+    doc_id: str,
+    export_format: str,
+    periods: Optional[List[str]] = Query(None),
+    cnpjs: Optional[List[str]] = Query(None),
+    blocks: Optional[List[str]] = Query(None),
+    delimiter: str = ",",
+    decimal: str = ".",
+) -> StreamingResponse:
+    """
+    Exports a stored document straight from storage, without the client
+    sending the sheets back. `periods`, `cnpjs` and `blocks` (record codes or
+    sheet names, like `selectedBlocks`) narrow the export down; `delimiter`
+    and `decimal` set the CSV conventions (e.g. ";" and "," for Excel in pt-BR).
+    """
+    doc = await _find_document(doc_id)
+    return await _export_document(doc, export_format, periods, cnpjs, blocks, _csv_options(delimiter, decimal))
+
+#
+# GET /export/companies/{company_id}/{export_format} : Export a company's document
+#
+@export_router.get("/export/companies/{company_id}/{export_format}")
+async def export_company(
+    company_id: str,
+    export_format: str,
+    periods: Optional[List[str]] = Query(None),
+    cnpjs: Optional[List[str]] = Query(None),
+    blocks: Optional[List[str]] = Query(None),
+    delimiter: str = ",",
+    decimal: str = ".",
+) -> StreamingResponse:
+    """Same as GET /export/documents/{doc_id}/{export_format}, by company id."""
+    doc = await documents_collection.find_one({"company_id": company_id})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Documento não encontrado para esta empresa.")
+    return await _export_document(doc, export_format, periods, cnpjs, blocks, _csv_options(delimiter, decimal))
+
+async def _sheet_batches(doc: Dict, sheet: str, file_ids: Dict) -> AsyncIterator:
+    # A block code may also name a sheet of another layout (C170 / C170 (EFD_ICMS_IPI)).
+    async for batch in document_batches(doc, GROUP_BY_SHEET, [sheet], file_ids):
+        if batch.sheet == sheet:
+            yield batch
+
+#
+# GET /export/documents/{doc_id}/arrow/{sheet} : Stream one sheet as Arrow IPC
+#
+@export_router.get("/export/documents/{doc_id}/arrow/{sheet}")
+async def export_arrow(
+    doc_id: str,
+    sheet: str,
+    periods: Optional[List[str]] = Query(None),
+    cnpjs: Optional[List[str]] = Query(None),
+) -> StreamingResponse:
+    """
+    Streams one sheet of a stored document as an Arrow IPC stream with typed
+    columns (e.g. pyarrow.ipc.open_stream, or pandas/DuckDB on top of it),
+    read chunk by chunk. `periods` and `cnpjs` narrow it down as in the exports.
+    """
+    _require_pyarrow()
+    doc = await _find_document(doc_id)
+    catalog = {entry["name"]: entry for entry in (await document_catalog(doc))["sheets"]}
+    if sheet not in catalog:
+        raise HTTPException(status_code=404, detail="Sheet not found")
+    headers = catalog[sheet]["headers"]
+    batches = _sheet_batches(doc, sheet, _file_id_filters(periods, cnpjs))
+    return StreamingResponse(
+        arrow_stream(batches, headers, [field_type(header) for header in headers]),
+        media_type=ARROW_STREAM_MEDIA_TYPE,
+    )
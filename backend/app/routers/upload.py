@@ -1,20 +1,42 @@
 # upload.py
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from typing import List, Dict
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Optional
 import os
-import shutil
+import re
 from bson import ObjectId
+from starlette.concurrency import run_in_threadpool
 
-from mongodb import documents_collection  # You must define this in mongodb.py
-from services.file_processing import process_txt  # Your custom text -> JSON function
+from mongodb import documents_collection, ingest_jobs_collection, job_helper
+from services.ingest_jobs import create_job, enqueue_job
+from services.file_store import load_index, object_path, save_upload, store_index
+from services.file_processing import PARSER_VERSION, build_index
+from services.record_index import read_records
+from services.block_store import carry_parent_links, sheet_names, tables_from_sheets, tables_to_sheets
+from services.document_store import (
+    delete_sheet_tables, document_catalog, load_document_tables, read_point,
+)
+from services.parsing_logic import chain_codes, flatten_tables
+from services.viewport import read_viewport
+from services.sheet_edits import EditConflict, list_edits, record_edits, save_tables
+from services.streaming import SHEET_STREAMS, document_sheets, encode, negotiate
 
 router = APIRouter()
-UPLOAD_DIR = "saved_files"
 MAX_FILE_SIZE = 200 * 1024 * 1024  # 200MB limit
 
+# Sheet formats returned by GET /documents/{doc_id}.
+SHEET_FORMATS = [*SHEET_STREAMS, "stubs"]
+
+
+def _media_type(request: Request) -> str:
+    try:
+        return negotiate(request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+
 #
-# POST /upload/ : Upload and process new .txt files
+# POST /upload/ : Save new .txt files and queue them for ingest
 #
 #
 @router.post("/upload/")
@@ -23,10 +45,7 @@ async def upload_files(
     company_id: str = Form(...)
 ):
     result = {"data": [], "errors": []}
-    file_paths = []
-
-    company_folder = os.path.join(UPLOAD_DIR, company_id)
-    os.makedirs(company_folder, exist_ok=True)
+    saved_files = []
 
     for file in files:
         file.file.seek(0, 2)
@@ -35,43 +54,263 @@ async def upload_files(
         if size > MAX_FILE_SIZE:
             result["errors"].append({"filename": file.filename, "error": "File exceeds 200MB limit"})
             continue
-        file_path = os.path.join(company_folder, file.filename)
-        with open(file_path, "wb") as output_file:
-            shutil.copyfileobj(file.file, output_file)
-        file_paths.append(file_path)
+        # Stored once under its content hash; the company folder only references it.
+        saved = await run_in_threadpool(save_upload, file.file, file.filename, company_id)
+        saved_files.append(saved)
 
-    try:
-        merged_sheets = process_txt(file_paths)
-        # Check if a merged document exists for this company
-        existing_doc = await documents_collection.find_one({"company_id": company_id})
-        if existing_doc:
-            new_sheets = existing_doc.get("sheets", []) + merged_sheets
-            await documents_collection.update_one(
-                {"_id": existing_doc["_id"]}, {"$set": {"sheets": new_sheets}}
-            )
-            doc_id = str(existing_doc["_id"])
-            final_sheets = new_sheets
-        else:
-            doc = {"company_id": company_id, "sheets": merged_sheets}
-            insert_result = await documents_collection.insert_one(doc)
-            doc_id = str(insert_result.inserted_id)
-            final_sheets = merged_sheets
-
-        result["data"].append({
-            "company_id": company_id,
-            "sheets": final_sheets,
-            "mongo_inserted_id": doc_id
-        })
-    except Exception as e:
-        result["errors"].append({"error": str(e)})
+    if not saved_files:
+        return result
+
+    # Parsing and storing happen in the background ingest worker; poll
+    # GET /upload/jobs/{job_id} for progress, the resulting doc id and a summary
+    # of what was added. The data itself is fetched from GET /documents/{doc_id}.
+    job_id = await create_job(company_id, saved_files, result["errors"])
+    enqueue_job(job_id)
 
+    result["data"].append({
+        "company_id": company_id,
+        "job_id": job_id,
+        "status": "queued",
+        "files": [
+            {"filename": saved["filename"], "hash": saved["hash"], "size": saved["size"]}
+            for saved in saved_files
+        ],
+    })
     return result
 
+#
+# GET /upload/jobs/{job_id} : Progress of an ingest job
+#
+@router.get("/upload/jobs/{job_id}")
+async def get_ingest_job(job_id: str):
+    try:
+        obj_id = ObjectId(job_id)
+    except:
+        raise HTTPException(status_code=400, detail="Invalid job id format")
+
+    job = await ingest_jobs_collection.find_one({"_id": obj_id})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_helper(job)
+
+#
+# GET /files/{file_hash}/records/{record_code} : Read single records of a raw file
+#
+@router.get("/files/{file_hash}/records/{record_code}")
+async def get_file_records(
+    file_hash: str,
+    record_code: str,
+    start: int = 0,
+    limit: int = 100,
+    parent_index: Optional[int] = None,
+):
+    """
+    Decodes only the requested records of a stored raw file through its RecordIndex.
+
+    With `parent_index`, only the `record_code` children of that occurrence of the
+    parent record are returned (e.g. the C170 items of the 10th C100).
+    """
+    if not re.fullmatch(r"[0-9a-f]{64}", file_hash):
+        raise HTTPException(status_code=400, detail="Invalid file hash format")
+    file_path = object_path(file_hash)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    index = load_index(file_hash, PARSER_VERSION)
+    if index is None:
+        index = await run_in_threadpool(build_index, file_path)
+        store_index(file_hash, PARSER_VERSION, index)
+
+    schema = index.layout.schema(record_code)
+    if parent_index is not None:
+        if not schema.parent:
+            raise HTTPException(status_code=400, detail=f"{record_code} has no parent record")
+        ordinals = index.children(record_code, parent_index)
+    else:
+        ordinals = range(index.count(record_code))
+    total = len(ordinals)
+    ordinals = ordinals[max(start, 0):max(start, 0) + max(limit, 0)]
+
+    records = await run_in_threadpool(read_records, file_path, index, record_code, ordinals)
+    return {
+        "record_code": record_code,
+        "layout": index.layout_name,
+        "parent_code": schema.parent,
+        "headers": schema.fields,
+        "total": total,
+        "start": ordinals.start if ordinals else start,
+        "records": records,
+    }
+
 #
 # GET /documents/{doc_id} : Retrieve a single doc from the DB
 #
 @router.get("/documents/{doc_id}")
-async def get_document(doc_id: str):
+async def get_document(doc_id: str, request: Request, format: str = "celldata", version: Optional[int] = None):
+    """
+    Returns every sheet of the document.
+
+    `format=celldata` (default) gives the sheets as FortuneSheet celldata for the
+    grid; `format=rows` gives each sheet as {"name", "headers", "types", "rows"},
+    with rows as plain arrays. `format=stubs` returns only the sheets'
+    catalog entries (headers, row counts, files), to be loaded lazily through
+    GET /documents/{doc_id}/sheets/{sheet_name}/rows. `version` reads the
+    document as it was after that edit.
+
+    The response is streamed sheet by sheet and chunk by chunk, as JSON or, with
+    `Accept: application/x-msgpack`, as MessagePack.
+    """
+    if format not in SHEET_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format, use one of: {', '.join(SHEET_FORMATS)}")
+    media_type = _media_type(request)
+    try:
+        obj_id = ObjectId(doc_id)
+    except:
+        raise HTTPException(status_code=400, detail="Invalid doc id format")
+
+    doc = await documents_collection.find_one({"_id": obj_id})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    if format == "stubs":
+        catalog = await document_catalog(doc)
+        body = {
+            "id": str(doc["_id"]),
+            "company_id": doc["company_id"],
+            "format": format,
+            **catalog,
+            "sheets": [{**sheet, "loaded": False} for sheet in catalog["sheets"]],
+        }
+        return StreamingResponse(encode(body, media_type), media_type=media_type)
+
+    try:
+        _, version = read_point(doc, version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    body = {
+        "id": str(doc["_id"]),
+        "company_id": doc["company_id"],
+        "version": version,
+        "format": format,
+        "sheets": await document_sheets(doc, format, version),
+    }
+    return StreamingResponse(encode(body, media_type), media_type=media_type)
+
+#
+# GET /documents/{doc_id}/sheets/{sheet_name}/rows : A window of rows and columns of one sheet
+#
+@router.get("/documents/{doc_id}/sheets/{sheet_name}/rows")
+async def get_sheet_rows(
+    doc_id: str,
+    sheet_name: str,
+    row_start: int = 0,
+    row_count: int = 100,
+    col_start: int = 0,
+    col_count: Optional[int] = None,
+    sort: Optional[str] = None,
+    descending: bool = False,
+    version: Optional[int] = None,
+):
+    """
+    Returns rows [row_start, row_start + row_count) and the requested columns of
+    one sheet, optionally sorted by a column, with the sheet's total row and
+    column counts so the grid can virtualize scrolling. `version` reads the
+    sheet as it was after that edit.
+    """
+    if row_count > 5000:
+        raise HTTPException(status_code=400, detail="row_count must be at most 5000")
+    try:
+        obj_id = ObjectId(doc_id)
+    except:
+        raise HTTPException(status_code=400, detail="Invalid doc id format")
+
+    doc = await documents_collection.find_one({"_id": obj_id})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    try:
+        viewport = await read_viewport(
+            doc, sheet_name, row_start, row_count, col_start, col_count, sort, descending, version
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if viewport is None:
+        raise HTTPException(status_code=404, detail="Sheet not found")
+    return viewport
+
+#
+# PATCH /documents/{doc_id}/sheets : Apply a batch of cell/row edits
+#
+@router.patch("/documents/{doc_id}/sheets")
+async def patch_document_sheets(doc_id: str, data: Dict):
+    """
+    Expects JSON like:
+    {
+      "base_version": 3,  // optional, the "version" the edits were made on
+      "edits": [
+        {"op": "set", "sheet": "C170", "row_id": "0:12", "column": "VL_ITEM", "value": "10,00"},
+        {"op": "delete", "sheet": "C170", "row_id": "0:13"}
+      ]
+    }
+
+    The edits are appended to the document's edit journal. Returns an
+    acknowledgement with the document's new version, not the document.
+    """
+    try:
+        obj_id = ObjectId(doc_id)
+    except:
+        raise HTTPException(status_code=400, detail="Invalid doc id format")
+
+    edits = data.get("edits")
+    if not isinstance(edits, list):
+        raise HTTPException(status_code=400, detail="Missing edits")
+
+    doc = await documents_collection.find_one({"_id": obj_id})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    try:
+        result = await record_edits(doc, edits, data.get("base_version"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except EditConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"ack": True, "id": doc_id, **result}
+
+#
+# GET /documents/{doc_id}/edits : The edit journal (what changed since the upload)
+#
+@router.get("/documents/{doc_id}/edits")
+async def get_document_edits(doc_id: str, since: int = 0, until: Optional[int] = None):
+    """
+    Returns the edits of versions (since, until], oldest first, each with the
+    values it replaced.
+    """
+    try:
+        obj_id = ObjectId(doc_id)
+    except:
+        raise HTTPException(status_code=400, detail="Invalid doc id format")
+
+    doc = await documents_collection.find_one({"_id": obj_id})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    return {
+        "id": doc_id,
+        "version": doc.get("version", 0),
+        "base_version": doc.get("base_version", 0),
+        "entries": await list_edits(doc, since, until),
+    }
+
+#
+# GET /documents/{doc_id}/flatten/{record_code} : A child record joined with its parent records
+#
+@router.get("/documents/{doc_id}/flatten/{record_code}")
+async def get_flattened_record(doc_id: str, record_code: str):
+    """
+    Returns one sheet per file with a row per `record_code` record and the
+    columns of its parent records (e.g. C170 with its C100 and C010).
+    """
     try:
         obj_id = ObjectId(doc_id)
     except:
@@ -81,10 +320,16 @@ async def get_document(doc_id: str):
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
 
+    # Only the blocks of the record's chain are read.
+    tables = await load_document_tables(doc, blocks=chain_codes(record_code))
+    flattened = await run_in_threadpool(flatten_tables, tables, record_code)
+    if not flattened:
+        raise HTTPException(status_code=404, detail=f"No {record_code} records with parent records found")
+
     return {
         "id": str(doc["_id"]),
         "company_id": doc["company_id"],
-        "sheets": doc["sheets"],
+        "sheets": tables_to_sheets(flattened),
     }
 
 @router.delete("/documents/{company_id}/sheet/{sheet_index}")
@@ -92,20 +337,19 @@ async def delete_sheet(company_id: str, sheet_index: int):
     existing_doc = await documents_collection.find_one({"company_id": company_id})
     if not existing_doc:
         raise HTTPException(status_code=404, detail="Documento não encontrado para esta empresa.")
-    sheets = existing_doc.get("sheets", [])
-    if sheet_index < 0 or sheet_index >= len(sheets):
+    tables = await load_document_tables(existing_doc)
+    names = sheet_names(tables)
+    if sheet_index < 0 or sheet_index >= len(names):
         raise HTTPException(status_code=400, detail="Índice da planilha inválido.")
-    updated_sheets = sheets[:sheet_index] + sheets[sheet_index + 1:]
-    await documents_collection.update_one(
-        {"_id": existing_doc["_id"]}, {"$set": {"sheets": updated_sheets}}
-    )
-    return {"message": "Planilha excluída com sucesso", "sheets": updated_sheets}
+    await delete_sheet_tables(existing_doc, names[sheet_index])
+    updated_tables = [table for table in tables if table.sheet_name != names[sheet_index]]
+    return {"message": "Planilha excluída com sucesso", "sheets": tables_to_sheets(updated_tables)}
 
 #
 # PUT /documents/{doc_id} : Update the "sheets" after user edits
 #
 @router.put("/documents/{doc_id}")
-async def update_document(doc_id: str, data: Dict):
+async def update_document(doc_id: str, data: Dict, request: Request):
     """
     Expects JSON with something like:
     {
@@ -121,18 +365,21 @@ async def update_document(doc_id: str, data: Dict):
     sheets = data.get("sheets")
     if not sheets:
         raise HTTPException(status_code=400, detail="Missing sheets data")
+    media_type = _media_type(request)
 
-    update_result = await documents_collection.update_one(
-        {"_id": obj_id}, {"$set": {"sheets": sheets}}
-    )
-
-    if update_result.matched_count == 0:
+    existing_doc = await documents_collection.find_one({"_id": obj_id})
+    if not existing_doc:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    # Return the updated doc
+    tables = tables_from_sheets(sheets)
+    carry_parent_links(await load_document_tables(existing_doc), tables)
+    await save_tables(existing_doc, tables)
+
+    # Return the updated doc, streamed like GET /documents/{doc_id}?format=celldata
     doc = await documents_collection.find_one({"_id": obj_id})
-    return {
+    body = {
         "id": str(doc["_id"]),
         "company_id": doc["company_id"],
-        "sheets": doc["sheets"],
+        "sheets": await document_sheets(doc, "celldata"),
     }
+    return StreamingResponse(encode(body, media_type), media_type=media_type)
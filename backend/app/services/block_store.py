@@ -0,0 +1,324 @@
+# block_store.py
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from services.layouts import EFD_CONTRIBUICOES, field_type, generic_field_name
+from services.typed_columns import CODE, TypedColumn, decode_column
+
+ID_HEADERS = ["ID_DT_INI", "ID_DT_FIN", "ID_CNPJ"]
+CELL_TYPE = {"fa": "General", "t": "g"}
+
+
+class BlockTable:
+    """
+    Column-oriented storage for every record of one block type read from one file.
+
+    Each header from BlockHeaders gets its own contiguous list of values, and the
+    file-level identifiers (ID_DT_INI, ID_DT_FIN, ID_CNPJ) are kept once in
+    ``file_ids`` instead of being repeated on every row. ``layout`` and ``version``
+    tell which SPED layout (see services.layouts) the records were read with.
+
+    ``types`` gives the field type of each column. Decimal, integer and date
+    columns also get a native-typed copy (see services.typed_columns), built in
+    bulk by ``decode()``; the strings stay the source of truth for exports.
+
+    Child records (e.g. C170) keep in ``parent_rows`` the row of their ``parent``
+    table (C100) read from the same file that each row belongs to, or -1.
+    """
+
+    __slots__ = ("name", "headers", "file_ids", "columns", "num_rows", "layout", "version",
+                 "types", "typed", "parent", "parent_rows")
+
+    def __init__(self, name: str, headers: List[str], file_ids: Dict[str, str],
+                 columns: Optional[List[List[str]]] = None, num_rows: Optional[int] = None,
+                 layout: str = EFD_CONTRIBUICOES, version: str = "",
+                 types: Optional[List[str]] = None, parent: Optional[str] = None,
+                 parent_rows: Optional[List[int]] = None):
+        self.name = name
+        self.headers = list(headers)
+        self.file_ids = file_ids
+        self.layout = layout or EFD_CONTRIBUICOES
+        self.version = version
+        if types is None or len(types) != len(self.headers):
+            types = [field_type(header) for header in self.headers]
+        self.types = list(types)
+        self.typed: Dict[int, Optional[TypedColumn]] = {}
+        self.columns = columns if columns is not None else [[] for _ in self.headers]
+        if num_rows is None:
+            num_rows = len(self.columns[0]) if self.columns else 0
+        self.num_rows = num_rows
+        self.parent = parent
+        if parent_rows is None and parent and not num_rows:
+            parent_rows = []
+        self.parent_rows = array("l", parent_rows) if parent_rows is not None else None
+
+    @property
+    def id_values(self) -> List[str]:
+        return [self.file_ids.get(key, "") for key in ID_HEADERS]
+
+    @property
+    def full_headers(self) -> List[str]:
+        return ID_HEADERS + self.headers
+
+    @property
+    def sheet_name(self) -> str:
+        """Name of the sheet the table is shown in; non-default layouts get their own sheets."""
+        return self.name if self.layout == EFD_CONTRIBUICOES else f"{self.name} ({self.layout})"
+
+    def widen(self, width: int) -> None:
+        """Adds generic columns (CAMPO_nn) so records up to `width` fields fit."""
+        for position in range(len(self.headers), width):
+            self.headers.append(generic_field_name(position))
+            self.types.append(CODE)
+            self.columns.append([""] * self.num_rows)
+
+    def append(self, fields: List[str]) -> None:
+        """Appends one record, truncated/padded to the table's headers."""
+        for col_idx, column in enumerate(self.columns):
+            column.append(fields[col_idx].strip() if col_idx < len(fields) else "")
+        self.num_rows += 1
+        if self.typed:
+            self.typed.clear()
+
+    def decode(self) -> None:
+        """Builds the typed copy of every decimal, integer and date column."""
+        for col_idx, kind in enumerate(self.types):
+            if kind != CODE:
+                self.typed_column(col_idx)
+
+    def typed_column(self, col_idx: int) -> Optional[TypedColumn]:
+        """Native-typed values of a column, or None for code/unreadable columns."""
+        if col_idx not in self.typed:
+            self.typed[col_idx] = decode_column(self.types[col_idx], self.columns[col_idx])
+        return self.typed[col_idx]
+
+    def row(self, row_idx: int) -> List[str]:
+        return [column[row_idx] for column in self.columns]
+
+    def iter_rows(self, start: int = 0, stop: Optional[int] = None) -> Iterator[List[str]]:
+        """Yields rows (without the ID columns) in the range [start, stop)."""
+        stop = self.num_rows if stop is None else min(stop, self.num_rows)
+        if not self.columns:
+            for _ in range(start, stop):
+                yield []
+            return
+        yield from (list(values) for values in zip(*(column[start:stop] for column in self.columns)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Storage representation of the table."""
+        return {
+            "name": self.name,
+            "file_ids": self.file_ids,
+            "headers": self.headers,
+            "columns": self.columns,
+            "num_rows": self.num_rows,
+            "layout": self.layout,
+            "version": self.version,
+            "types": self.types,
+            "parent": self.parent,
+            "parent_rows": self.parent_rows.tolist() if self.parent_rows is not None else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BlockTable":
+        return cls(
+            data["name"],
+            data.get("headers", []),
+            data.get("file_ids", {}),
+            columns=data.get("columns", []),
+            num_rows=data.get("num_rows"),
+            layout=data.get("layout", EFD_CONTRIBUICOES),
+            version=data.get("version", ""),
+            types=data.get("types"),
+            parent=data.get("parent"),
+            parent_rows=data.get("parent_rows"),
+        )
+
+
+def group_tables(tables: List[BlockTable]) -> Dict[str, List[BlockTable]]:
+    """Groups tables by sheet name, keeping the order in which blocks first appear."""
+    grouped: Dict[str, List[BlockTable]] = {}
+    for table in tables:
+        grouped.setdefault(table.sheet_name, []).append(table)
+    return grouped
+
+
+def sheet_names(tables: List[BlockTable]) -> List[str]:
+    return list(group_tables(tables).keys())
+
+
+# === 🔹 FortuneSheet Adapter (API edge only) === #
+def _cell(r: int, c: int, value: str, bold: bool = False) -> Dict:
+    cell = {"r": r, "c": c, "v": {"v": value, "m": value, "ct": dict(CELL_TYPE)}}
+    if bold:
+        cell["v"]["bl"] = 1
+    return cell
+
+
+def header_celldata(headers: List[str]) -> List[Dict]:
+    """The bold header row (row 0) of a sheet."""
+    return [_cell(0, col_idx, header, bold=True) for col_idx, header in enumerate(headers)]
+
+
+def rows_to_celldata(rows: List[List[str]], row_idx: int, total_columns: int) -> List[Dict]:
+    """Cells of consecutive rows starting at grid row `row_idx`, padded to `total_columns`."""
+    celldata = []
+    for full_row in rows:
+        if len(full_row) < total_columns:
+            full_row = full_row + [""] * (total_columns - len(full_row))
+        for col_idx, value in enumerate(full_row):
+            celldata.append(_cell(row_idx, col_idx, value))
+        row_idx += 1
+    return celldata
+
+
+def tables_to_celldata(tables: List[BlockTable], row_start: int = 0,
+                       row_stop: Optional[int] = None) -> List[Dict]:
+    """
+    Builds FortuneSheet celldata for the tables of one block, merged in order.
+
+    Only data rows in [row_start, row_stop) (0-based, header excluded) are
+    expanded; the header row is always included as row 0.
+    """
+    if not tables:
+        return []
+    # Tables of older layout versions or widened by longer records may differ in width.
+    headers = max((table.full_headers for table in tables), key=len)
+    celldata = header_celldata(headers)
+    total_columns = len(headers)
+
+    offset = 0
+    for table in tables:
+        lo = max(row_start - offset, 0)
+        hi = table.num_rows if row_stop is None else min(row_stop - offset, table.num_rows)
+        if lo < hi:
+            id_values = table.id_values
+            rows = [id_values + values for values in table.iter_rows(lo, hi)]
+            celldata.extend(rows_to_celldata(rows, offset + lo + 1, total_columns))
+        offset += table.num_rows
+        if row_stop is not None and offset >= row_stop:
+            break
+    return celldata
+
+
+def tables_to_sheets(tables: List[BlockTable]) -> List[Dict]:
+    """Converts tables to FortuneSheet sheets, one sheet per block name."""
+    return [
+        {"name": name, "celldata": tables_to_celldata(block_tables)}
+        for name, block_tables in group_tables(tables).items()
+    ]
+
+
+def tables_to_rows(tables: List[BlockTable]) -> List[Dict]:
+    """
+    Compact sheets: the headers once and every row as a plain array of strings
+    (ID columns first), one sheet per block name.
+    """
+    sheets = []
+    for name, block_tables in group_tables(tables).items():
+        widest = max(block_tables, key=lambda table: len(table.headers))
+        headers = widest.full_headers
+        rows = []
+        for table in block_tables:
+            id_values = table.id_values
+            padding = [""] * (len(headers) - len(ID_HEADERS) - len(table.headers))
+            rows.extend(id_values + values + padding for values in table.iter_rows())
+        sheets.append({
+            "name": name,
+            "headers": headers,
+            "types": [CODE] * len(ID_HEADERS) + widest.types,
+            "rows": rows,
+        })
+    return sheets
+
+
+def _cell_value(cell: Dict) -> str:
+    value = cell.get("v")
+    if isinstance(value, dict):
+        value = value.get("v", value.get("m", ""))
+    return "" if value is None else str(value)
+
+
+def _split_sheet_name(sheet_name: str):
+    """Inverse of BlockTable.sheet_name: returns (block name, layout)."""
+    if sheet_name.endswith(")") and " (" in sheet_name:
+        name, layout = sheet_name[:-1].rsplit(" (", 1)
+        return name, layout
+    return sheet_name, EFD_CONTRIBUICOES
+
+
+def sheet_row_runs(sheet: Dict) -> Iterator[Tuple[str, str, List[str], Dict[str, str], List[List[str]]]]:
+    """
+    Rows of one FortuneSheet sheet (as sent back by the client), as runs of
+    consecutive rows sharing the same ID columns: (block name, layout, headers,
+    file IDs, rows). Sheets without the ID columns are a single run with empty
+    identifiers.
+    """
+    rows: Dict[int, Dict[int, str]] = {}
+    for cell in sheet.get("celldata") or []:
+        rows.setdefault(cell.get("r", 0), {})[cell.get("c", 0)] = _cell_value(cell)
+    if not rows:
+        return
+
+    header_cells = rows.pop(0, {})
+    width = max([c for row in rows.values() for c in row] + list(header_cells) + [-1]) + 1
+    headers = [header_cells.get(c, "") for c in range(width)]
+    has_ids = headers[:len(ID_HEADERS)] == ID_HEADERS
+    id_width = len(ID_HEADERS) if has_ids else 0
+    headers = headers[id_width:]
+
+    name, layout = _split_sheet_name(sheet.get("name", "Sheet"))
+    file_ids, run = None, []
+    for r in sorted(rows):
+        cells = rows[r]
+        full_row = [cells.get(c, "") for c in range(width)]
+        row_ids = dict(zip(ID_HEADERS, full_row[:id_width])) if has_ids else {}
+        if row_ids != file_ids:
+            if run:
+                yield name, layout, headers, file_ids, run
+            file_ids, run = row_ids, []
+        run.append(full_row[id_width:])
+    if run:
+        yield name, layout, headers, file_ids, run
+
+
+def tables_from_sheets(sheets: List[Dict]) -> List[BlockTable]:
+    """
+    Converts FortuneSheet sheets (as sent back by the client) into tables.
+
+    Consecutive rows sharing the same ID columns become one table, so each file
+    keeps its own identifiers (see sheet_row_runs).
+    """
+    tables = []
+    for sheet in sheets:
+        for name, layout, headers, file_ids, rows in sheet_row_runs(sheet):
+            table = BlockTable(name, headers, file_ids, layout=layout)
+            for row in rows:
+                table.append(row)
+            tables.append(table)
+    return tables
+
+
+def carry_parent_links(old_tables: List[BlockTable], new_tables: List[BlockTable]) -> None:
+    """
+    Copies the parent links of stored tables onto tables rebuilt from sheets.
+
+    Sheets do not carry the record hierarchy, so after an edit each table gets
+    the links of the stored table with the same sheet, IDs and row count.
+    """
+    stored: Dict[tuple, List[BlockTable]] = {}
+    for table in old_tables:
+        if table.parent_rows is not None:
+            stored.setdefault((table.sheet_name, tuple(table.id_values)), []).append(table)
+    for table in new_tables:
+        candidates = stored.get((table.sheet_name, tuple(table.id_values)))
+        if candidates and candidates[0].num_rows == table.num_rows:
+            old = candidates.pop(0)
+            table.parent, table.parent_rows = old.parent, old.parent_rows
+
+
+def load_tables(doc: Dict) -> List[BlockTable]:
+    """Reads the stored tables of a document, converting legacy celldata sheets."""
+    if "tables" in doc:
+        return [BlockTable.from_dict(table) for table in doc["tables"]]
+    return tables_from_sheets(doc.get("sheets", []))
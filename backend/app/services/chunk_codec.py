@@ -0,0 +1,67 @@
+# chunk_codec.py
+import json
+import os
+import sys
+from array import array
+from typing import List, Optional
+
+try:
+    import zstandard
+except ImportError:  # compression is optional
+    zstandard = None
+
+# Codec of newly written chunks: "zstd" (if zstandard is installed) or "json".
+SHEET_COMPRESSION = os.getenv("SHEET_COMPRESSION", "zstd")
+ZSTD_LEVEL = 3
+
+JSON_CODEC = "json"
+ZSTD_CODEC = "json+zstd"
+
+
+def default_codec() -> str:
+    if SHEET_COMPRESSION == "zstd" and zstandard is not None:
+        return ZSTD_CODEC
+    return JSON_CODEC
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == ZSTD_CODEC:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return data
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == ZSTD_CODEC:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read compressed sheet chunks")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+# === 🔹 Column Blobs === #
+def encode_column(values: List[str], codec: str) -> bytes:
+    """Encodes one column of a chunk as a JSON array, compressed with the codec."""
+    data = json.dumps(values, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return _compress(data, codec)
+
+
+def decode_column(blob: bytes, codec: str) -> List[str]:
+    return json.loads(_decompress(bytes(blob), codec))
+
+
+def encode_ints(values: array, codec: str) -> bytes:
+    """Encodes an array of row numbers (e.g. parent rows) as little-endian int64."""
+    data = array("q", values)
+    if sys.byteorder != "little":
+        data.byteswap()
+    return _compress(data.tobytes(), codec)
+
+
+def decode_ints(blob: Optional[bytes], codec: str) -> Optional[List[int]]:
+    if blob is None:
+        return None
+    data = array("q")
+    data.frombytes(_decompress(bytes(blob), codec))
+    if sys.byteorder != "little":
+        data.byteswap()
+    return data.tolist()
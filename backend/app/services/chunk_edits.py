@@ -0,0 +1,161 @@
+# chunk_edits.py
+from typing import Dict, Iterable, List, Tuple
+
+from services.chunk_codec import decode_column, decode_ints
+
+# Supported edit operations.
+SET_CELL = "set"
+UPDATE_ROW = "update_row"
+INSERT_ROW = "insert"
+DELETE_ROW = "delete"
+EDIT_OPS = (SET_CELL, UPDATE_ROW, INSERT_ROW, DELETE_ROW)
+
+
+def row_id(chunk: Dict, offset: int) -> str:
+    """Stable id of a stored row: its file and its row number in that file's table."""
+    if chunk.get("row_ids") is not None:
+        return chunk["row_ids"][offset]
+    return f"{chunk['file_seq']}:{chunk['row_start'] + offset}"
+
+
+def chunk_key(chunk: Dict) -> Tuple:
+    """Identifies a chunk across compactions: its partition generation and position."""
+    return (chunk.get("generation"), chunk["file_seq"], chunk["block_seq"], chunk["chunk"])
+
+
+def edit_key(edit: Dict) -> Tuple:
+    return (edit.get("generation"), *edit["key"])
+
+
+def shift_links(parent_rows: List[int], index: int, delta: int) -> List[int]:
+    """Parent links after inserting (+1) or deleting (-1) parent row `index`."""
+    if delta > 0:
+        return [row + 1 if row >= index else row for row in parent_rows]
+    return [-1 if row == index else row - 1 if row > index else row for row in parent_rows]
+
+
+# === 🔹 Editable Chunks === #
+class ChunkState:
+    """Decoded, editable copy of one chunk."""
+
+    def __init__(self, chunk: Dict):
+        self.chunk = chunk
+        codec = chunk.get("codec")
+        if codec is None:
+            self.columns = [list(column) for column in chunk.get("columns", [])]
+            parent_rows = chunk.get("parent_rows")
+        else:
+            self.columns = [decode_column(blob, codec) for blob in chunk.get("columns", [])]
+            parent_rows = decode_ints(chunk.get("parent_rows"), codec)
+        self.parent_rows = list(parent_rows) if parent_rows is not None else None
+        self.row_ids = [row_id(chunk, offset) for offset in range(chunk["row_count"])]
+
+    def offset(self, row: str) -> int:
+        try:
+            return self.row_ids.index(row)
+        except ValueError:
+            raise ValueError(f"Row {row} was already deleted")
+
+    def set(self, row: str, values: Dict[int, str]) -> None:
+        offset = self.offset(row)
+        for index, value in values.items():
+            self.columns[index][offset] = value
+
+    def insert(self, position: int, new_id: str, values: Dict[int, str]) -> None:
+        for index, column in enumerate(self.columns):
+            column.insert(position, values.get(index, ""))
+        if self.parent_rows is not None:
+            # A new child row belongs to the same parent as the row before it.
+            self.parent_rows.insert(position, self.parent_rows[position - 1] if position else -1)
+        self.row_ids.insert(position, new_id)
+
+    def delete(self, row: str) -> None:
+        offset = self.offset(row)
+        for column in self.columns:
+            del column[offset]
+        if self.parent_rows is not None:
+            del self.parent_rows[offset]
+        del self.row_ids[offset]
+
+    def apply(self, edit: Dict) -> None:
+        """Applies one resolved edit (as stored in the edit journal)."""
+        op = edit["op"]
+        values = {int(index): value for index, value in (edit.get("values") or {}).items()}
+        if op == INSERT_ROW:
+            after = edit.get("after_row_id")
+            self.insert(self.offset(after) + 1 if after else 0, edit["new_row_id"], values)
+        elif op == DELETE_ROW:
+            self.delete(edit["row_id"])
+        else:
+            self.set(edit["row_id"], values)
+
+    def to_chunk(self) -> Dict:
+        """The edited chunk, with its columns as plain (not encoded) lists."""
+        return {
+            **self.chunk,
+            "codec": None,
+            "columns": self.columns,
+            "parent_rows": self.parent_rows,
+            "row_ids": self.row_ids,
+            "row_count": len(self.row_ids),
+        }
+
+
+def apply_entries(chunks: List[Dict], entries: Iterable[Dict], links: bool = True) -> List[Dict]:
+    """
+    Replays edit journal entries on top of chunks read from the base snapshot.
+
+    Only chunks the edits touch are decoded; the others are returned as they
+    are. Edits made on a generation that is no longer active (the period was
+    uploaded again since) and edits of rows that are gone are skipped.
+
+    Args:
+        chunks (List[Dict]): Full chunks (with their columns).
+        entries (Iterable[Dict]): Journal entries, oldest first.
+        links (bool): Also shift the parent links of child records when parent
+            rows are inserted or deleted (requires their chunk 0 for the schema).
+
+    Returns:
+        List[Dict]: The chunks, edited ones replaced by their edited copies.
+    """
+    by_key = {chunk_key(chunk): position for position, chunk in enumerate(chunks)}
+    parents = {
+        (chunk.get("generation"), chunk["file_seq"], chunk["block_seq"]): chunk["schema"].get("parent")
+        for chunk in chunks if chunk.get("schema")
+    }
+    states: Dict[int, ChunkState] = {}
+
+    def state_at(position: int) -> ChunkState:
+        if position not in states:
+            states[position] = ChunkState(chunks[position])
+        return states[position]
+
+    for entry in entries:
+        for edit in entry["edits"]:
+            position = by_key.get(edit_key(edit))
+            if position is not None:
+                try:
+                    state_at(position).apply(edit)
+                except ValueError:
+                    continue
+            shift = edit.get("shift")
+            if not (links and shift):
+                continue
+            generation, file_seq = edit.get("generation"), edit["key"][0]
+            for position, chunk in enumerate(chunks):
+                parent = parents.get((chunk.get("generation"), chunk["file_seq"], chunk["block_seq"]))
+                if (chunk.get("generation"), chunk["file_seq"]) != (generation, file_seq) or parent != shift["block"]:
+                    continue
+                state = state_at(position)
+                if state.parent_rows is not None:
+                    state.parent_rows = shift_links(state.parent_rows, shift["index"], shift["delta"])
+
+    edited = list(chunks)
+    for position, state in states.items():
+        edited[position] = state.to_chunk()
+    return edited
+
+
+def touched_keys(entries: Iterable[Dict]) -> set:
+    """Keys of the chunks the entries edit directly."""
+    return {edit_key(edit) for entry in entries for edit in entry["edits"]}
@@ -0,0 +1,182 @@
+# columnar_export.py
+from typing import AsyncIterator, List, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:  # Parquet/Arrow exports are optional
+    pyarrow = None
+    parquet = None
+
+from services.block_store import ID_HEADERS
+from services.export_utils import RowBatch
+from services.typed_columns import CODE, DATE, DECIMAL, INTEGER, decode_column
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_COMPRESSION = "zstd"
+
+# File IDs the Parquet export partitions by (Hive style: ID_CNPJ=.../ID_DT_INI=...).
+PARTITION_COLUMNS = ["ID_CNPJ", "ID_DT_INI"]
+
+
+def require_pyarrow() -> None:
+    if pyarrow is None:
+        raise ValueError("Parquet and Arrow exports need the pyarrow package")
+
+
+class _ArrowSink:
+    """Write-only target for Arrow writers; what they write is taken out as it comes."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def tell(self) -> int:
+        return self.position
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+# === 🔹 Typed Arrow Columns === #
+def _arrow_type(kind: str):
+    return {
+        DECIMAL: pyarrow.float64(),
+        INTEGER: pyarrow.int64(),
+        DATE: pyarrow.date32(),
+    }.get(kind, pyarrow.string())
+
+
+def arrow_schema(headers: List[str], types: List[str], id_headers: List[str] = ID_HEADERS):
+    """Schema of a block: the given ID columns as text, then each field with its type."""
+    fields = [pyarrow.field(header, pyarrow.string()) for header in id_headers]
+    fields += [pyarrow.field(header, _arrow_type(kind)) for header, kind in zip(headers, types)]
+    return pyarrow.schema(fields)
+
+
+def _typed_array(kind: str, values: List[str]):
+    """
+    One column as an Arrow array of its field type. Decimals become float64
+    (see TypedColumn.to_float); values that can't be read as their type are null.
+    """
+    arrow_type = _arrow_type(kind)
+    if kind == CODE:
+        return pyarrow.array(values, type=arrow_type)
+    typed = decode_column(kind, values)
+    if typed is None:
+        return pyarrow.nulls(len(values), type=arrow_type)
+    numbers = typed.to_float() if kind == DECIMAL else typed.values
+    return pyarrow.array(numbers, type=arrow_type, mask=~typed.valid)
+
+
+def batch_to_arrow(batch: RowBatch, schema, id_headers: List[str] = ID_HEADERS):
+    """
+    A row batch as an Arrow record batch of `schema`: ID columns (those in
+    id_headers) first, then the batch's fields; fields the batch lacks are null.
+    """
+    count = len(batch.rows)
+    ids = dict(zip(ID_HEADERS, batch.id_values))
+    columns = list(zip(*batch.rows)) if count else []
+    by_header = {header: position for position, header in enumerate(batch.headers)}
+    arrays = [pyarrow.array([ids.get(header, "")] * count, type=pyarrow.string()) for header in id_headers]
+    for field in list(schema)[len(id_headers):]:
+        position = by_header.get(field.name)
+        if position is None or position >= len(columns):
+            arrays.append(pyarrow.nulls(count, type=field.type))
+            continue
+        kind = batch.types[position] if position < len(batch.types) else CODE
+        array = _typed_array(kind, list(columns[position]))
+        arrays.append(array if array.type == field.type else pyarrow.nulls(count, type=field.type))
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+# === 🔹 Parquet Dataset === #
+def _partition_path(batch: RowBatch) -> str:
+    ids = dict(zip(ID_HEADERS, batch.id_values))
+    partitions = "/".join(f"{name}={ids.get(name, '')}" for name in PARTITION_COLUMNS)
+    return f"{batch.sheet}/{partitions}"
+
+
+async def parquet_parts(batches: AsyncIterator[RowBatch]) -> AsyncIterator[Tuple[str, bytes]]:
+    """
+    Convert block data into a Parquet dataset: one folder per block (sheet),
+    partitioned Hive style by CNPJ and period start, with typed columns and
+    zstd compression. Partition values are kept in the folder names only;
+    read them as text (readers guess numbers otherwise and drop leading zeros).
+
+    Args:
+        batches: Row batches; the batches of one file must be consecutive.
+
+    Yields:
+        (file name, bytes) pieces for zip_stream; each batch is one row group.
+    """
+    require_pyarrow()
+    id_headers = [header for header in ID_HEADERS if header not in PARTITION_COLUMNS]
+    writer, current, used = None, None, {}
+    try:
+        async for batch in batches:
+            key = (batch.sheet, tuple(batch.id_values))
+            if key != current:
+                if writer is not None:
+                    await run_in_threadpool(writer.close)
+                    yield file_name, sink.take()
+                current = key
+                path = _partition_path(batch)
+                # The same block of the same IDs stored twice gets a second part.
+                used[path] = used.get(path, -1) + 1
+                file_name = f"{path}/part-{used[path]}.parquet"
+                schema = arrow_schema(batch.headers, batch.types, id_headers)
+                sink = _ArrowSink()
+                writer = parquet.ParquetWriter(sink, schema, compression=PARQUET_COMPRESSION)
+            record_batch = await run_in_threadpool(batch_to_arrow, batch, schema, id_headers)
+            await run_in_threadpool(writer.write_batch, record_batch)
+            yield file_name, sink.take()
+        if writer is not None:
+            await run_in_threadpool(writer.close)
+            yield file_name, sink.take()
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+# === 🔹 Arrow IPC Stream === #
+async def arrow_stream(batches: AsyncIterator[RowBatch], headers: List[str],
+                       types: List[str]) -> AsyncIterator[bytes]:
+    """
+    One sheet as an Arrow IPC stream: the schema (ID columns and the sheet's
+    typed fields), then one record batch per row batch.
+
+    Args:
+        batches: Row batches of one sheet.
+        headers (List[str]): Fields of the sheet (without the ID columns).
+        types (List[str]): Field type of each header.
+    """
+    require_pyarrow()
+    sink = _ArrowSink()
+    schema = arrow_schema(headers, types)
+    writer = pyarrow.ipc.new_stream(sink, schema)
+    try:
+        yield sink.take()
+        async for batch in batches:
+            record_batch = await run_in_threadpool(batch_to_arrow, batch, schema)
+            writer.write_batch(record_batch)
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
@@ -0,0 +1,644 @@
+# document_store.py
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from bson import ObjectId
+
+from mongodb import documents_collection, sheet_chunks_collection, sheet_edits_collection
+from services.block_store import ID_HEADERS, BlockTable, load_tables
+from services.chunk_codec import decode_column, decode_ints, default_codec, encode_column, encode_ints
+from services.chunk_edits import apply_entries, chunk_key, touched_keys
+from services.parsing_logic import group_files
+
+# Rows per stored chunk. A chunk of the widest blocks (C170) stays well below
+# MongoDB's 16 MB document limit.
+CHUNK_ROWS = 5000
+
+# Order in which chunks are read back: files in upload order, blocks in file order.
+CHUNK_SORT = [("file_seq", 1), ("block_seq", 1), ("chunk", 1)]
+
+
+# === 🔹 Writing Tables as Chunks === #
+def _table_chunks(doc_id: str, company_id: str, file_seq: int, block_seq: int,
+                  table: BlockTable, job_id: Optional[str] = None) -> Iterable[Dict]:
+    """
+    Splits one table into chunk records of at most CHUNK_ROWS rows.
+
+    Every chunk carries the table's partition keys (company, file IDs, block),
+    so a block of one period can be read without touching others. The schema
+    (headers, types, parent record) is only stored on the first chunk, and each
+    column is stored as its own blob (see services.chunk_codec), so columns can
+    be decoded independently. _write_partitions adds the partition and
+    generation the chunk belongs to.
+    """
+    codec = default_codec()
+    base = {
+        "doc_id": doc_id,
+        "company_id": company_id,
+        "file_seq": file_seq,
+        "block_seq": block_seq,
+        "block": table.name,
+        "sheet": table.sheet_name,
+        "layout": table.layout,
+        "file_ids": table.file_ids,
+        "num_rows": table.num_rows,
+        "job_id": job_id,
+        "codec": codec,
+    }
+    # Tables without rows still get one chunk, so their headers are kept.
+    for chunk, row_start in enumerate(range(0, max(table.num_rows, 1), CHUNK_ROWS)):
+        row_stop = min(row_start + CHUNK_ROWS, table.num_rows)
+        record = {
+            **base,
+            "chunk": chunk,
+            "row_start": row_start,
+            "row_count": row_stop - row_start,
+            "columns": [encode_column(column[row_start:row_stop], codec) for column in table.columns],
+            "parent_rows": (
+                encode_ints(table.parent_rows[row_start:row_stop], codec)
+                if table.parent_rows is not None else None
+            ),
+        }
+        record["bytes"] = chunk_bytes(record)
+        if chunk == 0:
+            record["schema"] = {
+                "headers": table.headers,
+                "types": table.types,
+                "parent": table.parent,
+                "version": table.version,
+            }
+        yield record
+
+
+def chunk_bytes(chunk: Dict) -> int:
+    """Stored size of a chunk's data (its encoded columns and parent links)."""
+    return sum(len(blob) for blob in chunk["columns"]) + len(chunk.get("parent_rows") or b"")
+
+
+def partition_key(table: BlockTable) -> str:
+    """Partition of a table: one filing of one CNPJ and period in one layout."""
+    ids = table.file_ids
+    return "|".join([table.layout, ids.get("ID_CNPJ", ""), ids.get("ID_DT_INI", ""), ids.get("ID_DT_FIN", "")])
+
+
+async def _reserve_file_seqs(doc_id, count: int) -> int:
+    """Reserves `count` file sequence numbers on the document and returns the first one."""
+    doc = await documents_collection.find_one_and_update(
+        {"_id": doc_id}, {"$inc": {"next_file_seq": count}}, projection={"next_file_seq": 1},
+    )
+    return doc.get("next_file_seq", 0)
+
+
+async def _write_partitions(doc: Dict, tables: List[BlockTable], job_id: Optional[str] = None,
+                            keep_duplicates: bool = False, replace_all: bool = False,
+                            file_hashes: Optional[Dict[str, str]] = None,
+                            keep: Iterable[str] = ()) -> List[str]:
+    """
+    Writes tables as new generations of their partitions and switches to them.
+
+    Chunks of the new generations are inserted first and are invisible to
+    readers until a single update of the document record points the partitions
+    at them (the switch is atomic, and gets a new version). The previous
+    generations are kept as retired, so earlier versions can still be read,
+    until drop_history removes them. A partition keeps its place (file_seq) in
+    the document when it is replaced.
+
+    Args:
+        doc (Dict): The document record.
+        tables (List[BlockTable]): Tables of one or more files.
+        job_id (str): Ingest job writing the tables, if any.
+        keep_duplicates (bool): Keep every file of a partition (used when moving
+            old data into partitions); otherwise the last file of each wins.
+        replace_all (bool): Partitions missing from `tables` are dropped too,
+            except those in `keep`.
+        file_hashes (Dict[str, str]): Hash of the raw file (see file_store) each
+            partition was parsed from, by partition key. It is recorded on the
+            partition so exports can copy the original lines.
+        keep (Iterable[str]): Partitions left as they are with `replace_all`.
+
+    Returns:
+        List[str]: Keys of the partitions that replaced existing data.
+    """
+    doc_id = str(doc["_id"])
+    existing = {} if replace_all else doc.get("partitions", {})
+    current = doc.get("partitions", {})
+
+    by_partition: Dict[str, List[Dict[str, BlockTable]]] = {}
+    for file_tables in group_files(tables):
+        key = partition_key(next(iter(file_tables.values())))
+        if keep_duplicates:
+            by_partition.setdefault(key, []).append(file_tables)
+        else:
+            # A later file of the same period (e.g. the substitute filing) wins.
+            by_partition[key] = [file_tables]
+    keep = set(keep)
+    if not by_partition and (not replace_all or set(current) <= keep):
+        return []
+
+    new_seqs = sum(
+        len(files) for key, files in by_partition.items()
+        if len(files) > 1 or key not in current
+    )
+    next_seq = await _reserve_file_seqs(doc["_id"], new_seqs) if new_seqs else 0
+
+    chunks, partitions = [], {}
+    for key, files in by_partition.items():
+        generation = str(ObjectId())
+        first_seq = None
+        for file_tables in files:
+            if len(files) == 1 and key in current:
+                file_seq = current[key]["file_seq"]
+            else:
+                file_seq, next_seq = next_seq, next_seq + 1
+            first_seq = file_seq if first_seq is None else first_seq
+            for block_seq, table in enumerate(file_tables.values()):
+                for chunk in _table_chunks(doc_id, doc["company_id"], file_seq, block_seq, table, job_id):
+                    chunk["partition"] = key
+                    chunk["generation"] = generation
+                    chunks.append(chunk)
+        first_table = next(iter(files[0].values()))
+        partitions[key] = {
+            "generation": generation,
+            "file_seq": first_seq,
+            "layout": first_table.layout,
+            "file_ids": first_table.file_ids,
+            "job_id": job_id,
+            "updated_at": datetime.utcnow(),
+        }
+        if file_hashes and key in file_hashes and len(files) == 1:
+            partitions[key]["file_hash"] = file_hashes[key]
+
+    if chunks:
+        await sheet_chunks_collection.insert_many(chunks)
+
+    def switch(current_doc: Dict, version: int) -> Dict:
+        current_partitions = current_doc.get("partitions", {})
+        written = {key: {**value, "since": version} for key, value in partitions.items()}
+        if replace_all:
+            kept = {key: value for key, value in current_partitions.items() if key in keep}
+            update = {"$set": {"partitions": {**kept, **written}}}
+        else:
+            update = {"$set": {f"partitions.{key}": value for key, value in written.items()}}
+        retired = [
+            {"partition": key, "generation": value["generation"], "since": value.get("since", 0), "until": version}
+            for key, value in current_partitions.items()
+            if key in written or (replace_all and key not in keep)
+        ]
+        if retired:
+            update["$push"] = {"retired": {"$each": retired}}
+        return update
+
+    await _bump_version(doc, switch)
+    return [key for key in partitions if key in existing]
+
+
+async def _bump_version(doc: Dict, update_at: Optional[Callable[[Dict, int], Dict]] = None) -> int:
+    """
+    Gives a rewrite of the document's data a new version, in the same update
+    of the document record as the rewrite itself. `update_at(current, version)`
+    returns that update for the record as it is now; it is tried again if the
+    record changes in between (e.g. an edit gets recorded).
+
+    Returns:
+        int: The new version.
+    """
+    while True:
+        current = await documents_collection.find_one({"_id": doc["_id"]})
+        version = current.get("version", 0) + 1
+        update = update_at(current, version) if update_at else {}
+        update = {**update, "$set": {**update.get("$set", {}), "version": version}}
+        version_filter = {"_id": doc["_id"], "version": current.get("version") or {"$in": [0, None]}}
+        if await documents_collection.find_one_and_update(version_filter, update) is not None:
+            return version
+
+
+async def drop_history(doc: Dict, before: int) -> None:
+    """
+    Drops what only versions before `before` (a base snapshot) are read from:
+    their journal entries, chunk versions replaced by a compaction, and the
+    generations and sheets replaced or removed by then. Those versions can't
+    be read anymore (history_start).
+    """
+    doc_id = str(doc["_id"])
+    await documents_collection.update_one({"_id": doc["_id"]}, {
+        "$max": {"history_start": before},
+        "$pull": {
+            "retired": {"until": {"$lte": before}},
+            "removed_sheets": {"until": {"$lte": before}},
+            "snapshots": {"$lt": before},
+        },
+    })
+    await sheet_edits_collection.delete_many({"doc_id": doc_id, "version": {"$lte": before}})
+    await sheet_chunks_collection.delete_many({"doc_id": doc_id, "valid_to": {"$lte": before}})
+    retired = [entry["generation"] for entry in doc.get("retired", []) if entry["until"] <= before]
+    if retired:
+        await sheet_chunks_collection.delete_many({"doc_id": doc_id, "generation": {"$in": retired}})
+    for removed in doc.get("removed_sheets", []):
+        if removed["until"] <= before:
+            await sheet_chunks_collection.delete_many(
+                {"doc_id": doc_id, "sheet": removed["sheet"], "generation": {"$in": removed["generations"]}}
+            )
+
+
+async def _migrate_legacy(doc: Dict) -> Dict:
+    """
+    Moves data stored before partitions existed (tables/sheets embedded in the
+    document record, or chunks without a generation) into partitions.
+
+    Returns:
+        Dict: The up-to-date document record.
+    """
+    if "partitions" in doc:
+        return doc
+    tables = await load_document_tables(doc)
+    await sheet_chunks_collection.delete_many({"doc_id": str(doc["_id"]), "generation": {"$exists": False}})
+    await documents_collection.update_one(
+        {"_id": doc["_id"]}, {"$unset": {"tables": "", "sheets": ""}, "$set": {"partitions": {}}}
+    )
+    doc = await documents_collection.find_one({"_id": doc["_id"]})
+    await _write_partitions(doc, tables, keep_duplicates=True)
+    return await documents_collection.find_one({"_id": doc["_id"]})
+
+
+async def get_company_document(company_id: str) -> Dict:
+    """Returns the company's document record, creating it if needed."""
+    doc = await documents_collection.find_one({"company_id": company_id})
+    if doc is None:
+        result = await documents_collection.insert_one(
+            {"company_id": company_id, "next_file_seq": 0, "partitions": {}}
+        )
+        doc = await documents_collection.find_one({"_id": result.inserted_id})
+    return await _migrate_legacy(doc)
+
+
+async def append_tables(company_id: str, tables: List[BlockTable], job_id: Optional[str] = None,
+                        file_hashes: Optional[Dict[str, str]] = None) -> Tuple[str, List[str]]:
+    """
+    Stores parsed tables in the company's document, creating it if needed.
+
+    Data is partitioned by (layout, ID_CNPJ, ID_DT_INI, ID_DT_FIN): a file for a
+    period that is already stored (e.g. a "Remessa de arquivo substituto")
+    replaces just that period, other periods are not read or rewritten.
+    Re-running an interrupted job simply replaces its partitions again.
+    `file_hashes` maps partition keys to the raw file they came from.
+
+    Returns:
+        Tuple[str, List[str]]: The id of the company's document and the keys of
+            the partitions that were replaced.
+    """
+    doc = await get_company_document(company_id)
+    if job_id:
+        # Chunks of a run that stopped before switching partitions were never visible.
+        switched = [p["generation"] for p in doc["partitions"].values()]
+        switched += [entry["generation"] for entry in doc.get("retired", [])]
+        await sheet_chunks_collection.delete_many(
+            {"doc_id": str(doc["_id"]), "job_id": job_id, "generation": {"$nin": switched}}
+        )
+    replaced = await _write_partitions(doc, tables, job_id, file_hashes=file_hashes)
+    return str(doc["_id"]), replaced
+
+
+async def replace_tables(doc: Dict, tables: List[BlockTable], keep: Iterable[str] = ()) -> None:
+    """
+    Replaces every table of the document (after edits made in the grid), but
+    the partitions in `keep`.
+    """
+    doc = await _migrate_legacy(doc)
+    await _write_partitions(doc, tables, keep_duplicates=True, replace_all=True, keep=keep)
+
+
+async def delete_sheet_tables(doc: Dict, sheet_name: str) -> None:
+    """
+    Removes one sheet (block) from the document as of a new version. Its
+    chunks stay for earlier versions until drop_history.
+    """
+    await _migrate_legacy(doc)
+
+    def remove(current_doc: Dict, version: int) -> Dict:
+        removed = {"sheet": sheet_name, "generations": live_generations(current_doc), "until": version}
+        return {"$push": {"removed_sheets": removed}}
+
+    await _bump_version(doc, remove)
+
+
+def summarize_tables(tables: List[BlockTable]) -> Dict:
+    """
+    Compact description of what a set of tables adds to a document.
+
+    Returns:
+        Dict: {"total_rows", "blocks": {sheet name: rows}, "periods": [{"ID_CNPJ",
+            "ID_DT_INI", "ID_DT_FIN", "layout", "rows"}]}.
+    """
+    blocks: Dict[str, int] = {}
+    periods: Dict[tuple, Dict] = {}
+    for table in tables:
+        blocks[table.sheet_name] = blocks.get(table.sheet_name, 0) + table.num_rows
+        key = (table.layout, tuple(table.id_values))
+        period = periods.get(key)
+        if period is None:
+            period = periods[key] = {**table.file_ids, "layout": table.layout, "rows": 0}
+        period["rows"] += table.num_rows
+    return {
+        "total_rows": sum(blocks.values()),
+        "blocks": blocks,
+        "periods": list(periods.values()),
+    }
+
+
+# === 🔹 Reading Chunks Back into Tables === #
+def read_point(doc: Dict, version: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Where to read a version of the document from: the newest base snapshot at
+    or before it and the last journal entry to replay on top.
+
+    Args:
+        doc (Dict): The document record.
+        version (int): Version to read; the latest if omitted.
+
+    Returns:
+        Tuple[int, int]: (snapshot, version).
+    """
+    latest = doc.get("version", 0)
+    version = latest if version is None else version
+    if version > latest or version < doc.get("history_start", 0):
+        raise ValueError(f"Version {version} is not available (available: {doc.get('history_start', 0)}-{latest})")
+    snapshot = max((s for s in doc.get("snapshots", []) if s <= version), default=0)
+    return snapshot, version
+
+
+def live_generations(doc: Dict, version: Optional[int] = None) -> List[str]:
+    """Generations of the partitions that made up the document at a version (the latest if omitted)."""
+    version = doc.get("version", 0) if version is None else version
+    live = [p["generation"] for p in doc.get("partitions", {}).values() if p.get("since", 0) <= version]
+    live += [r["generation"] for r in doc.get("retired", []) if r.get("since", 0) <= version < r["until"]]
+    return live
+
+
+def active_chunks_query(doc: Dict, snapshot: Optional[int] = None, version: Optional[int] = None) -> Dict:
+    """
+    Mongo filter for the chunks visible in a document's base snapshot.
+
+    Args:
+        doc (Dict): The document record.
+        snapshot (int): Base snapshot to read; the latest (base_version) if omitted.
+        version (int): Version being read (see read_point); the latest if omitted.
+    """
+    query: Dict = {"doc_id": str(doc["_id"])}
+    if "partitions" in doc:
+        # Only the generations of each partition live at that version are visible.
+        version = doc.get("version", 0) if version is None else version
+        query["generation"] = {"$in": live_generations(doc, version)}
+        removed = [
+            {"sheet": entry["sheet"], "generation": {"$in": entry["generations"]}}
+            for entry in doc.get("removed_sheets", []) if entry["until"] <= version
+        ]
+        if removed:
+            query["$nor"] = removed
+    # Compaction writes edited chunks as new versions, valid from its snapshot on.
+    snapshot = doc.get("base_version", 0) if snapshot is None else snapshot
+    query["valid_from"] = {"$not": {"$gt": snapshot}}
+    query["valid_to"] = {"$not": {"$lte": snapshot}}
+    return query
+
+
+async def journal_entries(doc: Dict, after: int, until: int) -> List[Dict]:
+    """Edit journal entries of versions (after, until], oldest first."""
+    if until <= after:
+        return []
+    query = {"doc_id": str(doc["_id"]), "version": {"$gt": after, "$lte": until}}
+    return await sheet_edits_collection.find(query).sort("version", 1).to_list(None)
+
+
+def chunk_columns(chunk: Dict) -> Tuple[List[List[str]], Optional[List[int]]]:
+    codec = chunk.get("codec")
+    if codec is None:
+        # Chunks written before the compact format hold plain lists.
+        return chunk["columns"], chunk.get("parent_rows")
+    columns = [decode_column(blob, codec) for blob in chunk["columns"]]
+    return columns, decode_ints(chunk.get("parent_rows"), codec)
+
+
+def _table_from_chunks(chunks: List[Dict]) -> BlockTable:
+    first = chunks[0]
+    schema = first.get("schema") or first
+    columns = [[] for _ in schema["headers"]]
+    parent_rows = [] if first.get("parent_rows") is not None else None
+    for chunk in chunks:
+        chunk_values, chunk_parent_rows = chunk_columns(chunk)
+        for column, values in zip(columns, chunk_values):
+            column.extend(values)
+        if parent_rows is not None:
+            parent_rows.extend(chunk_parent_rows or [])
+    return BlockTable(
+        first["block"],
+        schema["headers"],
+        first.get("file_ids", {}),
+        columns=columns,
+        num_rows=sum(chunk["row_count"] for chunk in chunks),
+        layout=first.get("layout"),
+        version=schema.get("version", ""),
+        types=schema.get("types"),
+        parent=schema.get("parent"),
+        parent_rows=parent_rows,
+    )
+
+
+# === 🔹 Catalog === #
+# Chunk fields the catalog needs: everything but the data.
+CATALOG_PROJECTION = {
+    "sheet": 1, "block": 1, "layout": 1, "file_ids": 1, "file_seq": 1, "block_seq": 1,
+    "chunk": 1, "row_count": 1, "bytes": 1, "schema.headers": 1, "generation": 1,
+}
+
+
+def _catalog_sheet(sheets: Dict, name: str, block: str, layout: Optional[str]) -> Dict:
+    return sheets.setdefault(name, {
+        "name": name, "block": block, "layout": layout,
+        "headers": [], "rows": 0, "bytes": 0, "files": {},
+    })
+
+
+async def document_catalog(doc: Dict, version: Optional[int] = None) -> Dict:
+    """
+    Describes a document without reading any of its data: per sheet its block,
+    headers, row count and stored size, split by file (period and CNPJ).
+
+    Only chunk metadata is read (a projection without the columns); row counts
+    include the edits of the journal that were not compacted yet. `version`
+    describes the document as it was then (see read_point); periods and dates
+    are always the latest.
+
+    Returns:
+        Dict: {"version", "updated_at", "total_rows", "bytes", "periods", "sheets"}.
+    """
+    sheets: Dict[str, Dict] = {}
+    if "tables" in doc or "sheets" in doc:
+        # Not migrated yet: the data is still embedded in the document record.
+        for table in load_tables(doc):
+            sheet = _catalog_sheet(sheets, table.sheet_name, table.name, table.layout)
+            sheet["headers"] = max(sheet["headers"], table.headers, key=len)
+            sheet["rows"] += table.num_rows
+            sheet["files"][len(sheet["files"])] = {**table.file_ids, "rows": table.num_rows}
+    else:
+        snapshot, version = read_point(doc, version)
+        cursor = sheet_chunks_collection.find(active_chunks_query(doc, snapshot, version), CATALOG_PROJECTION)
+        async for chunk in cursor.sort(CHUNK_SORT):
+            sheet = _catalog_sheet(sheets, chunk["sheet"], chunk["block"], chunk.get("layout"))
+            headers = (chunk.get("schema") or {}).get("headers") or []
+            sheet["headers"] = max(sheet["headers"], headers, key=len)
+            file_entry = sheet["files"].setdefault(chunk["file_seq"], {**chunk.get("file_ids", {}), "rows": 0})
+            file_entry["rows"] += chunk["row_count"]
+            sheet["rows"] += chunk["row_count"]
+            sheet["bytes"] += chunk.get("bytes") or 0
+
+        # Rows inserted or deleted since the last compaction.
+        active = set(live_generations(doc, version))
+        for entry in await journal_entries(doc, snapshot, version):
+            for edit in entry["edits"]:
+                delta = edit.get("shift", {}).get("delta", 0)
+                sheet = sheets.get(edit["sheet"])
+                if not delta or sheet is None or edit.get("generation") not in active:
+                    continue
+                file_entry = sheet["files"].get(edit["key"][0])
+                if file_entry is not None:
+                    file_entry["rows"] += delta
+                    sheet["rows"] += delta
+
+    partitions = doc.get("partitions", {})
+    updated = [p["updated_at"] for p in partitions.values() if p.get("updated_at")]
+    if doc.get("edited_at"):
+        updated.append(doc["edited_at"])
+    return {
+        "version": doc.get("version", 0) if version is None else version,
+        "updated_at": max(updated, default=None),
+        "total_rows": sum(sheet["rows"] for sheet in sheets.values()),
+        "bytes": sum(sheet["bytes"] for sheet in sheets.values()),
+        "periods": [
+            {**p["file_ids"], "layout": p["layout"], "updated_at": p.get("updated_at")}
+            for p in sorted(partitions.values(), key=lambda p: p["file_seq"])
+        ],
+        "sheets": [
+            {**sheet, "columns": len(ID_HEADERS) + len(sheet["headers"]), "files": list(sheet["files"].values())}
+            for sheet in sheets.values()
+        ],
+    }
+
+
+def filtered_chunks_query(doc: Dict, snapshot: int, blocks: Optional[List[str]],
+                          file_ids: Optional[Dict[str, Union[str, List[str]]]],
+                          version: Optional[int] = None) -> Dict:
+    """Chunk query of a snapshot narrowed down to some blocks and files (see load_document_tables)."""
+    query = active_chunks_query(doc, snapshot, version)
+    if blocks:
+        query["$or"] = [{"block": {"$in": list(blocks)}}, {"sheet": {"$in": list(blocks)}}]
+    for key, value in (file_ids or {}).items():
+        query[f"file_ids.{key}"] = {"$in": value} if isinstance(value, list) else value
+    return query
+
+
+def _id_matches(value: str, wanted: Union[str, List[str]]) -> bool:
+    return value in wanted if isinstance(wanted, list) else value == wanted
+
+
+async def load_document_tables(doc: Dict, blocks: Optional[List[str]] = None,
+                               file_ids: Optional[Dict[str, Union[str, List[str]]]] = None,
+                               version: Optional[int] = None) -> List[BlockTable]:
+    """
+    Reads the tables of a document from its chunks, with the edits of the
+    journal that were not compacted yet applied on top.
+
+    The filters are part of the chunk query, so chunks of other blocks and
+    files (periods, CNPJs) are never read.
+
+    Args:
+        doc (Dict): The document record.
+        blocks (List[str]): Only read these blocks, by record code or sheet name,
+            e.g. ["C170", "C100 (EFD_ICMS_IPI)"].
+        file_ids (Dict): Only read files with these IDs, each given as a value or
+            a list of values, e.g. {"ID_DT_INI": ["01042021", "01082021"]}.
+        version (int): Read the document as it was at this version (see read_point).
+
+    Returns:
+        List[BlockTable]: Tables in upload order.
+    """
+    if "tables" in doc or "sheets" in doc:
+        # Not migrated yet: the data is still embedded in the document record.
+        return [
+            table for table in load_tables(doc)
+            if (not blocks or table.name in blocks or table.sheet_name in blocks)
+            and all(_id_matches(table.file_ids.get(key), value) for key, value in (file_ids or {}).items())
+        ]
+
+    snapshot, version = read_point(doc, version)
+    query = filtered_chunks_query(doc, snapshot, blocks, file_ids, version)
+    chunks = await sheet_chunks_collection.find(query).sort(CHUNK_SORT).to_list(None)
+    entries = await journal_entries(doc, snapshot, version)
+    if entries:
+        chunks = apply_entries(chunks, entries)
+
+    tables = []
+    current_key, current_chunks = None, []
+    for chunk in chunks:
+        key = (chunk["file_seq"], chunk["block_seq"])
+        if key != current_key and current_chunks:
+            tables.append(_table_from_chunks(current_chunks))
+            current_chunks = []
+        current_key = key
+        current_chunks.append(chunk)
+    if current_chunks:
+        tables.append(_table_from_chunks(current_chunks))
+    return tables
+
+
+# Groupings iter_document_chunks can read chunks in.
+GROUP_BY_SHEET = "sheet"
+GROUP_BY_FILE_IDS = "file_ids"
+
+
+async def iter_document_chunks(doc: Dict, blocks: Optional[List[str]] = None,
+                               file_ids: Optional[Dict[str, Union[str, List[str]]]] = None,
+                               version: Optional[int] = None,
+                               group_by: Optional[str] = None) -> AsyncIterator[Dict]:
+    """
+    Reads the chunks of a migrated document one at a time (with their columns),
+    for exports that write rows out as they are read.
+
+    Chunks come in CHUNK_SORT order within each group. Journal edits are applied
+    to the chunks they touch; parent links are left as stored, since a chunk's
+    values don't depend on them.
+
+    Args:
+        doc (Dict): The document record (already migrated to partitions).
+        blocks, file_ids, version: Same as load_document_tables.
+        group_by (str): GROUP_BY_SHEET reads sheet by sheet, GROUP_BY_FILE_IDS
+            reads the files with the same IDs one after the other; groups come
+            in the order they first appear. None reads in CHUNK_SORT order.
+
+    Yields:
+        Dict: Full chunks.
+    """
+    snapshot, version = read_point(doc, version)
+    query = filtered_chunks_query(doc, snapshot, blocks, file_ids, version)
+    entries = await journal_entries(doc, snapshot, version)
+    touched = touched_keys(entries)
+
+    groups = [{}]
+    if group_by is not None:
+        # The first chunk of every table tells which group it belongs to.
+        heads = sheet_chunks_collection.find({**query, "chunk": 0}, {"sheet": 1, "file_ids": 1, "file_seq": 1})
+        by_key: Dict = {}
+        async for head in heads.sort(CHUNK_SORT):
+            if group_by == GROUP_BY_SHEET:
+                by_key.setdefault(head["sheet"], {"sheet": head["sheet"]})
+            else:
+                key = tuple(head.get("file_ids", {}).get(name, "") for name in ID_HEADERS)
+                file_seqs = by_key.setdefault(key, {"file_seq": {"$in": []}})["file_seq"]["$in"]
+                if head["file_seq"] not in file_seqs:
+                    file_seqs.append(head["file_seq"])
+        groups = list(by_key.values())
+
+    for group in groups:
+        async for chunk in sheet_chunks_collection.find({**query, **group}).sort(CHUNK_SORT):
+            if chunk_key(chunk) in touched:
+                chunk = apply_entries([chunk], entries, links=False)[0]
+            yield chunk
@@ -1,115 +1,402 @@
 # export_utils.py
-from typing import Dict, List
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+import csv
 import io
-import pandas as pd
-from fastapi import HTTPException
+import re
+import shutil
+import tempfile
+import zipfile
+from itertools import repeat
+from xml.sax.saxutils import escape as xml_escape
+from starlette.concurrency import run_in_threadpool
+from services.block_store import ID_HEADERS, BlockTable, group_tables, sheet_row_runs, tables_from_sheets
+from services.document_store import (
+    GROUP_BY_FILE_IDS, GROUP_BY_SHEET, chunk_columns, iter_document_chunks, load_document_tables,
+)
+from services.layouts import field_type
+from services.record_counts import RecordCounts, is_block_closer
+from services.streaming import FLUSH_BYTES
+from services.typed_columns import DECIMAL, INTEGER, decode_column
 
-def export_file(file_obj: Dict) -> Dict:
+# Rows of an in-memory table formatted at a time.
+EXPORT_BATCH_ROWS = 5000
+
+class RowBatch(NamedTuple):
+    """Consecutive rows of one table (one stored chunk, or a slice of a table) being exported."""
+    sheet: str
+    id_values: List[str]
+    headers: List[str]
+    types: List[str]
+    rows: List[Sequence[str]]
+
+def _file_order(tables: List[BlockTable]) -> List[BlockTable]:
     """
-    Convert the updated file data back into the original TXT format,
-    splitting the export into separate files based on the unique file-level IDs
-    (ID_DT_INI, ID_DT_FIN, ID_CNPJ) that were prepended.
-    
-    For each sheet in file_obj["sheets"]:
-      - Reconstruct rows from the celldata.
-      - Group data rows by the tuple (ID_DT_INI, ID_DT_FIN, ID_CNPJ) found in columns 0,1,2.
-      - Skip the header row (r == 0) and remove the ID columns from the output.
-    
-    Returns:
-        A dictionary mapping a generated file name (based on the IDs) to the file content (as a TXT string).
+    Tables of one file block by block (blocks in order of appearance), each
+    block ending with its closer (x990), so the closers count every record
+    of their block. Sheets sent by the client come in sheet order, where a
+    record type first seen in a later file follows the closer.
     """
-    file_exports = {}  # key: file_id string, value: list of lines (strings)
-
-    for sheet in file_obj.get("sheets", []):
-        # Reconstruct rows by grouping cells by row index
-        rows_dict = {}
-        for cell in sheet.get("celldata", []):
-            r = cell.get("r")
-            c = cell.get("c")
-            # Extract cell value (handle dict case)
-            value = cell.get("v", {}).get("v", "") if isinstance(cell.get("v"), dict) else cell.get("v", "")
-            rows_dict.setdefault(r, {})[c] = str(value)
-        
-        # Process only data rows (r > 0), skipping header row (r == 0)
-        for r in sorted(rows_dict.keys()):
-            if r == 0:
-                continue  # Skip header row
-            row_cells = rows_dict[r]
-            max_col = max(row_cells.keys()) if row_cells else -1
-            row_list = [row_cells.get(col, "") for col in range(max_col + 1)]
-            # Use the first three columns (IDs) for grouping but remove them from export
-            file_id_tuple = (row_list[0], row_list[1], row_list[2])
-            file_id_str = "_".join(file_id_tuple)
-            if file_id_str not in file_exports:
-                file_exports[file_id_str] = []
-            # Remove the first three ID columns before exporting the row
-            trimmed_row_list = row_list[3:]
-            # Reconstruct the row as a pipe-separated line.
-            line = "|" + "|".join(trimmed_row_list) + "|"
-            file_exports[file_id_str].append(line)
-    
-    # Join each file's list of lines into a single string.
-    for key in file_exports:
-        file_exports[key] = "\n".join(file_exports[key])
-    return file_exports
-
-def export_file_to_csv(file_obj: Dict) -> str:
+    blocks: Dict[str, List[BlockTable]] = {}
+    for table in tables:
+        blocks.setdefault(table.name[:1], []).append(table)
+    return [table for group in blocks.values() for table in sorted(group, key=lambda t: is_block_closer(t.name))]
+
+def ordered_tables(tables: List[BlockTable], group_by: str) -> List[BlockTable]:
+    """Tables sheet by sheet (GROUP_BY_SHEET) or file by file (GROUP_BY_FILE_IDS), groups in order of appearance."""
+    if group_by == GROUP_BY_SHEET:
+        return [table for group in group_tables(tables).values() for table in group]
+    by_ids: Dict[tuple, List[BlockTable]] = {}
+    for table in tables:
+        by_ids.setdefault(tuple(table.id_values), []).append(table)
+    return [table for group in by_ids.values() for table in _file_order(group)]
+
+def table_batches(tables: Iterable[BlockTable]) -> Iterator[RowBatch]:
+    """Rows of in-memory tables, EXPORT_BATCH_ROWS at a time (at least one batch per table)."""
+    for table in tables:
+        for start in range(0, max(table.num_rows, 1), EXPORT_BATCH_ROWS):
+            rows = list(table.iter_rows(start, start + EXPORT_BATCH_ROWS))
+            yield RowBatch(table.sheet_name, table.id_values, table.headers, table.types, rows)
+
+def chunk_batch(chunk: Dict, schema: Dict) -> RowBatch:
+    """Rows of one stored chunk; `schema` comes from the first chunk of its table."""
+    columns, _ = chunk_columns(chunk)
+    rows = list(zip(*columns)) if columns else [()] * chunk["row_count"]
+    id_values = [chunk.get("file_ids", {}).get(key, "") for key in ID_HEADERS]
+    return RowBatch(chunk["sheet"], id_values, schema["headers"], schema.get("types") or [], rows)
+
+async def iterate(batches: Iterable[RowBatch]) -> AsyncIterator[RowBatch]:
+    for batch in batches:
+        yield batch
+
+def file_batches(file_obj: Dict, group_by: str, selected: bool = False) -> Iterator[RowBatch]:
+    """
+    Rows of the sheets in file_obj (as sent back by the client). With
+    `selected`, only the sheets in selectedBlocks. Sheet by sheet
+    (GROUP_BY_SHEET), the rows go out as they are read from the cells; file by
+    file, they are converted into block tables first, to be put in file order.
+    """
+    sheets = file_obj.get("sheets", [])
+    selected_blocks = file_obj.get("selectedBlocks") if selected else None
+    if group_by == GROUP_BY_SHEET:
+        return _sheet_batches(sheets, selected_blocks)
+    tables = tables_from_sheets(sheets)
+    if selected_blocks:
+        tables = [table for group in select_groups(tables, selected_blocks).values() for table in group]
+    return table_batches(ordered_tables(tables, group_by))
+
+def _sheet_batches(sheets: List[Dict], selected_blocks: Optional[List[str]] = None) -> Iterator[RowBatch]:
+    """Rows of FortuneSheet sheets sheet by sheet, EXPORT_BATCH_ROWS at a time, without building block tables."""
+    runs: Dict[str, List[Tuple[List[str], Dict[str, str], List[List[str]]]]] = {}
+    for sheet in sheets:
+        sheet_name = sheet.get("name", "Sheet")
+        for name, _, headers, file_ids, rows in sheet_row_runs(sheet):
+            if not selected_blocks or sheet_name in selected_blocks or name in selected_blocks:
+                runs.setdefault(sheet_name, []).append((headers, file_ids, rows))
+    for sheet_name, sheet_runs in runs.items():
+        for headers, file_ids, rows in sheet_runs:
+            types = [field_type(header) for header in headers]
+            id_values = [file_ids.get(key, "") for key in ID_HEADERS]
+            for start in range(0, len(rows), EXPORT_BATCH_ROWS):
+                batch_rows = [[value.strip() for value in row] for row in rows[start:start + EXPORT_BATCH_ROWS]]
+                yield RowBatch(sheet_name, id_values, headers, types, batch_rows)
+
+async def document_batches(doc: Dict, group_by: str, blocks: Optional[List[str]] = None,
+                           file_ids: Optional[Dict] = None) -> AsyncIterator[RowBatch]:
+    """Rows of a stored document, read one chunk at a time (see iter_document_chunks)."""
+    if "tables" in doc or "sheets" in doc:
+        # Not migrated yet: the data is embedded in the document record anyway.
+        tables = await load_document_tables(doc, blocks=blocks, file_ids=file_ids)
+        for batch in table_batches(ordered_tables(tables, group_by)):
+            yield batch
+        return
+    schema = None
+    async for chunk in iter_document_chunks(doc, blocks=blocks, file_ids=file_ids, group_by=group_by):
+        # Chunks of a table follow its first chunk, which holds the schema.
+        schema = chunk.get("schema") or schema
+        yield chunk_batch(chunk, schema)
+
+def _txt_text(rows: Sequence[Sequence[str]], started: bool) -> str:
+    """Rows as pipe-separated lines; `started`: the file already has lines."""
+    text = "\n".join("|" + "|".join(row) + "|" for row in rows)
+    return "\n" + text if started else text
+
+async def txt_parts(batches: AsyncIterator[RowBatch], recount: bool = True) -> AsyncIterator[Tuple[str, str]]:
     """
-    Convert the updated file data into CSV format.
-    (Not splitting by file IDs here, but similar grouping logic could be applied if needed.)
-    Returns a CSV string.
+    Convert block data back into the original TXT format, splitting the export
+    into separate files based on the unique file-level IDs (ID_DT_INI,
+    ID_DT_FIN, ID_CNPJ). Each row becomes one pipe-separated line (the ID
+    columns are not exported).
+
+    Batches must come file by file (GROUP_BY_FILE_IDS).
+
+    Args:
+        batches: Row batches.
+        recount (bool): Write the block closers (x990) and block 9 again from
+            the rows actually written (see RecordCounts), so files with added
+            or deleted rows still validate. Off for partial exports.
+
+    Yields:
+        (file name, text) pieces for zip_stream, one per batch.
     """
-    csv_lines = []
-    selected_blocks = file_obj.get("selectedBlocks")
-    
-    for sheet in file_obj.get("sheets", []):
-        if selected_blocks and sheet.get("name") not in selected_blocks:
+    current, started, counts = None, False, None
+    async for batch in batches:
+        file_name = "_".join(batch.id_values) + ".txt"
+        if file_name != current:
+            closing = counts.closing_records() if counts else []
+            if closing:
+                yield current, _txt_text(closing, started)
+            current, started = file_name, False
+            counts = RecordCounts() if recount else None
+        rows = counts.rows(batch.rows) if counts else batch.rows
+        if not rows and started:
             continue
+        yield file_name, _txt_text(rows, started)
+        started = started or bool(rows)
+    closing = counts.closing_records() if counts else []
+    if closing:
+        yield current, _txt_text(closing, started)
+
+# === 🔹 CSV === #
+# Delimiters and decimal separators the CSV export can use ("," / "." for
+# most loaders, ";" / "," for Excel in pt-BR).
+CSV_DELIMITERS = (",", ";", "\t", "|")
+CSV_DECIMALS = (".", ",")
 
-        rows_dict = {}
-        for cell in sheet.get("celldata", []):
-            if cell.get("r") == 0:
-                continue  # Skip header row
-            r = cell.get("r")
-            c = cell.get("c")
-            value = cell.get("v", {}).get("v", "") if isinstance(cell.get("v"), dict) else cell.get("v", "")
-            rows_dict.setdefault(r, {})[c] = str(value)
-        for row_idx in sorted(rows_dict.keys()):
-            row_cells = rows_dict[row_idx]
-            max_col = max(row_cells.keys()) if row_cells else -1
-            row_list = [row_cells.get(col, "") for col in range(max_col + 1)]
-            csv_line = ",".join(f'"{cell}"' for cell in row_list)
-            csv_lines.append(csv_line)
-        csv_lines.append("")  # Separate sheets with a blank line
-    return "\n".join(csv_lines)
-
-def export_file_to_xlsx(file_obj: Dict) -> bytes:
+def _csv_text(batch: RowBatch, delimiter: str, decimal: str, header: bool) -> str:
     """
-    Convert the updated file data into an Excel (XLSX) file.
-    Each sheet from file_obj becomes a worksheet.
-    Returns the XLSX file as bytes.
+    One batch as RFC 4180 CSV (quoted only where needed, CRLF line ends).
+    Rows are written in bulk by the csv module, ID columns included.
+    """
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=delimiter, lineterminator="\r\n")
+    if header:
+        writer.writerow(ID_HEADERS + list(batch.headers))
+    columns = list(zip(*batch.rows))
+    if decimal != ",":
+        # SPED decimals use a comma.
+        for col_idx, kind in enumerate(batch.types[:len(columns)]):
+            if kind == DECIMAL:
+                columns[col_idx] = [value.replace(",", decimal) for value in columns[col_idx]]
+    if columns:
+        writer.writerows(zip(*map(repeat, batch.id_values), *columns))
+    else:
+        writer.writerows([batch.id_values] * len(batch.rows))
+    return output.getvalue()
+
+async def csv_parts(batches: AsyncIterator[RowBatch], delimiter: str = ",", decimal: str = ".",
+                    prefix: str = "") -> AsyncIterator[Tuple[str, str]]:
+    """
+    Convert block data into CSV files, one per block and file (period and
+    CNPJ), each with its header row: "<prefix><sheet>/<DT_INI>_<DT_FIN>_<CNPJ>.csv".
+
+    Args:
+        batches: Row batches; the batches of one file must be consecutive.
+        delimiter (str): Field delimiter, one of CSV_DELIMITERS.
+        decimal (str): Decimal separator of decimal fields, one of CSV_DECIMALS.
+        prefix (str): Folder for the files inside the archive.
+
+    Yields:
+        (file name, text) pieces for zip_stream, one per batch.
+    """
+    current, used = None, set()
+    async for batch in batches:
+        key = (batch.sheet, tuple(batch.id_values))
+        header = key != current
+        if header:
+            current = key
+            file_name = f"{prefix}{batch.sheet}/{'_'.join(batch.id_values)}.csv"
+            # The same block of the same IDs stored twice gets a second file.
+            duplicate = 1
+            while file_name in used:
+                duplicate += 1
+                file_name = f"{prefix}{batch.sheet}/{'_'.join(batch.id_values)} ({duplicate}).csv"
+            used.add(file_name)
+        yield file_name, _csv_text(batch, delimiter, decimal, header)
+
+def select_groups(tables: List[BlockTable], selected_blocks: Optional[List[str]] = None) -> Dict[str, List[BlockTable]]:
+    """Block tables grouped by sheet name, honouring selectedBlocks."""
+    return {
+        name: block_tables for name, block_tables in group_tables(tables).items()
+        if not selected_blocks or name in selected_blocks or block_tables[0].name in selected_blocks
+    }
+
+# === 🔹 XLSX === #
+# Rows per worksheet, header included (Excel's limit).
+XLSX_MAX_ROWS = 1048576
+# Workbooks smaller than this are assembled in memory, larger ones on disk.
+XLSX_SPOOL_BYTES = 16 * 1024 * 1024
+NUMERIC_TYPES = (DECIMAL, INTEGER)
+
+# Characters XML 1.0 does not allow, dropped from text cells.
+_XML_ILLEGAL = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_XLSX_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_XLSX_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_XLSX_TYPES = "application/vnd.openxmlformats-officedocument.spreadsheetml"
+_XLSX_HEADER = f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<worksheet xmlns="{_XLSX_NS}"><sheetData>'
+_XLSX_FOOTER = "</sheetData></worksheet>"
+
+def _typed_rows(batch: RowBatch) -> List[List[Any]]:
+    """Rows of a batch (ID columns first) with decimal and integer fields as numbers."""
+    rows = [[*batch.id_values, *row] for row in batch.rows]
+    offset = len(batch.id_values)
+    for col_idx, kind in enumerate(batch.types):
+        if kind not in NUMERIC_TYPES or not rows or col_idx >= len(batch.rows[0]):
+            continue
+        # Only the numeric columns are decoded; the rows are built once.
+        typed = decode_column(kind, [row[col_idx] for row in batch.rows])
+        if typed is None:
+            continue
+        numbers = typed.values.tolist() if typed.scale == 0 else typed.to_float().tolist()
+        position = offset + col_idx
+        # Empty or unreadable values keep their text.
+        for row, number, valid in zip(rows, numbers, typed.valid.tolist()):
+            if valid:
+                row[position] = number
+    return rows
+
+def _column_letters(position: int) -> str:
+    letters = ""
+    position += 1
+    while position:
+        position, remainder = divmod(position - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+def _cell_xml(ref: str, value: Any) -> str:
+    if not isinstance(value, str):
+        return f'<c r="{ref}"><v>{value!r}</v></c>'
+    if not value:
+        return ""
+    text = _XML_ILLEGAL.sub("", xml_escape(value))
+    space = ' xml:space="preserve"' if text != text.strip() else ""
+    return f'<c r="{ref}" t="inlineStr"><is><t{space}>{text}</t></is></c>'
+
+class XlsxBuilder:
+    """
+    Workbook written row by row: each worksheet's XML is written straight to
+    a temporary file as rows are added (text as inline strings, decimal and
+    integer fields as numbers), so memory stays flat whatever the number of
+    rows and no object is built per cell. One worksheet per sheet; a sheet
+    with more rows than Excel allows continues in "<name> (2)", "<name> (3)", ...
+    """
+
+    def __init__(self):
+        self.worksheets: List[Tuple[str, Any]] = []
+        self.worksheet = None
+        self.sheet = None
+        self.part = 0
+        self.headers: List[str] = []
+        self.letters: List[str] = []
+        self.worksheet_rows = 0
+
+    def _start_worksheet(self) -> None:
+        self._end_worksheet()
+        self.part += 1
+        suffix = f" ({self.part})" if self.part > 1 else ""
+        # Worksheet titles are limited to 31 characters and unique.
+        title = self.sheet[:31 - len(suffix)] + suffix
+        titles = {used.lower() for used, _ in self.worksheets}
+        duplicate = 1
+        while title.lower() in titles:
+            duplicate += 1
+            title = f"{self.sheet[:28 - len(suffix)]}{suffix}~{duplicate}"
+        self.worksheet = tempfile.TemporaryFile()
+        self.worksheets.append((title, self.worksheet))
+        self.worksheet.write(_XLSX_HEADER.encode("utf-8"))
+        self.worksheet_rows = 0
+        self._write([self.headers])
+
+    def _end_worksheet(self) -> None:
+        if self.worksheet is not None:
+            self.worksheet.write(_XLSX_FOOTER.encode("utf-8"))
+
+    def _write(self, rows: List[List[Any]]) -> None:
+        letters, pieces = self.letters, []
+        for number, row in enumerate(rows, self.worksheet_rows + 1):
+            cells = "".join([_cell_xml(f"{letters[i]}{number}", value) for i, value in enumerate(row)])
+            pieces.append(f'<row r="{number}">{cells}</row>')
+        self.worksheet.write("".join(pieces).encode("utf-8"))
+        self.worksheet_rows += len(rows)
+
+    def add(self, batch: RowBatch) -> None:
+        if batch.sheet != self.sheet:
+            self.sheet, self.part, self.headers = batch.sheet, 0, ID_HEADERS + list(batch.headers)
+            width = max([len(self.headers)] + [len(batch.id_values) + len(row) for row in batch.rows[:1]])
+            self.letters = [_column_letters(position) for position in range(width)]
+            self._start_worksheet()
+        rows = _typed_rows(batch)
+        if rows:
+            width = max(len(row) for row in rows)
+            self.letters += [_column_letters(position) for position in range(len(self.letters), width)]
+        while rows:
+            if self.worksheet_rows == XLSX_MAX_ROWS:
+                self._start_worksheet()
+            room = XLSX_MAX_ROWS - self.worksheet_rows
+            self._write(rows[:room])
+            rows = rows[room:]
+
+    def save(self, output) -> None:
+        self._end_worksheet()
+        self.worksheet = None
+        sheets = "".join(
+            f'<sheet name="{xml_escape(title, {chr(34): "&quot;"})}" sheetId="{n}" r:id="rId{n}"/>'
+            for n, (title, _) in enumerate(self.worksheets, 1)
+        )
+        relationships = "".join(
+            f'<Relationship Id="rId{n}" Type="{_XLSX_REL}/worksheet" Target="worksheets/sheet{n}.xml"/>'
+            for n in range(1, len(self.worksheets) + 1)
+        )
+        overrides = "".join(
+            f'<Override PartName="/xl/worksheets/sheet{n}.xml" ContentType="{_XLSX_TYPES}.worksheet+xml"/>'
+            for n in range(1, len(self.worksheets) + 1)
+        )
+        head = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        package = "http://schemas.openxmlformats.org/package/2006"
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("[Content_Types].xml", (
+                f'{head}<Types xmlns="{package}/content-types">'
+                '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                '<Default Extension="xml" ContentType="application/xml"/>'
+                f'<Override PartName="/xl/workbook.xml" ContentType="{_XLSX_TYPES}.sheet.main+xml"/>'
+                f"{overrides}</Types>"
+            ))
+            archive.writestr("_rels/.rels", (
+                f'{head}<Relationships xmlns="{package}/relationships">'
+                f'<Relationship Id="rId1" Type="{_XLSX_REL}/officeDocument" Target="xl/workbook.xml"/>'
+                "</Relationships>"
+            ))
+            archive.writestr("xl/workbook.xml", (
+                f'{head}<workbook xmlns="{_XLSX_NS}" xmlns:r="{_XLSX_REL}"><sheets>{sheets}</sheets></workbook>'
+            ))
+            archive.writestr("xl/_rels/workbook.xml.rels", (
+                f'{head}<Relationships xmlns="{package}/relationships">{relationships}</Relationships>'
+            ))
+            for n, (_, worksheet) in enumerate(self.worksheets, 1):
+                worksheet.seek(0)
+                with archive.open(f"xl/worksheets/sheet{n}.xml", "w", force_zip64=True) as target:
+                    shutil.copyfileobj(worksheet, target)
+                worksheet.close()
+        self.worksheets = []
+
+async def xlsx_parts(batches: AsyncIterator[RowBatch], file_name: str) -> AsyncIterator[Tuple[str, bytes]]:
+    """
+    Convert block data into an Excel (XLSX) file, one worksheet per sheet.
+    Batches must come sheet by sheet (GROUP_BY_SHEET).
+
+    Yields:
+        (file name, bytes) pieces for zip_stream; nothing if there are no batches.
     """
-    output = io.BytesIO()
-    selected_blocks = file_obj.get("selectedBlocks")
-    
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        for sheet in file_obj.get("sheets", []):
-            if selected_blocks and sheet.get("name") not in selected_blocks:
-                continue
-            if not sheet.get("celldata"):
-                continue
-            # Determine the dimensions of the sheet
-            max_row = max(cell["r"] for cell in sheet["celldata"]) + 1
-            max_col = max(cell["c"] for cell in sheet["celldata"]) + 1
-            data = [["" for _ in range(max_col)] for _ in range(max_row)]
-            for cell in sheet.get("celldata", []):
-                r = cell.get("r", 0)
-                c = cell.get("c", 0)
-                val = cell.get("v", {}).get("v", "") if isinstance(cell.get("v"), dict) else cell.get("v", "")
-                data[r][c] = val
-            df = pd.DataFrame(data)
-            sheet_name = sheet.get("name", "Sheet")[:31]  # Limit to 31 characters
-            df.to_excel(writer, sheet_name=sheet_name, index=False, header=False)
-        writer.save()
-    output.seek(0)
-    return output.read()
+    builder = None
+    async for batch in batches:
+        builder = builder or XlsxBuilder()
+        await run_in_threadpool(builder.add, batch)
+    if builder is None:
+        return
+    with tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_BYTES) as output:
+        await run_in_threadpool(builder.save, output)
+        output.seek(0)
+        while True:
+            piece = await run_in_threadpool(output.read, FLUSH_BYTES)
+            if not piece:
+                break
+            yield file_name, piece
@@ -1,165 +1,179 @@
-import os
-import shutil
-import tempfile
-import pandas as pd
-import chardet
-from typing import List, Dict
-from headers_config import BlockHeaders  # Import the class instead of a dictionary
+import codecs
+from typing import Dict, Iterator, List, Optional, Tuple
+from services.block_store import BlockTable
+from services.layouts import detect_layout, get_layout
+from services.record_index import RecordIndex
 
 MAX_FILE_SIZE = 200 * 1024 * 1024  # 200MB limit
+# Bump whenever parse_txt output changes, so cached parse results are rebuilt.
+PARSER_VERSION = 5
 
 # === 🔹 Detect Encoding Function === #
-def detect_encoding(file_path: str) -> str:
-    """Detects the file encoding and ensures UTF-8 compatibility."""
-    with open(file_path, 'rb') as f:
-        raw_data = f.read(4096)  # Read first 4KB to detect encoding
-        result = chardet.detect(raw_data)
-        detected_encoding = result.get("encoding", "utf-8")
+class EncodingDetector:
+    """
+    Tells the encoding of a SPED file from its bytes as they go by (e.g. while
+    an upload is hashed), so the file is not read again for it: UTF-8 if the
+    whole file decodes as UTF-8, else latin-1 (the PVA default). A sample is
+    not enough: accents may first appear deep into the file.
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.encoding = "utf-8"
 
-    print(f"🔍 Detected encoding for {file_path}: {detected_encoding}")
+    def feed(self, data: bytes, final: bool = False) -> None:
+        if self.encoding != "utf-8":
+            return
+        try:
+            self._decoder.decode(data, final=final)
+        except UnicodeDecodeError:
+            self.encoding = "latin-1"
 
-    if detected_encoding.lower() in ["ascii", "us-ascii"]:
-        print(f"⚠️ ASCII detected. Forcing UTF-8 for {file_path}")
-        return "utf-8"
+    def close(self) -> str:
+        self.feed(b"", final=True)
+        return self.encoding
+
+
+def detect_encoding(file_path: str) -> str:
+    """Reads a stored file whose encoding was not recorded at upload to tell its encoding."""
+    detector = EncodingDetector()
+    with open(file_path, "rb") as f:
+        while detector.encoding == "utf-8":
+            data = f.read(1024 * 1024)
+            if not data:
+                break
+            detector.feed(data)
+    encoding = detector.close()
 
-    return detected_encoding
+    print(f"🔍 Detected encoding for {file_path}: {encoding}")
+    return encoding
 
-# === 🔹 Process TXT Files and Merge Blocks with IDs === #
-def process_txt(file_paths: List[str]) -> Dict[str, List[Dict]]:
+# === 🔹 Stream SPED Records === #
+def iter_sped_lines(file_path: str, encoding: str) -> Iterator[Tuple[int, int, str]]:
     """
-    Processes multiple .txt files, extracts file-level identifiers (DT_INI, DT_FIN, CNPJ)
-    from the '0000' block, and merges data into a JSON structure.
-    
-    Each row in the output gets prepended with three columns:
-      - ID_DT_INI
-      - ID_DT_FIN
-      - ID_CNPJ
-    so that later each file can be exported separately with its own identifiers.
-    
+    Yields (byte offset, byte length, decoded text) for every line of a SPED file.
+
+    The file is read exactly once and never fully held in memory. Bare '\r'
+    separators are honoured like in text mode (universal newlines).
+    """
+    offset = 0
+    with open(file_path, "rb") as f:
+        for raw_line in f:
+            content = raw_line.rstrip(b"\r\n")
+            if b"\r" in content:
+                position = offset
+                for piece in content.split(b"\r"):
+                    yield position, len(piece), piece.decode(encoding, errors="ignore")
+                    position += len(piece) + 1
+            else:
+                yield offset, len(content), content.decode(encoding, errors="ignore")
+            offset += len(raw_line)
+
+# === 🔹 Parse One TXT File into Block Tables === #
+def parse_txt(file_path: str, index: Optional[RecordIndex] = None,
+              encoding: Optional[str] = None) -> List[BlockTable]:
+    """
+    Parses a single .txt file into one columnar BlockTable per record type.
+
+    The layout (EFD-Contribuições or EFD ICMS/IPI) and its version are detected
+    from the '0000' record, which selects the precompiled record schemas and the
+    positions of the file-level identifiers (DT_INI, DT_FIN, CNPJ). These are
+    stored once per table instead of once per row. Records with more fields than
+    their schema get extra CAMPO_nn columns instead of being truncated. Once the
+    file is read, decimal, integer and date columns are decoded to native arrays.
+    Child records keep the row of their parent record (see parsing_logic).
+
     Args:
-        file_paths (List[str]): List of file paths to process.
+        file_path (str): Path of the file to parse.
+        index (RecordIndex): Optional index filled with the byte offsets of every
+            record during the same pass.
+        encoding (str): Encoding of the file, as told at upload (see
+            EncodingDetector); detected from the file if omitted.
 
     Returns:
-        Dict[str, List[Dict]]: Processed data in a FortuneSheet-friendly JSON format.
+        List[BlockTable]: Tables in the order their blocks first appear in the file.
     """
-    merged_grouped_data = {}  # Dictionary to store merged data from all files
-
-    for file_path in file_paths:
-        encoding = detect_encoding(file_path)
-
-        # Convert file to UTF-8 if needed
-        utf8_file_path = file_path + "_utf8.txt"
-        with open(file_path, "r", encoding=encoding, errors="ignore") as f_in, \
-             open(utf8_file_path, "w", encoding="utf-8") as f_out:
-            for line in f_in:
-                cleaned_line = line.strip().strip('|')  # Remove leading/trailing pipes
-                f_out.write(cleaned_line + "\n")  # Rewrite cleaned line
-
-        # === 🔹 Read & Normalize Columns === #
-        with open(utf8_file_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-
-        # Find the maximum number of columns in the dataset
-        max_columns = max([len(line.split("|")) for line in lines])
-        print(f"🔍 Maximum columns detected in {file_path}: {max_columns}")
-
-        # Normalize all lines to match max_columns
-        normalized_lines = []
-        for line in lines:
-            fields = line.strip().split("|")
-            while len(fields) < max_columns:
-                fields.append("")  # Add missing columns
-            normalized_lines.append(fields)
-
-        # Remove the temporary UTF8 file
-        os.remove(utf8_file_path)
-
-        # === 🔹 Extract File-Level IDs from "0000" Block === #
-        # Default values in case "0000" is not found.
-        file_ids = {"ID_DT_INI": "", "ID_DT_FIN": "", "ID_CNPJ": ""}
-        for fields in normalized_lines:
-            if fields and fields[0].strip() == "0000":
-                # Assuming the positions: DT_INI at index 5, DT_FIN at index 6, CNPJ at index 8
-                file_ids["ID_DT_INI"] = fields[5].strip() if len(fields) > 5 else ""
-                file_ids["ID_DT_FIN"] = fields[6].strip() if len(fields) > 6 else ""
-                file_ids["ID_CNPJ"] = fields[8].strip() if len(fields) > 8 else ""
-                print(f"Extracted IDs from {file_path}: {file_ids}")
-                break
-
-        # Convert normalized lines to Pandas DataFrame for easier processing/debugging
-        df_pd = pd.DataFrame(normalized_lines)
-        print(f"📊 Data shape for {file_path}: {df_pd.shape}")
-        print("DataFrame preview:")
-        print(df_pd.head())
-
-        # === 🔹 Group Data by Record Type and Attach File IDs === #
-        # Instead of just storing rows, we store tuples: (row data, file_ids)
-        for _, row in df_pd.iterrows():
-            block_type = str(row[0]).strip() if pd.notna(row[0]) else "UNKNOWN"
-            # Ignore invalid block types (corrupted characters, non-alphanumeric)
-            if not block_type.isalnum():
-                print(f"⚠️ Skipping invalid block: {block_type}")
-                continue
-
-            if block_type not in merged_grouped_data:
-                merged_grouped_data[block_type] = []
-            # Attach the file_ids (same for all rows from this file)
-            merged_grouped_data[block_type].append((row.tolist(), file_ids))
-
-    # === 🔹 Convert to FortuneSheet Format, Prepending ID Columns === #
-    fortune_sheets = []
-    for block_type, rows in merged_grouped_data.items():
-        sheet_data = []
-
-        # Get the original headers using the BlockHeaders class method
-        headers = BlockHeaders.get_headers(block_type)
-        # Prepend our new ID headers
-        id_headers = ["ID_DT_INI", "ID_DT_FIN", "ID_CNPJ"]
-        full_headers = id_headers + headers
-        total_columns = len(full_headers)
-
-        # Create the header row (always row 0)
-        for col_idx, header in enumerate(full_headers):
-            sheet_data.append({
-                "r": 0,  # header row
-                "c": col_idx,
-                "v": {
-                    "v": header if header is not None else "",
-                    "m": header if header is not None else "",
-                    "ct": {"fa": "General", "t": "g"},
-                    "bl": 1
-                }
-            })
-
-        # Add data rows (starting from row index 1)
-        row_idx = 1
-        # We assume that the original data should only have as many columns as in the original header list.
-        orig_cols = len(headers)
-        for (row, file_ids) in rows:
-            # Build a new row by prepending the file IDs to the original row (truncated/padded as needed)
-            id_values = [file_ids["ID_DT_INI"], file_ids["ID_DT_FIN"], file_ids["ID_CNPJ"]]
-            original_data = row[:orig_cols]
-            full_row = id_values + original_data
-            # Ensure the full row has the expected number of columns (total_columns)
-            while len(full_row) < total_columns:
-                full_row.append("")
-            for col_idx, value in enumerate(full_row):
-                if pd.notna(value):
-                    sheet_data.append({
-                        "r": row_idx,
-                        "c": col_idx,
-                        "v": {
-                            "v": value.strip() if isinstance(value, str) else value,
-                            "m": str(value).strip(),
-                            "ct": {"fa": "General", "t": "g"}
-                        }
-                    })
-            row_idx += 1
-
-        # Append each block as a separate sheet
-        fortune_sheets.append({
-            "name": block_type,  # e.g., "0000", "0100", etc.
-            "celldata": sheet_data
-        })
-
-    return fortune_sheets
+    encoding = encoding or detect_encoding(file_path)
+    if index is not None:
+        index.encoding = encoding
+
+    # Default values in case "0000" is not found. The same dict is shared by every
+    # table of this file, so blocks read before the "0000" record still get its IDs.
+    file_ids = {"ID_DT_INI": "", "ID_DT_FIN": "", "ID_CNPJ": ""}
+    layout = None
+    tables: Dict[str, BlockTable] = {}
+    line_count = 0
+    skipped = 0
+    # Records of the same type come in runs, so the lookups are only redone when it changes.
+    last_type = None
+    table = schema = None
+
+    # === 🔹 Route Each Record to Its Block === #
+    for offset, length, line in iter_sped_lines(file_path, encoding):
+        line_count += 1
+        fields = line.strip().strip("|").split("|")
+        block_type = fields[0].strip()
+        # Ignore invalid block types (corrupted characters, non-alphanumeric)
+        if not block_type.isalnum():
+            skipped += 1
+            continue
+
+        # === 🔹 Detect the Layout and Extract File-Level IDs === #
+        if layout is None:
+            if block_type == "0000":
+                layout = get_layout(*detect_layout(fields))
+                file_ids.update(layout.file_ids(fields))
+                print(f"Extracted IDs from {file_path} ({layout.name} {layout.version}): {file_ids}")
+            else:
+                layout = get_layout()
+            if index is not None:
+                index.layout_name, index.version = layout.name, layout.version
+
+        if block_type != last_type:
+            last_type = block_type
+            schema = layout.schema(block_type)
+            table = tables.get(block_type)
+            if table is None:
+                table = tables[block_type] = BlockTable(
+                    block_type, schema.fields, file_ids,
+                    layout=layout.name, version=layout.version, types=schema.types,
+                    parent=schema.parent,
+                )
+            parent_table = tables.get(schema.parent) if schema.parent else None
+        if len(fields) > len(table.headers):
+            table.widen(len(fields))
+        table.append(fields)
+        if schema.parent:
+            # Row of the closest preceding parent record (-1 if none was read yet).
+            table.parent_rows.append(parent_table.num_rows - 1 if parent_table is not None else -1)
+        if index is not None:
+            index.add(block_type, offset, length, schema.parent)
+        if block_type == "9999":
+            # Only the digital signature of signed files follows the closing record.
+            break
+
+    print(f"📊 Read {line_count} lines from {file_path} ({skipped} skipped)")
+
+    # === 🔹 Decode Typed Columns in Bulk === #
+    for table in tables.values():
+        table.decode()
+    return list(tables.values())
+
+# === 🔹 Build a Record Index Without Parsing === #
+def build_index(file_path: str) -> RecordIndex:
+    """Builds the byte-level RecordIndex of a file in one pass, without building tables."""
+    encoding = detect_encoding(file_path)
+    index = RecordIndex(encoding)
+    layout = None
+    for offset, length, line in iter_sped_lines(file_path, encoding):
+        block_type = line.strip().strip("|").split("|", 1)[0].strip()
+        if not block_type.isalnum():
+            continue
+        if layout is None:
+            fields = line.strip().strip("|").split("|") if block_type == "0000" else None
+            layout = get_layout(*detect_layout(fields)) if fields else get_layout()
+            index.layout_name, index.version = layout.name, layout.version
+        index.add(block_type, offset, length, layout.schema(block_type).parent)
+        if block_type == "9999":
+            break
+    return index
@@ -0,0 +1,157 @@
+# file_store.py
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from datetime import datetime
+from functools import lru_cache
+from typing import BinaryIO, Dict, List, Optional
+
+from services.file_processing import EncodingDetector
+from services.record_index import RecordIndex
+
+UPLOAD_DIR = "saved_files"
+OBJECTS_DIR = os.path.join(UPLOAD_DIR, "objects")  # raw files, stored once under their hash
+CACHE_DIR = os.path.join(UPLOAD_DIR, "cache")  # parse results, keyed by file hash
+MANIFEST_NAME = "files.json"  # per-company list of references to raw files
+CHUNK_SIZE = 1024 * 1024
+
+# Manifest updates of a company are serialized (uploads are saved on worker threads).
+_manifest_locks: Dict[str, threading.Lock] = {}
+_manifest_locks_guard = threading.Lock()
+
+
+def object_path(file_hash: str) -> str:
+    """Location of the raw file with the given SHA-256 hash."""
+    return os.path.join(OBJECTS_DIR, file_hash[:2], file_hash + ".txt")
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# === 🔹 Raw Files === #
+def save_upload(source: BinaryIO, filename: str, company_id: str) -> Dict:
+    """
+    Streams an uploaded file into the content-addressed store, hashing it on the way.
+
+    The bytes are written once under objects/<hash>; if a file with the same hash
+    already exists the new copy is discarded. The company's folder only records a
+    reference (filename -> hash) in its manifest. The file's encoding is told in
+    the same pass, so parsing does not have to read the file for it.
+
+    Returns:
+        Dict: {"filename", "hash", "path", "size", "encoding"} for the stored file.
+    """
+    os.makedirs(OBJECTS_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    detector = EncodingDetector()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=OBJECTS_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as output_file:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                digest.update(chunk)
+                detector.feed(chunk)
+                output_file.write(chunk)
+
+        file_hash = digest.hexdigest()
+        path = object_path(file_hash)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    add_reference(company_id, filename, file_hash, size)
+    return {"filename": filename, "hash": file_hash, "path": path, "size": size, "encoding": detector.close()}
+
+
+def read_manifest(company_id: str) -> Dict[str, Dict]:
+    manifest_path = os.path.join(UPLOAD_DIR, company_id, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _manifest_lock(company_id: str) -> threading.Lock:
+    with _manifest_locks_guard:
+        return _manifest_locks.setdefault(company_id, threading.Lock())
+
+
+def add_reference(company_id: str, filename: str, file_hash: str, size: int) -> None:
+    """
+    Records that the company uploaded `filename` with the given content hash.
+
+    The manifest is read and rewritten under the company's lock, so concurrent
+    uploads do not lose each other's references, and replaced atomically, so
+    a crash never leaves it half written.
+    """
+    with _manifest_lock(company_id):
+        manifest = read_manifest(company_id)
+        manifest[filename] = {
+            "hash": file_hash,
+            "size": size,
+            "uploaded_at": datetime.utcnow().isoformat(),
+        }
+        manifest_path = os.path.join(UPLOAD_DIR, company_id, MANIFEST_NAME)
+        _write_atomic(manifest_path, json.dumps(manifest, indent=2).encode("utf-8"))
+
+
+# === 🔹 Parse Result Cache === #
+def _cache_path(file_hash: str, version: int, extension: str = "pickle") -> str:
+    return os.path.join(CACHE_DIR, file_hash[:2], f"{file_hash}.v{version}.{extension}")
+
+
+def _load_pickle(path: str):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except Exception:
+        # A corrupt or outdated cache entry is simply rebuilt.
+        return None
+
+
+def load_cached(file_hash: str, version: int) -> Optional[List]:
+    """Returns the cached parse result for the hash, or None if there is none."""
+    return _load_pickle(_cache_path(file_hash, version))
+
+
+def store_cached(file_hash: str, version: int, result: List) -> None:
+    _write_atomic(_cache_path(file_hash, version), pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+# === 🔹 Record Indexes === #
+@lru_cache(maxsize=16)
+def load_index(file_hash: str, version: int) -> Optional[RecordIndex]:
+    """Returns the stored RecordIndex of a raw file, or None if it was not built yet."""
+    return _load_pickle(_cache_path(file_hash, version, "idx"))
+
+
+def store_index(file_hash: str, version: int, index: RecordIndex) -> None:
+    _write_atomic(_cache_path(file_hash, version, "idx"), pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL))
+    load_index.cache_clear()
@@ -0,0 +1,191 @@
+# ingest_jobs.py
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+
+from mongodb import ingest_jobs_collection
+from services.document_store import append_tables, partition_key, summarize_tables
+from services.parse_pool import parse_file
+from services.sheet_edits import compact_document
+
+logger = logging.getLogger(__name__)
+
+# Jobs in these states are picked up again when the worker starts.
+UNFINISHED_STATUSES = ["queued", "running"]
+
+_queue: Optional[asyncio.Queue] = None
+_worker_task: Optional[asyncio.Task] = None
+
+
+async def create_job(company_id: str, saved_files: List[Dict], errors: List[Dict]) -> str:
+    """
+    Records a new ingest job for files already saved in the raw file store.
+
+    Args:
+        company_id (str): Company the files belong to.
+        saved_files (List[Dict]): One {"filename", "hash", "path", "size", "encoding"} entry per file.
+        errors (List[Dict]): Upload errors to report with the job (e.g. rejected files).
+
+    Returns:
+        str: The job id.
+    """
+    now = datetime.utcnow()
+    job = {
+        "company_id": company_id,
+        "status": "queued",
+        "stage": "queued",
+        "files": [
+            {
+                "filename": saved["filename"],
+                "hash": saved.get("hash"),
+                "path": saved["path"],
+                "size": saved["size"],
+                "encoding": saved.get("encoding"),
+                "status": "saved",
+                "bytes_read": 0,
+                "lines_parsed": 0,
+                "blocks_found": 0,
+                "stored": False,
+                "error": None,
+            }
+            for saved in saved_files
+        ],
+        "errors": list(errors),
+        "doc_id": None,
+        "summary": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+    result = await ingest_jobs_collection.insert_one(job)
+    return str(result.inserted_id)
+
+
+async def _update_job(job_id: ObjectId, fields: Dict, error: Optional[Dict] = None) -> None:
+    update = {"$set": {**fields, "updated_at": datetime.utcnow()}}
+    if error:
+        update["$push"] = {"errors": error}
+    await ingest_jobs_collection.update_one({"_id": job_id}, update)
+
+
+async def run_job(job_id: ObjectId) -> None:
+    """
+    Parses the job's files in parallel and appends the result to the company's document.
+
+    Only the new data is written; the job then records a compact summary of what
+    was added (rows per block, periods and file IDs) instead of the data itself.
+    Files are always re-read from disk, so an interrupted job can simply be run again.
+    """
+    job = await ingest_jobs_collection.find_one({"_id": job_id})
+    if not job or job["status"] not in UNFINISHED_STATUSES:
+        return
+
+    files = job["files"]
+    parsed = [None] * len(files)
+    await _update_job(job_id, {"status": "running", "stage": "parsing"})
+
+    # === 🔹 Stage 1: parse every file on the process pool === #
+    async def parse_one(idx: int) -> None:
+        file_entry = files[idx]
+        await _update_job(job_id, {f"files.{idx}.status": "parsing"})
+        try:
+            if not os.path.exists(file_entry["path"]):
+                raise FileNotFoundError(f"Raw file not found: {file_entry['path']}")
+            tables, stats = await parse_file(
+                file_entry["path"], file_entry.get("hash"), file_entry.get("encoding")
+            )
+        except Exception as e:
+            logger.exception("Failed to parse %s", file_entry["path"])
+            await _update_job(
+                job_id,
+                {f"files.{idx}.status": "failed", f"files.{idx}.error": str(e)},
+                error={"filename": file_entry["filename"], "error": str(e)},
+            )
+            return
+        parsed[idx] = tables
+        file_summary = summarize_tables(tables)
+        await _update_job(job_id, {
+            f"files.{idx}.status": "parsed",
+            f"files.{idx}.periods": file_summary["periods"],
+            f"files.{idx}.bytes_read": stats["bytes_read"],
+            f"files.{idx}.lines_parsed": stats["lines_parsed"],
+            f"files.{idx}.blocks_found": stats["blocks_found"],
+        })
+
+    await asyncio.gather(*(parse_one(idx) for idx in range(len(files))))
+
+    parsed_indexes = [idx for idx, tables in enumerate(parsed) if tables is not None]
+    if not parsed_indexes:
+        await _update_job(job_id, {"status": "failed", "stage": "parsing"})
+        return
+
+    # === 🔹 Stage 2: store the merged tables === #
+    await _update_job(job_id, {"stage": "storing"})
+    tables = [table for idx in parsed_indexes for table in parsed[idx]]
+    # Raw file of each partition (a later file of the same period wins, as in append_tables).
+    file_hashes = {
+        partition_key(parsed[idx][0]): files[idx]["hash"]
+        for idx in parsed_indexes if parsed[idx] and files[idx].get("hash")
+    }
+    doc_id, replaced = await append_tables(job["company_id"], tables, job_id=str(job_id), file_hashes=file_hashes)
+    if replaced:
+        # Starts a snapshot at the upload, so the generations it replaced are
+        # dropped once they fall out of the history retention.
+        await compact_document(doc_id)
+
+    stored = {}
+    for idx in parsed_indexes:
+        stored[f"files.{idx}.status"] = "stored"
+        stored[f"files.{idx}.stored"] = True
+    await _update_job(job_id, {
+        **stored,
+        "status": "done",
+        "stage": "done",
+        "doc_id": doc_id,
+        "summary": {**summarize_tables(tables), "replaced_partitions": replaced},
+    })
+
+
+async def _worker() -> None:
+    while True:
+        job_id = await _queue.get()
+        try:
+            await run_job(job_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Ingest job %s failed", job_id)
+            await _update_job(job_id, {"status": "failed"}, error={"error": str(e)})
+        finally:
+            _queue.task_done()
+
+
+def enqueue_job(job_id: str) -> None:
+    _queue.put_nowait(ObjectId(job_id))
+
+
+async def start_worker() -> None:
+    """Starts the background ingest worker and resumes jobs left unfinished by a restart."""
+    global _queue, _worker_task
+    _queue = asyncio.Queue()
+    cursor = ingest_jobs_collection.find(
+        {"status": {"$in": UNFINISHED_STATUSES}}, {"_id": 1}
+    ).sort("created_at", 1)
+    async for job in cursor:
+        logger.info("Resuming ingest job %s", job["_id"])
+        _queue.put_nowait(job["_id"])
+    _worker_task = asyncio.create_task(_worker())
+
+
+async def stop_worker() -> None:
+    global _worker_task
+    if _worker_task is not None:
+        _worker_task.cancel()
+        try:
+            await _worker_task
+        except asyncio.CancelledError:
+            pass
+        _worker_task = None
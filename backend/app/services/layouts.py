@@ -0,0 +1,122 @@
+# layouts.py
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Type
+
+from headers_config import BlockHeaders, IcmsIpiBlockHeaders
+from services.typed_columns import CODE, DATE, DECIMAL, INTEGER
+
+EFD_CONTRIBUICOES = "EFD_CONTRIBUICOES"
+EFD_ICMS_IPI = "EFD_ICMS_IPI"
+
+# Header class holding the record definitions of each layout.
+LAYOUT_HEADERS: Dict[str, Type[BlockHeaders]] = {
+    EFD_CONTRIBUICOES: BlockHeaders,
+    EFD_ICMS_IPI: IcmsIpiBlockHeaders,
+}
+
+# 0000 fields that identify a file, in the order of the table ID columns.
+ID_FIELDS = {"ID_DT_INI": "DT_INI", "ID_DT_FIN": "DT_FIN", "ID_CNPJ": "CNPJ"}
+
+_DATE = re.compile(r"^\d{8}$")
+
+# Fields read as decimals: monetary values, rates and quantities.
+DECIMAL_PREFIXES = ("VL_", "ALIQ_", "QTD", "QUANT_", "PERC_", "REC_BRU_")
+DECIMAL_FIELDS = {"QUANT", "PERDA", "FAT_CONV", "BC_ICMS", "VL_ICMS"}
+
+
+def field_type(header: str) -> str:
+    """
+    Classifies a field by its SPED name.
+
+    Returns:
+        str: "decimal" (values, rates, quantities), "integer" (record counters),
+            "date" (ddmmyyyy) or "code" for everything else.
+    """
+    if header.startswith(("QTD_LIN", "QTD_REG")):
+        return INTEGER
+    if header.startswith(DECIMAL_PREFIXES) or header in DECIMAL_FIELDS:
+        return DECIMAL
+    if header.startswith("DT_"):
+        return DATE
+    return CODE
+
+
+class RecordSchema:
+    """Precompiled definition of one record code in one layout version."""
+
+    __slots__ = ("code", "fields", "types", "width", "parent")
+
+    def __init__(self, code: str, fields: List[str], parent: Optional[str] = None):
+        self.code = code
+        self.fields = list(fields)
+        self.types = [field_type(name) for name in self.fields]
+        self.width = len(self.fields)
+        self.parent = parent
+
+
+class Layout:
+    """
+    Every record schema of one SPED layout and version (COD_VER).
+
+    Schemas are built once when the layout is first requested, so the parser only
+    does a single dictionary lookup each time the record code changes.
+    """
+
+    def __init__(self, name: str, version: str):
+        self.name = name
+        self.version = version
+        self.headers = LAYOUT_HEADERS[name]
+        self.schemas: Dict[str, RecordSchema] = {
+            code: RecordSchema(
+                code,
+                self.headers.get_version_headers(code, version),
+                self.headers.get_parent(code),
+            )
+            for code in self.headers.get_all_block_types()
+        }
+        fields_0000 = self.schemas["0000"].fields
+        self.id_positions: List[Tuple[str, int]] = [
+            (id_header, fields_0000.index(field)) for id_header, field in ID_FIELDS.items()
+        ]
+
+    def schema(self, code: str) -> RecordSchema:
+        """Schema of a record code; unknown codes get an empty one (widened on read)."""
+        schema = self.schemas.get(code)
+        if schema is None:
+            schema = self.schemas[code] = RecordSchema(code, [], self.headers.get_parent(code))
+        return schema
+
+    def file_ids(self, fields_0000: List[str]) -> Dict[str, str]:
+        """Reads ID_DT_INI, ID_DT_FIN and ID_CNPJ from the fields of a 0000 record."""
+        return {
+            id_header: fields_0000[position].strip() if position < len(fields_0000) else ""
+            for id_header, position in self.id_positions
+        }
+
+
+def detect_layout(fields_0000: List[str]) -> Tuple[str, str]:
+    """
+    Tells the layout of a file from the fields of its 0000 record.
+
+    EFD ICMS/IPI has DT_INI/DT_FIN right after COD_FIN (positions 3 and 4), while
+    EFD-Contribuições has TIPO_ESCRIT, IND_SIT_ESP and NUM_REC_ANTERIOR there.
+
+    Returns:
+        Tuple[str, str]: (layout name, COD_VER).
+    """
+    version = fields_0000[1].strip() if len(fields_0000) > 1 else ""
+    if len(fields_0000) > 4 and _DATE.match(fields_0000[3].strip()) and _DATE.match(fields_0000[4].strip()):
+        return EFD_ICMS_IPI, version
+    return EFD_CONTRIBUICOES, version
+
+
+@lru_cache(maxsize=None)
+def get_layout(name: str = EFD_CONTRIBUICOES, version: str = "") -> Layout:
+    """Returns the precompiled layout for a name and version."""
+    return Layout(name, version)
+
+
+def generic_field_name(position: int) -> str:
+    """Header for fields beyond the known layout, so no data is dropped."""
+    return "REG" if position == 0 else f"CAMPO_{position + 1:02d}"
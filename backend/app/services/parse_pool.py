@@ -0,0 +1,68 @@
+# parse_pool.py
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from services.block_store import BlockTable
+from services.file_processing import PARSER_VERSION, parse_txt
+from services.file_store import load_cached, store_cached, store_index
+from services.record_index import RecordIndex
+
+# Number of parser processes; 0/unset means one per CPU core.
+PARSER_WORKERS = int(os.getenv("PARSER_WORKERS", "0")) or None
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Returns the shared parser pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        # "spawn" keeps the workers clean of the parent's Mongo client threads.
+        _executor = ProcessPoolExecutor(
+            max_workers=PARSER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+def _parse_with_stats(file_path: str, file_hash: Optional[str] = None,
+                      encoding: Optional[str] = None) -> Tuple[List[BlockTable], Dict[str, int]]:
+    """
+    Runs in a worker process: parses one file and reports what was read.
+
+    When the file's content hash is known, a cached parse result is reused
+    instead of parsing the file again, and fresh results are cached together
+    with the file's RecordIndex.
+    """
+    tables = load_cached(file_hash, PARSER_VERSION) if file_hash else None
+    if tables is None:
+        # The byte-level record index is built in the same pass.
+        index = RecordIndex()
+        tables = parse_txt(file_path, index=index, encoding=encoding)
+        if file_hash:
+            store_cached(file_hash, PARSER_VERSION, tables)
+            store_index(file_hash, PARSER_VERSION, index)
+    stats = {
+        "bytes_read": os.path.getsize(file_path),
+        "lines_parsed": sum(table.num_rows for table in tables),
+        "blocks_found": len(tables),
+    }
+    return tables, stats
+
+
+async def parse_file(file_path: str, file_hash: Optional[str] = None,
+                     encoding: Optional[str] = None) -> Tuple[List[BlockTable], Dict[str, int]]:
+    """Parses one file on the process pool, returning its tables and parse stats."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), _parse_with_stats, file_path, file_hash, encoding)
+
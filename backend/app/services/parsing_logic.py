@@ -1,153 +1,136 @@
 # parsing_logic.py
-import pandas as pd
-
-# Example dictionary of headers for each block (simplified).
-# Replace this with your actual headers dict, or import it from headers_config if needed.
-BLOCK_HEADERS = {
-    "C001": ["REG", "IND_MOV"],
-    "C010": ["REG", "CNPJ", "IND_ESCRI"],
-    "C100": [
-        "REG", "IND_OPER", "IND_EMIT", "COD_PART", "COD_MOD", "COD_SIT",
-        "SER", "NUM_DOC", "CHV_NFE", "DT_DOC", "DT_E_S", "VL_DOC", "IND_PGTO",
-        "VL_DESC", "VL_ABAT_NT", "VL_MERC", "IND_FRT", "VL_FRT", "VL_SEG",
-        "VL_OUT_DA", "VL_BC_ICMS", "VL_ICMS", "VL_BC_ICMS_ST", "VL_ICMS_ST",
-        "VL_IPI", "VL_PIS", "VL_COFINS", "VL_PIS_ST", "VL_COFINS_ST"
-    ],
-    "C170": [
-        "REG", "NUM_ITEM", "COD_ITEM", "DESCR_COMPL", "QTD", "UNID", "VL_ITEM",
-        "VL_DESC", "IND_MOV", "CST_ICMS", "CFOP", "COD_NAT", "VL_BC_ICMS",
-        "ALIQ_ICMS", "VL_ICMS", "VL_BC_ICMS_ST", "ALIQ_ST", "VL_ICMS_ST",
-        "IND_APUR", "CST_IPI", "COD_ENQ", "VL_BC_IPI", "ALIQ_IPI", "VL_IPI",
-        "CST_PIS", "VL_BC_PIS", "ALIQ_PIS", "QUANT_BC_PIS", "ALIQ_PIS_QUANT",
-        "VL_PIS", "CST_COFINS", "VL_BC_COFINS", "ALIQ_COFINS",
-        "QUANT_BC_COFINS", "ALIQ_COFINS_QUANT", "VL_COFINS", "COD_CTA"
-    ],
-    # etc. for other C blocks if needed
-}
-
-
-def parse_block_c(lines, file_ids):
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from services.block_store import BlockTable
+from services.layouts import LAYOUT_HEADERS
+
+# Guards against a malformed hierarchy pointing back at itself.
+MAX_CHAIN_DEPTH = 8
+
+
+def group_files(tables: List[BlockTable]) -> List[Dict[str, BlockTable]]:
     """
-    Given the lines for "Block C" (C001, C010, C100, C170, etc.),
-    returns a single FortuneSheet-style sheet with one row per C170.
+    Splits a document's tables back into the files they were parsed from.
 
-    :param lines: List of strings (each line from the .txt, already split or not).
-    :param file_ids: Dict with { "ID_DT_INI": "...", "ID_DT_FIN": "...", "ID_CNPJ": "..." }
-                     to prepend to each row.
-    :return: A dict representing one FortuneSheet "sheet" with merged columns.
+    A file yields at most one table per record code, so tables with the same
+    layout and file IDs go to the first file of those IDs that does not have
+    their code yet. This works both for tables in parse order and in sheet
+    order (as saved after an edit).
     """
+    files: List[Dict[str, BlockTable]] = []
+    by_ids: Dict[tuple, List[Dict[str, BlockTable]]] = {}
+    for table in tables:
+        candidates = by_ids.setdefault((table.layout, tuple(table.id_values)), [])
+        target = next((file_tables for file_tables in candidates if table.name not in file_tables), None)
+        if target is None:
+            target = {}
+            candidates.append(target)
+            files.append(target)
+        target[table.name] = table
+    return files
+
+
+def chain_codes(record_code: str) -> List[str]:
+    """
+    Record codes a flattened view of `record_code` is built from: the record and
+    its ancestors in any layout (e.g. C170, C100, C010), so only those blocks
+    have to be loaded.
+    """
+    codes = [record_code]
+    for headers in LAYOUT_HEADERS.values():
+        code = record_code
+        for _ in range(MAX_CHAIN_DEPTH):
+            code = headers.get_parent(code)
+            if not code:
+                break
+            if code not in codes:
+                codes.append(code)
+    return codes
+
+
+def record_chain(leaf: BlockTable, file_tables: Dict[str, BlockTable]) -> List[BlockTable]:
+    """Tables from the top-level ancestor down to `leaf` (e.g. C010, C100, C170)."""
+    chain = [leaf]
+    while len(chain) < MAX_CHAIN_DEPTH:
+        child = chain[-1]
+        parent = file_tables.get(child.parent) if child.parent else None
+        if parent is None or child.parent_rows is None:
+            break
+        chain.append(parent)
+    return chain[::-1]
+
+
+def flatten_chain(leaf: BlockTable, file_tables: Dict[str, BlockTable]) -> Optional[BlockTable]:
+    """
+    Builds the denormalized view of a child record: one row per `leaf` row, with
+    the columns of every ancestor record it belongs to.
 
-    # Context dicts
-    c001_data = {}
-    c010_data = {}
-    c100_data = {}
+    The parent rows recorded at parse time are followed up the chain with numpy
+    fancy indexing, so each ancestor column is gathered in a single vectorized
+    take instead of merging row dicts. Ancestor columns are prefixed with their
+    record code (C100.NUM_DOC); their REG columns are left out.
 
-    merged_rows = []  # final row data, each a dict of {col_name: value}
+    Args:
+        leaf (BlockTable): The child table, e.g. the C170 of one file.
+        file_tables (Dict[str, BlockTable]): Every table of the same file, by code.
 
-    for line in lines:
-        # Split line by "|", removing empty parts if there's a leading/trailing "|"
-        parts = [p.strip() for p in line.strip().split("|") if p.strip() != ""]
-        if not parts:
-            continue
+    Returns:
+        BlockTable: The flattened table, or None when `leaf` has no parent links.
+    """
+    chain = record_chain(leaf, file_tables)
+    if len(chain) < 2:
+        return None
+
+    # Row of each chain table for every leaf row, leaf first; -1 where there is none.
+    row_indexes = [np.arange(leaf.num_rows, dtype=np.int64)]
+    for parent, child in reversed(list(zip(chain, chain[1:]))):
+        # The trailing -1 makes a missing parent (-1) stay missing one level up.
+        links = np.append(np.asarray(child.parent_rows, dtype=np.int64), -1)
+        links[links >= parent.num_rows] = -1
+        row_indexes.append(links[row_indexes[-1]])
+    row_indexes.reverse()
+
+    headers, types, columns = [], [], []
+    for table, rows in zip(chain, row_indexes):
+        is_leaf = table is leaf
+        for col_idx, header in enumerate(table.headers):
+            if not is_leaf and header == "REG":
+                continue
+            # The trailing "" is picked up by the -1 rows.
+            values = np.array(table.columns[col_idx] + [""], dtype=object)
+            headers.append(header if is_leaf else f"{table.name}.{header}")
+            types.append(table.types[col_idx])
+            columns.append(values[rows].tolist())
+
+    return BlockTable(
+        " > ".join(table.name for table in chain),
+        headers,
+        leaf.file_ids,
+        columns=columns,
+        num_rows=leaf.num_rows,
+        layout=leaf.layout,
+        version=leaf.version,
+        types=types,
+    )
 
-        block_code = parts[0]
-        if block_code not in BLOCK_HEADERS:
-            # If it's not one of the known blocks, skip or handle as needed
-            continue
 
-        # Build a dictionary for this line's block data
-        block_cols = BLOCK_HEADERS[block_code]
-        block_data = {}
-        for i, col_name in enumerate(block_cols):
-            if i < len(parts):
-                block_data[col_name] = parts[i]
-            else:
-                block_data[col_name] = ""
-
-        # Now store or merge based on which block we have
-        if block_code == "C001":
-            c001_data = block_data
-        elif block_code == "C010":
-            c010_data = block_data
-        elif block_code == "C100":
-            c100_data = block_data
-        elif block_code == "C170":
-            # Produce a row merging the context + C170 + file_ids
-            row = {}
-
-            # File-level IDs first
-            row["ID_DT_INI"] = file_ids.get("ID_DT_INI", "")
-            row["ID_DT_FIN"] = file_ids.get("ID_DT_FIN", "")
-            row["ID_CNPJ"]   = file_ids.get("ID_CNPJ", "")
-
-            # Merge C001, C010, C100, then C170
-            row.update(c001_data)
-            row.update(c010_data)
-            row.update(c100_data)
-            row.update(block_data)
-
-            merged_rows.append(row)
-
-        else:
-            # If you want to handle other lines like C110, C111, etc., do so similarly
-            # or ignore them if you only care about C001/C010/C100/C170
-            pass
-
-    # === Build FortuneSheet from merged_rows === #
-
-    # Decide the final column order. We'll combine:
-    #   - ID columns
-    #   - The headers for C001, C010, C100, and C170
-    # in one list, but you can reorder or remove duplicates as needed.
-    combined_headers = (
-        ["ID_DT_INI", "ID_DT_FIN", "ID_CNPJ"]
-        + BLOCK_HEADERS.get("C001", [])
-        + BLOCK_HEADERS.get("C010", [])
-        + BLOCK_HEADERS.get("C100", [])
-        + BLOCK_HEADERS.get("C170", [])
-    )
+def flatten_tables(tables: List[BlockTable], record_code: str) -> List[BlockTable]:
+    """
+    Flattens `record_code` with its ancestors in every file of a document.
+
+    Views are only built for the requested record, when requested.
 
-    # Remove duplicates if any columns appear in multiple blocks
-    # (e.g., 'REG' might appear in each block)
-    seen = set()
-    final_columns = []
-    for col in combined_headers:
-        if col not in seen:
-            seen.add(col)
-            final_columns.append(col)
-
-    # 1) Header row (r=0)
-    celldata = []
-    for col_idx, col_name in enumerate(final_columns):
-        celldata.append({
-            "r": 0,
-            "c": col_idx,
-            "v": {
-                "v": col_name,
-                "m": col_name,
-                "ct": {"fa": "General", "t": "g"},
-                "bl": 1
-            }
-        })
-
-    # 2) Data rows (r=1..N)
-    row_idx = 1
-    for row_dict in merged_rows:
-        for col_idx, col_name in enumerate(final_columns):
-            value = row_dict.get(col_name, "")
-            celldata.append({
-                "r": row_idx,
-                "c": col_idx,
-                "v": {
-                    "v": value,
-                    "m": str(value),
-                    "ct": {"fa": "General", "t": "g"}
-                }
-            })
-        row_idx += 1
-
-    # Return a single sheet named "Block C" (or any name you want)
-    return {
-        "name": "Block C",
-        "celldata": celldata
-    }
+    Returns:
+        List[BlockTable]: One flattened table per file that has `record_code`.
+    """
+    flattened = []
+    for file_tables in group_files(tables):
+        leaf = file_tables.get(record_code)
+        if leaf is None:
+            continue
+        table = flatten_chain(leaf, file_tables)
+        if table is not None:
+            flattened.append(table)
+    return flattened
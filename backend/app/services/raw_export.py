@@ -0,0 +1,325 @@
+# raw_export.py
+import os
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
+
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from mongodb import sheet_chunks_collection
+from services.block_store import ID_HEADERS
+from services.chunk_edits import apply_entries, chunk_key, row_id, touched_keys
+from services.document_store import (
+    CHUNK_SORT, GROUP_BY_FILE_IDS, chunk_columns, filtered_chunks_query, journal_entries, read_point,
+)
+from services.export_utils import document_batches, txt_parts
+from services.file_processing import PARSER_VERSION, detect_encoding
+from services.file_store import load_index, object_path
+from services.layouts import EFD_CONTRIBUICOES, get_layout
+from services.record_counts import RecordCounts, is_block_closer, is_totals
+
+# Bytes of output collected before a piece is sent.
+COPY_BYTES = 1024 * 1024
+
+# Chunk fields needed to tell which rows of a file were edited, without the data.
+FILE_PROJECTION = {
+    "block": 1, "layout": 1, "file_seq": 1, "block_seq": 1, "chunk": 1, "generation": 1,
+    "row_start": 1, "num_rows": 1, "valid_from": 1, "schema.version": 1,
+}
+
+
+class BlockOverlay:
+    """
+    Edited rows of one block of a raw file, by ordinal (the record's position
+    among the file's records of that code): their current values, the rows
+    that were deleted and the rows inserted after each ordinal (-1: before
+    the first one). Rows not in the overlay are unchanged.
+    """
+
+    __slots__ = ("rows", "removed", "inserted", "width")
+
+    def __init__(self, width: int):
+        self.rows: Dict[int, List[str]] = {}
+        self.removed = set()
+        self.inserted: Dict[int, List[List[str]]] = {}
+        self.width = width
+
+
+def _ordinal(row: str) -> Optional[int]:
+    """Ordinal of a stored row in its file, or None for rows inserted since."""
+    position = row.split(":", 1)[1]
+    return None if position.startswith("+") else int(position)
+
+
+async def _file_overlays(doc: Dict, query: Dict, entries: List[Dict], touched: set,
+                         generation: str, file_seq: int) -> Dict[str, Optional[BlockOverlay]]:
+    """
+    Overlay of each block of one stored file: None for blocks with no edits.
+    Only chunks that were edited (pending in the journal or compacted) are read.
+    Blocks missing from the result are not stored (deleted, or filtered out).
+    """
+    metas = await sheet_chunks_collection.find(
+        {**query, "generation": generation, "file_seq": file_seq}, FILE_PROJECTION
+    ).sort(CHUNK_SORT).to_list(None)
+    by_block: Dict[str, List[Dict]] = {}
+    for meta in metas:
+        by_block.setdefault(meta["block"], []).append(meta)
+
+    overlays: Dict[str, Optional[BlockOverlay]] = {}
+    for code, chunks in by_block.items():
+        dirty = [chunk for chunk in chunks if "valid_from" in chunk or chunk_key(chunk) in touched]
+        if not dirty:
+            overlays[code] = None
+            continue
+        version = (chunks[0].get("schema") or {}).get("version", "")
+        overlay = overlays[code] = BlockOverlay(get_layout(chunks[0].get("layout") or EFD_CONTRIBUICOES, version).schema(code).width)
+        # Original rows of a chunk end where the next chunk starts.
+        ends = {chunk["chunk"]: following["row_start"] for chunk, following in zip(chunks, chunks[1:])}
+        full = await sheet_chunks_collection.find({"_id": {"$in": [chunk["_id"] for chunk in dirty]}}).to_list(None)
+        for chunk in full:
+            if chunk_key(chunk) in touched:
+                chunk = apply_entries([chunk], entries, links=False)[0]
+            columns, _ = chunk_columns(chunk)
+            present = set()
+            previous = chunk["row_start"] - 1
+            for offset in range(chunk["row_count"]):
+                values = [column[offset] for column in columns]
+                ordinal = _ordinal(row_id(chunk, offset))
+                if ordinal is None:
+                    overlay.inserted.setdefault(previous, []).append(values)
+                else:
+                    overlay.rows[ordinal] = values
+                    present.add(ordinal)
+                    previous = ordinal
+            end = ends.get(chunk["chunk"], chunk.get("num_rows", chunk["row_start"]))
+            overlay.removed.update(set(range(chunk["row_start"], end)) - present)
+    return overlays
+
+
+# === 🔹 Writing Raw Lines === #
+def _raw_lines(file_path: str) -> Iterator[Tuple[bytes, bytes]]:
+    """(content, line end) of every line, split like file_processing.iter_sped_lines."""
+    with open(file_path, "rb") as f:
+        for raw_line in f:
+            content = raw_line.rstrip(b"\r\n")
+            ending = raw_line[len(content):]
+            if b"\r" in content:
+                pieces = content.split(b"\r")
+                for piece in pieces[:-1]:
+                    yield piece, b"\r"
+                yield pieces[-1], ending
+            else:
+                yield content, ending
+
+
+def _fields(content: bytes, encoding: str) -> List[str]:
+    """Fields of a line as the parser reads them."""
+    return [field.strip() for field in content.decode(encoding, errors="ignore").strip().strip("|").split("|")]
+
+
+def _record(values: List[str], width: int, encoding: str) -> bytes:
+    """A record as a line in the file's encoding, without padding beyond `width` fields."""
+    used = max((position + 1 for position, value in enumerate(values) if value != ""), default=0)
+    fields = values[:max(width, used)]
+    return ("|" + "|".join(fields) + "|").encode(encoding, errors="replace")
+
+
+def _current_line(content: bytes, values: List[str], encoding: str) -> bytes:
+    """
+    The original line with the fields that changed replaced: unchanged
+    fields keep their original bytes, only the new values are encoded.
+    """
+    fields = _fields(content, encoding)
+    if fields + [""] * (len(values) - len(fields)) == values:
+        return content
+    raw = content.strip().strip(b"|").split(b"|")
+    if len(raw) != len(fields):
+        return _record(values, len(fields), encoding)
+    used = max((position + 1 for position, value in enumerate(values) if value != ""), default=0)
+    pieces = []
+    for position in range(max(len(fields), used)):
+        value = values[position] if position < len(values) else ""
+        if position < len(fields) and fields[position] == value:
+            pieces.append(raw[position])
+        else:
+            pieces.append(value.encode(encoding, errors="replace"))
+    return b"|" + b"|".join(pieces) + b"|"
+
+
+def _copy_file(file_path: str) -> Iterator[bytes]:
+    with open(file_path, "rb") as f:
+        while True:
+            piece = f.read(COPY_BYTES)
+            if not piece:
+                break
+            yield piece
+
+
+def _overlaid_lines(file_path: str, encoding: str, overlays: Dict[str, Optional[BlockOverlay]],
+                    keep_unparsed: bool) -> Iterator[Tuple[str, bytes, bytes]]:
+    """
+    (record code, content, line end) of a raw file with the overlays applied,
+    in its original record order.
+
+    Records are counted per code exactly as parse_txt counts table rows, so the
+    n-th record of a code is row n of its stored table. Lines the parser never
+    stored (unreadable codes, the digital signature after 9999) come with an
+    empty code if `keep_unparsed`; records of blocks that are not stored are
+    left out.
+    """
+    ordinals: Dict[str, int] = {}
+    ended = False
+    for content, ending in _raw_lines(file_path):
+        code = "" if ended else content[:64].decode(encoding, errors="ignore").strip().strip("|").split("|")[0].strip()
+        if not code.isalnum():
+            if keep_unparsed:
+                yield "", content, ending
+            continue
+        ordinal = ordinals.get(code, 0)
+        ordinals[code] = ordinal + 1
+        ended = code == "9999"
+        if code not in overlays:
+            continue
+        overlay = overlays[code]
+        if overlay is None:
+            yield code, content, ending
+            continue
+        line_end = ending or b"\r\n"
+        if ordinal == 0:
+            for values in overlay.inserted.get(-1, ()):
+                yield code, _record(values, overlay.width, encoding), line_end
+        inserted = overlay.inserted.get(ordinal, ())
+        if ordinal not in overlay.removed:
+            line = _current_line(content, overlay.rows[ordinal], encoding) if ordinal in overlay.rows else content
+            yield code, line, (line_end if inserted else ending)
+        for values in inserted:
+            yield code, _record(values, overlay.width, encoding), line_end
+
+
+def _recounted_lines(lines: Iterator[Tuple[str, bytes, bytes]], encoding: str) -> Iterator[Tuple[bytes, bytes]]:
+    """
+    (content, line end) of the lines with the block closers and block 9
+    written again from the records that remain (see RecordCounts). Records
+    whose counts did not change keep their original bytes.
+    """
+    counts = RecordCounts()
+    held: List[Tuple[bytes, bytes]] = []
+
+    def closing() -> Iterator[Tuple[bytes, bytes]]:
+        records = counts.closing_records()
+        if records == counts.held:
+            yield from held
+            return
+        # The file keeps its line ends, and its last line its lack of one.
+        line_end = held[0][1] or b"\r\n"
+        for position, fields in enumerate(records, 1 - len(records)):
+            yield _record(fields, len(fields), encoding), (line_end if position else held[-1][1])
+
+    for code, content, ending in lines:
+        if is_totals(code):
+            counts.hold(_fields(content, encoding))
+            held.append((content, ending))
+            if code == "9999":
+                yield from closing()
+                held.clear()
+            continue
+        if is_block_closer(code):
+            fields = _fields(content, encoding)
+            closer = counts.closer(fields)
+            yield _current_line(content, closer, encoding), ending
+            continue
+        counts.count(code)
+        yield content, ending
+    if held:
+        yield from closing()
+
+
+def _edited_file(file_path: str, encoding: str, overlays: Dict[str, Optional[BlockOverlay]],
+                 whole_file: bool) -> Iterator[bytes]:
+    """Streams a raw file with the overlays applied, in pieces of about COPY_BYTES."""
+    lines = _overlaid_lines(file_path, encoding, overlays, keep_unparsed=whole_file)
+    if whole_file:
+        lines = _recounted_lines(lines, encoding)
+    else:
+        lines = ((content, ending) for _, content, ending in lines)
+    output = bytearray()
+    for content, ending in lines:
+        output += content
+        output += ending
+        if len(output) >= COPY_BYTES:
+            yield bytes(output)
+            output.clear()
+    yield bytes(output)
+
+
+def _file_pieces(file_path: str, file_hash: str, overlays: Dict[str, Optional[BlockOverlay]],
+                 whole_file: bool) -> Iterator[bytes]:
+    """
+    The exported bytes of one raw file: copied as they are when nothing
+    changed, else with the edits and, for whole files, the counters updated.
+    """
+    index = load_index(file_hash, PARSER_VERSION)
+    encoding = index.encoding if index is not None else detect_encoding(file_path)
+    unchanged = all(overlay is None for overlay in overlays.values())
+    if whole_file and unchanged and index is not None and set(index.codes()) <= set(overlays):
+        return _copy_file(file_path)
+    return _edited_file(file_path, encoding, overlays, whole_file)
+
+
+# === 🔹 TXT Export === #
+async def raw_txt_parts(doc: Dict, blocks: Optional[List[str]] = None,
+                        file_ids: Optional[Dict] = None) -> AsyncIterator[Tuple[str, Union[str, bytes]]]:
+    """
+    TXT files of a stored document, one per file-level IDs (as txt_parts).
+
+    Files stored with their raw upload (partitions with a file_hash) are
+    streamed from the original lines, in their original order and encoding:
+    unchanged files come out byte-identical, and only records edited since
+    the upload are re-serialized (from the edit journal and compacted chunks),
+    along with the block closers and block 9 if rows were added or deleted.
+    Other files (uploaded before raw files were tracked, or saved from the
+    grid) are rebuilt from the stored rows.
+
+    Args:
+        doc (Dict): The document record.
+        blocks, file_ids: Same filters as load_document_tables. With `blocks`,
+            only the records of those blocks are written.
+
+    Yields:
+        (file name, content) pieces for zip_stream.
+    """
+    if "tables" in doc or "sheets" in doc:
+        async for part in txt_parts(document_batches(doc, GROUP_BY_FILE_IDS, blocks, file_ids), recount=not blocks):
+            yield part
+        return
+
+    snapshot, version = read_point(doc)
+    query = filtered_chunks_query(doc, snapshot, blocks, file_ids, version)
+    entries = await journal_entries(doc, snapshot, version)
+    touched = touched_keys(entries)
+    hashes = {
+        (partition["generation"], partition["file_seq"]): partition["file_hash"]
+        for partition in doc.get("partitions", {}).values() if partition.get("file_hash")
+    }
+
+    # Stored files by IDs, in upload order.
+    files: Dict[tuple, List[tuple]] = {}
+    heads = sheet_chunks_collection.find({**query, "chunk": 0}, {"file_ids": 1, "file_seq": 1, "generation": 1})
+    async for head in heads.sort(CHUNK_SORT):
+        ids = tuple(head.get("file_ids", {}).get(key, "") for key in ID_HEADERS)
+        members = files.setdefault(ids, [])
+        if (head.get("generation"), head["file_seq"]) not in members:
+            members.append((head.get("generation"), head["file_seq"]))
+
+    for ids, members in files.items():
+        file_name = "_".join(ids) + ".txt"
+        if not all(member in hashes and os.path.exists(object_path(hashes[member])) for member in members):
+            exact_ids = {**(file_ids or {}), **dict(zip(ID_HEADERS, ids))}
+            batches = document_batches(doc, GROUP_BY_FILE_IDS, blocks, exact_ids)
+            async for part in txt_parts(batches, recount=not blocks):
+                yield part
+            continue
+        for generation, file_seq in members:
+            file_hash = hashes[(generation, file_seq)]
+            overlays = await _file_overlays(doc, query, entries, touched, generation, file_seq)
+            pieces = await run_in_threadpool(_file_pieces, object_path(file_hash), file_hash, overlays, not blocks)
+            async for piece in iterate_in_threadpool(pieces):
+                yield file_name, piece
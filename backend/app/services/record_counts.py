@@ -0,0 +1,97 @@
+# record_counts.py
+from typing import Dict, List, Sequence
+
+# Block 9 holds the record totals of the file (9001, 9900, 9990, 9999).
+TOTALS_BLOCK = "9"
+TOTALS_CODES = ["9001", "9900", "9990", "9999"]
+
+
+def is_block_closer(code: str) -> bool:
+    """Block closing records (0990, C990, ...) count the lines of their block."""
+    return len(code) == 4 and code.endswith("990") and not code.startswith(TOTALS_BLOCK)
+
+
+def is_totals(code: str) -> bool:
+    return code.startswith(TOTALS_BLOCK)
+
+
+class RecordCounts:
+    """
+    Running totals of the records of one SPED file, kept while its lines are
+    written, so the counters that depend on them can be written again after
+    rows were added or deleted: QTD_LIN of each block closer (x990) and
+    block 9 (one 9900 per record type, 9990 and 9999).
+
+    Block 9 comes last in the file, so its records are held back (hold) and
+    written again from the totals once the rest of the file is counted
+    (closing_records). Nothing written needs to be read again.
+    """
+
+    def __init__(self):
+        self.records: Dict[str, int] = {}
+        self.blocks: Dict[str, int] = {}
+        self.lines = 0
+        self.held: List[List[str]] = []
+
+    def count(self, code: str) -> None:
+        # Lines without a record code are written but not counted (the parser skips them).
+        if not code.isalnum():
+            return
+        self.records[code] = self.records.get(code, 0) + 1
+        self.blocks[code[0]] = self.blocks.get(code[0], 0) + 1
+        self.lines += 1
+
+    def closer(self, fields: List[str]) -> List[str]:
+        """A block closer counted, with the line count of its block (itself included)."""
+        self.count(fields[0])
+        return [fields[0], str(self.blocks[fields[0][0]]), *fields[2:]]
+
+    def hold(self, fields: List[str]) -> None:
+        """Keeps a block 9 record of the file; its 9900 records give the order of the totals."""
+        self.held.append(fields)
+
+    def rows(self, rows: Sequence[Sequence[str]]) -> List[Sequence[str]]:
+        """The rows to write now: counted, block closers updated, block 9 held back."""
+        written = []
+        for row in rows:
+            code = row[0] if row else ""
+            if is_totals(code):
+                self.hold(list(row))
+            elif is_block_closer(code):
+                written.append(self.closer(list(row)))
+            else:
+                self.count(code)
+                written.append(row)
+        return written
+
+    def _totals_order(self) -> List[str]:
+        """
+        Record types listed in 9900: as in the file's own 9900 records (layouts
+        and PVA versions sort them differently), without the types that are
+        gone; new types go before the block 9 ones, in order of appearance.
+        """
+        present = [*self.records, *TOTALS_CODES]
+        listed = [fields[1] for fields in self.held if fields[0] == "9900" and len(fields) > 1]
+        order = [code for code in dict.fromkeys(listed) if code in self.records or code in TOTALS_CODES]
+        missing = [code for code in present if code not in order]
+        position = next((i for i, code in enumerate(order) if is_totals(code)), len(order))
+        order[position:position] = [code for code in missing if not is_totals(code)]
+        return order + [code for code in missing if is_totals(code)]
+
+    def closing_records(self) -> List[List[str]]:
+        """
+        Block 9 for the lines counted so far (9001, the 9900 totals, 9990 and
+        9999), or nothing if the file had no block 9 (e.g. a partial export).
+        """
+        if not self.held:
+            return []
+        order = self._totals_order()
+        block_lines = len(order) + 3
+        totals = {**self.records, "9001": 1, "9900": len(order), "9990": 1, "9999": 1}
+        opening = next((fields for fields in self.held if fields[0] == "9001"), ["9001", "0"])
+        return [
+            opening,
+            *(["9900", code, str(totals[code])] for code in order),
+            ["9990", str(block_lines)],
+            ["9999", str(self.lines + block_lines)],
+        ]
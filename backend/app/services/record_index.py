@@ -0,0 +1,93 @@
+# record_index.py
+import mmap
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional
+
+from services.layouts import EFD_CONTRIBUICOES, Layout, get_layout
+
+
+class RecordIndex:
+    """
+    Byte-level index of a raw SPED file.
+
+    For every record code it keeps the byte offset and length of each of its
+    lines, in file order, so single records can be decoded straight from an
+    mmap of the file. For child records (the parents of the file's layout) it also
+    keeps the ordinal of the parent line each child belongs to, which gives the
+    parent/child ranges (C100 -> C170, A100 -> A170, ...) with a binary search.
+    """
+
+    __slots__ = ("encoding", "offsets", "lengths", "parents", "layout_name", "version")
+
+    def __init__(self, encoding: str = "utf-8"):
+        self.encoding = encoding
+        self.offsets: Dict[str, array] = {}
+        self.lengths: Dict[str, array] = {}
+        self.parents: Dict[str, array] = {}
+        self.layout_name = EFD_CONTRIBUICOES
+        self.version = ""
+
+    @property
+    def layout(self) -> Layout:
+        return get_layout(self.layout_name, self.version)
+
+    def add(self, code: str, offset: int, length: int, parent_code: Optional[str] = None) -> None:
+        offsets = self.offsets.get(code)
+        if offsets is None:
+            offsets = self.offsets[code] = array("q")
+            self.lengths[code] = array("l")
+            if parent_code:
+                self.parents[code] = array("l")
+        offsets.append(offset)
+        self.lengths[code].append(length)
+
+        if parent_code:
+            # Ordinal of the latest parent line read so far (-1 if none yet).
+            self.parents[code].append(len(self.offsets.get(parent_code, ())) - 1)
+
+    def count(self, code: str) -> int:
+        return len(self.offsets.get(code, ()))
+
+    def codes(self) -> List[str]:
+        return list(self.offsets.keys())
+
+    def children(self, child_code: str, parent_ordinal: int) -> range:
+        """Ordinals of the child_code records that belong to the given parent line."""
+        parents = self.parents.get(child_code)
+        if parents is None:
+            return range(0)
+        return range(bisect_left(parents, parent_ordinal), bisect_right(parents, parent_ordinal))
+
+
+# === 🔹 Reading Records Through the Index === #
+def read_records(file_path: str, index: RecordIndex, code: str,
+                 ordinals: Optional[range] = None) -> List[List[str]]:
+    """
+    Decodes only the requested records of `code` from the raw file.
+
+    Args:
+        file_path (str): Path of the raw file the index was built from.
+        index (RecordIndex): The file's index.
+        code (str): Record code, e.g. "C170".
+        ordinals (range): Which occurrences to read (all of them by default).
+
+    Returns:
+        List[List[str]]: The fields of each record, in file order.
+    """
+    offsets = index.offsets.get(code)
+    if not offsets:
+        return []
+    lengths = index.lengths[code]
+    if ordinals is None:
+        ordinals = range(len(offsets))
+
+    records = []
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for ordinal in ordinals:
+            if ordinal < 0 or ordinal >= len(offsets):
+                continue
+            start = offsets[ordinal]
+            text = mm[start:start + lengths[ordinal]].decode(index.encoding, errors="ignore")
+            records.append(text.strip().strip("|").split("|"))
+    return records
@@ -0,0 +1,496 @@
+# sheet_edits.py
+import asyncio
+import logging
+import os
+from datetime import datetime
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+
+from mongodb import documents_collection, sheet_chunks_collection, sheet_edits_collection
+from services.block_store import ID_HEADERS, BlockTable
+from services.chunk_codec import default_codec, encode_column, encode_ints
+from services.chunk_edits import (
+    DELETE_ROW, EDIT_OPS, INSERT_ROW, SET_CELL, UPDATE_ROW,
+    ChunkState, apply_entries, chunk_key, row_id, touched_keys,
+)
+from services.document_store import (
+    CHUNK_SORT, active_chunks_query, chunk_bytes, chunk_columns, drop_history, journal_entries,
+    partition_key, read_point, replace_tables,
+)
+from services.parsing_logic import group_files
+
+logger = logging.getLogger(__name__)
+
+MAX_EDITS = 10000
+
+# Pending (not compacted) edits after which the journal is folded into a new
+# base snapshot, so reads never replay more than about this many edits.
+COMPACT_AFTER_EDITS = int(os.getenv("EDIT_COMPACTION_THRESHOLD", "500"))
+
+# Versions of history a compaction (run after edits and after a period is
+# uploaded again) keeps readable (0: all of them). Older journal entries, chunk
+# versions and replaced generations are dropped.
+HISTORY_VERSIONS = int(os.getenv("EDIT_HISTORY_VERSIONS", "100"))
+
+_compactions: Dict[str, asyncio.Task] = {}
+
+
+class EditConflict(Exception):
+    """The document changed since the version the edits were based on."""
+
+
+# === 🔹 Locating Rows === #
+class _SheetChunks:
+    """Chunks of one sheet at the latest version (pending edits applied) and where each row id lives."""
+
+    def __init__(self, chunks: List[Dict]):
+        self.chunks = chunks
+        self.schemas = {
+            (chunk["file_seq"], chunk["block_seq"]): chunk["schema"]
+            for chunk in chunks if chunk.get("schema")
+        }
+        self.row_chunks: Dict[str, int] = {}
+        for position, chunk in enumerate(chunks):
+            for offset in range(chunk["row_count"]):
+                self.row_chunks[row_id(chunk, offset)] = position
+
+    def locate(self, row: str) -> Dict:
+        if row not in self.row_chunks:
+            raise ValueError(f"Unknown row id: {row}")
+        return self.chunks[self.row_chunks[row]]
+
+    def headers(self, chunk: Dict) -> List[str]:
+        return self.schemas[(chunk["file_seq"], chunk["block_seq"])]["headers"]
+
+    def rows_before(self, chunk: Dict, states: Dict) -> int:
+        """Rows of the same file's table stored in the chunks before `chunk`."""
+        total = 0
+        for other in self.chunks:
+            if other is chunk:
+                return total
+            if (other["file_seq"], other["block_seq"]) == (chunk["file_seq"], chunk["block_seq"]):
+                state = states.get(other["_id"])
+                total += len(state.row_ids) if state else other["row_count"]
+        return total
+
+
+def _column_index(headers: List[str], column) -> int:
+    """Data column addressed by header name or by position in the sheet (ID columns first)."""
+    if isinstance(column, int):
+        if column < len(ID_HEADERS):
+            raise ValueError("ID columns cannot be edited")
+        index = column - len(ID_HEADERS)
+    elif column in ID_HEADERS:
+        raise ValueError("ID columns cannot be edited")
+    elif column in headers:
+        index = headers.index(column)
+    else:
+        raise ValueError(f"Unknown column: {column}")
+    if index >= len(headers):
+        raise ValueError(f"Unknown column: {column}")
+    return index
+
+
+def _row_values(headers: List[str], values) -> Dict[int, str]:
+    """Normalizes row values given as {header: value} or as a list of data values."""
+    if isinstance(values, dict):
+        return {_column_index(headers, column): str(value) for column, value in values.items()}
+    if isinstance(values, list):
+        if len(values) > len(headers):
+            raise ValueError("Row has more values than the sheet has columns")
+        return {index: str(value) for index, value in enumerate(values)}
+    raise ValueError("Row values must be an object or a list")
+
+
+async def _load_sheet(doc: Dict, sheet: str, snapshot: int, entries: List[Dict]) -> _SheetChunks:
+    query = {**active_chunks_query(doc, snapshot), "sheet": sheet}
+    projection = {"columns": 0, "parent_rows": 0}
+    chunks = await sheet_chunks_collection.find(query, projection).sort(CHUNK_SORT).to_list(None)
+    if not chunks:
+        raise ValueError(f"Unknown sheet: {sheet}")
+    touched = touched_keys(entries)
+    edited_ids = [chunk["_id"] for chunk in chunks if chunk_key(chunk) in touched]
+    if edited_ids:
+        full_chunks = await sheet_chunks_collection.find({"_id": {"$in": edited_ids}}).to_list(None)
+        edited = {chunk["_id"]: chunk for chunk in apply_entries(full_chunks, entries, links=False)}
+        chunks = [edited.get(chunk["_id"], chunk) for chunk in chunks]
+    return _SheetChunks(chunks)
+
+
+# === 🔹 Recording Edits === #
+async def record_edits(doc: Dict, edits: List[Dict], base_version: Optional[int] = None) -> Dict:
+    """
+    Validates a batch of cell/row edits and appends it to the edit journal.
+
+    The parsed data is not rewritten: reads replay the journal on top of it
+    until a compaction folds the journal into a new base snapshot. Each edit
+    names its sheet and addresses rows by row id (see GET
+    /documents/{doc_id}/sheets/{sheet}/rows):
+
+        {"op": "set", "sheet": "C170", "row_id": "5:12", "column": "VL_ITEM", "value": "10,00"}
+        {"op": "update_row", "sheet": "C170", "row_id": "5:12", "values": {"VL_ITEM": "10,00"}}
+        {"op": "insert", "sheet": "C170", "after_row_id": "5:12", "values": {...} | [...]}
+        {"op": "delete", "sheet": "C170", "row_id": "5:12"}
+
+    The journal keeps each edit resolved to the chunk it changes, with the
+    values it replaced, so the changes since the upload can be listed.
+
+    Args:
+        doc (Dict): The document record.
+        edits (List[Dict]): The edits, applied in order.
+        base_version (int): Version the client last read; if the document has
+            moved on since, EditConflict is raised and nothing is recorded.
+
+    Returns:
+        Dict: {"version", "applied", "inserted_row_ids"}.
+    """
+    if not edits:
+        raise ValueError("No edits given")
+    if len(edits) > MAX_EDITS:
+        raise ValueError(f"At most {MAX_EDITS} edits per request")
+
+    snapshot, version = read_point(doc)
+    entries = await journal_entries(doc, snapshot, version)
+    sheets: Dict[str, _SheetChunks] = {}
+    states: Dict[ObjectId, ChunkState] = {}
+    resolved, inserted = [], []
+
+    async def state_of(chunk: Dict) -> ChunkState:
+        if chunk["_id"] not in states:
+            full_chunk = chunk if "columns" in chunk else (
+                await sheet_chunks_collection.find_one({"_id": chunk["_id"]})
+            )
+            states[chunk["_id"]] = ChunkState(full_chunk)
+        return states[chunk["_id"]]
+
+    for edit in edits:
+        op, sheet = edit.get("op"), edit.get("sheet")
+        if op not in EDIT_OPS:
+            raise ValueError(f"Invalid op {op!r}, use one of: {', '.join(EDIT_OPS)}")
+        if sheet not in sheets:
+            sheets[sheet] = await _load_sheet(doc, sheet, snapshot, entries)
+        sheet_chunks = sheets[sheet]
+
+        after = edit.get("after_row_id")
+        if op == INSERT_ROW:
+            chunk = sheet_chunks.locate(after) if after else sheet_chunks.chunks[0]
+        else:
+            chunk = sheet_chunks.locate(edit.get("row_id"))
+        state = await state_of(chunk)
+        headers = sheet_chunks.headers(chunk)
+        entry = {
+            "op": op,
+            "sheet": sheet,
+            "generation": chunk.get("generation"),
+            "key": [chunk["file_seq"], chunk["block_seq"], chunk["chunk"]],
+        }
+
+        if op == INSERT_ROW:
+            values = _row_values(headers, edit.get("values") or {})
+            position = state.offset(after) + 1 if after else 0
+            entry.update(after_row_id=after, new_row_id=f"{chunk['file_seq']}:+{ObjectId()}")
+            entry["shift"] = {"block": chunk["block"], "delta": 1,
+                              "index": sheet_chunks.rows_before(chunk, states) + position}
+            inserted.append(entry["new_row_id"])
+        elif op == DELETE_ROW:
+            values = {}
+            offset = state.offset(edit["row_id"])
+            entry.update(row_id=edit["row_id"], previous=[column[offset] for column in state.columns])
+            entry["shift"] = {"block": chunk["block"], "delta": -1,
+                              "index": sheet_chunks.rows_before(chunk, states) + offset}
+        else:
+            if op == SET_CELL:
+                values = {_column_index(headers, edit.get("column")): str(edit.get("value", ""))}
+            else:
+                values = _row_values(headers, edit.get("values") or {})
+            offset = state.offset(edit["row_id"])
+            entry.update(row_id=edit["row_id"],
+                         previous={str(index): state.columns[index][offset] for index in values})
+
+        entry["values"] = {str(index): value for index, value in values.items()}
+        state.apply(entry)
+        if op == INSERT_ROW:
+            sheet_chunks.row_chunks[entry["new_row_id"]] = sheet_chunks.chunks.index(chunk)
+        resolved.append(entry)
+
+    # === 🔹 Claim the next version and append the journal entry === #
+    version_filter = {"_id": doc["_id"]}
+    if base_version is not None:
+        version_filter["version"] = base_version if base_version else {"$in": [0, None]}
+    updated = await documents_collection.find_one_and_update(
+        version_filter,
+        {"$inc": {"version": 1, "pending_edits": len(resolved)}, "$set": {"edited_at": datetime.utcnow()}},
+        projection={"version": 1, "pending_edits": 1}, return_document=True,
+    )
+    if updated is None:
+        raise EditConflict("Document was changed by another edit; reload and try again")
+    await sheet_edits_collection.insert_one({
+        "doc_id": str(doc["_id"]),
+        "version": updated["version"],
+        "edits": resolved,
+        "created_at": datetime.utcnow(),
+    })
+
+    if updated.get("pending_edits", 0) >= COMPACT_AFTER_EDITS:
+        schedule_compaction(str(doc["_id"]))
+    return {"version": updated["version"], "applied": len(resolved), "inserted_row_ids": inserted}
+
+
+async def list_edits(doc: Dict, since: int = 0, until: Optional[int] = None) -> List[Dict]:
+    """Journal entries of versions (since, until], e.g. every change since the upload."""
+    until = doc.get("version", 0) if until is None else until
+    return [
+        {"version": entry["version"], "created_at": entry["created_at"], "edits": entry["edits"]}
+        for entry in await journal_entries(doc, since, until)
+    ]
+
+
+# === 🔹 Saving the Grid === #
+def _row_edits(sheet: str, headers: List[str], stored: List[Tuple[str, Sequence[str]]],
+               rows: List[Sequence[str]]) -> List[Dict]:
+    """
+    Edits that turn the stored rows of one table, as (row id, values), into
+    `rows`: changed rows become update_row (of the changed cells only),
+    missing rows delete and new rows insert.
+    """
+    old = [values for _, values in stored]
+    # Rows that did not change at both ends are left out of the diff.
+    start = 0
+    while start < min(len(old), len(rows)) and old[start] == rows[start]:
+        start += 1
+    end = 0
+    while end < min(len(old), len(rows)) - start and old[-1 - end] == rows[-1 - end]:
+        end += 1
+    matcher = SequenceMatcher(None, old[start:len(old) - end], rows[start:len(rows) - end], autojunk=False)
+
+    edits = []
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == "equal":
+            continue
+        i1, i2, j1, j2 = i1 + start, i2 + start, j1 + start, j2 + start
+        paired = min(i2 - i1, j2 - j1)
+        for offset in range(paired):
+            changed = {
+                headers[col_idx]: value
+                for col_idx, (previous, value) in enumerate(zip(old[i1 + offset], rows[j1 + offset]))
+                if previous != value
+            }
+            if changed:
+                edits.append({"op": UPDATE_ROW, "sheet": sheet, "row_id": stored[i1 + offset][0], "values": changed})
+        for position in range(i1 + paired, i2):
+            edits.append({"op": DELETE_ROW, "sheet": sheet, "row_id": stored[position][0]})
+        new_rows = [list(row) for row in rows[j1 + paired:j2]]
+        if not new_rows:
+            continue
+        if i1 + paired:
+            anchor = stored[i1 + paired - 1][0]
+        else:
+            # Rows can only be inserted after another one: the first row takes
+            # the first new values and is inserted again after the new rows.
+            anchor = stored[0][0]
+            changed = {headers[col_idx]: value for col_idx, value in enumerate(new_rows[0])}
+            edits.append({"op": UPDATE_ROW, "sheet": sheet, "row_id": anchor, "values": changed})
+            new_rows = new_rows[1:] + [list(old[0])]
+        # Each insert goes right after the anchor, so they are made last to first.
+        for values in reversed(new_rows):
+            edits.append({"op": INSERT_ROW, "sheet": sheet, "after_row_id": anchor, "values": values})
+    return edits
+
+
+async def _partition_edits(doc: Dict, snapshot: int, version: int, entries: List[Dict], partition: Dict,
+                           file_tables: Dict[str, BlockTable]) -> Optional[List[Dict]]:
+    """
+    Edits that turn a stored partition into `file_tables`, or None if they
+    can't be expressed as row edits (blocks or columns were added or removed).
+    """
+    query = {**active_chunks_query(doc, snapshot, version), "generation": partition["generation"]}
+    touched = touched_keys(entries)
+    stored: Dict[str, Tuple[str, List[str], List]] = {}
+    async for chunk in sheet_chunks_collection.find(query).sort(CHUNK_SORT):
+        if chunk_key(chunk) in touched:
+            chunk = apply_entries([chunk], entries, links=False)[0]
+        if chunk.get("schema"):
+            stored[chunk["block"]] = (chunk["sheet"], chunk["schema"]["headers"], [])
+        columns, _ = chunk_columns(chunk)
+        rows = zip(*columns) if columns else [()] * chunk["row_count"]
+        stored[chunk["block"]][2].extend(
+            (row_id(chunk, offset), values) for offset, values in enumerate(rows)
+        )
+    if set(stored) != set(file_tables):
+        return None
+
+    edits = []
+    for block, table in file_tables.items():
+        sheet, headers, rows = stored[block]
+        width = len(headers)
+        new_rows = [tuple(row) for row in table.iter_rows()]
+        # The grid shows the widest file of a sheet; columns this file doesn't have stay empty.
+        if table.headers[:width] != headers or any(any(row[width:]) for row in new_rows):
+            return None
+        if len(set(headers)) != width or (new_rows and not rows):
+            return None
+        edits.extend(_row_edits(sheet, headers, rows, [row[:width] for row in new_rows]))
+    return edits
+
+
+async def save_tables(doc: Dict, tables: List[BlockTable]) -> None:
+    """
+    Saves the tables sent back by the grid (PUT /documents/{doc_id}).
+
+    Periods still backed by their raw upload (see raw_export) are compared
+    with the stored rows, and only the differences are recorded, as edits in
+    the journal: the period keeps its generation and raw file, so its TXT
+    export still copies the original lines. Other periods, and periods whose
+    blocks or columns changed, are written again (see replace_tables).
+    """
+    if "partitions" not in doc:
+        await replace_tables(doc, tables)
+        return
+
+    by_partition: Dict[str, List[Dict[str, BlockTable]]] = {}
+    for file_tables in group_files(tables):
+        by_partition.setdefault(partition_key(next(iter(file_tables.values()))), []).append(file_tables)
+
+    snapshot, version = read_point(doc)
+    entries = await journal_entries(doc, snapshot, version)
+    edits, kept, rewritten = [], [], []
+    for key, files in by_partition.items():
+        partition = doc["partitions"].get(key)
+        partition_edits = None
+        if partition and partition.get("file_hash") and len(files) == 1:
+            partition_edits = await _partition_edits(doc, snapshot, version, entries, partition, files[0])
+        if partition_edits is None:
+            rewritten.extend(table for file_tables in files for table in file_tables.values())
+        else:
+            kept.append(key)
+            edits.extend(partition_edits)
+
+    for start in range(0, len(edits), MAX_EDITS):
+        doc = await documents_collection.find_one({"_id": doc["_id"]})
+        await record_edits(doc, edits[start:start + MAX_EDITS])
+    if rewritten or set(doc["partitions"]) - set(kept):
+        doc = await documents_collection.find_one({"_id": doc["_id"]})
+        await replace_tables(doc, rewritten, keep=kept)
+
+
+# === 🔹 Compaction === #
+async def _affected_chunks(doc: Dict, snapshot: int, version: int, entries: List[Dict]) -> List[Dict]:
+    """Chunks the entries edit, plus every chunk of child records whose parent rows move."""
+    conditions = [
+        {"generation": generation, "file_seq": file_seq, "block_seq": block_seq, "chunk": chunk}
+        for generation, file_seq, block_seq, chunk in touched_keys(entries)
+    ]
+    shifted = {
+        (edit.get("generation"), edit["key"][0], edit["shift"]["block"])
+        for entry in entries for edit in entry["edits"] if edit.get("shift")
+    }
+    query = active_chunks_query(doc, snapshot, version)
+    for generation, file_seq, block in shifted:
+        children = await sheet_chunks_collection.find(
+            {**query, "generation": generation, "file_seq": file_seq, "chunk": 0, "schema.parent": block},
+            {"block_seq": 1},
+        ).to_list(None)
+        conditions.extend(
+            {"generation": generation, "file_seq": file_seq, "block_seq": child["block_seq"]}
+            for child in children
+        )
+    if not conditions:
+        return []
+    return await sheet_chunks_collection.find({**query, "$or": conditions}).sort(CHUNK_SORT).to_list(None)
+
+
+async def compact_document(doc_id: str) -> Optional[int]:
+    """
+    Folds the pending edit journal of a document into a new base snapshot.
+
+    Edited chunks are written as new chunk versions, valid from the compacted
+    version on. The versions they replace are kept (valid up to it), so a read
+    of an earlier version starts from the snapshot before and replays only the
+    journal in between. Switching to the new snapshot is a single update of
+    the document record: readers see either the old or the new base.
+
+    A document without pending edits that was rewritten since its base (a
+    period uploaded again, a sheet deleted) just gets its current version as
+    the new snapshot, so the history retention applies to those rewrites too.
+
+    Returns:
+        int: The version of the new snapshot, or None if there was nothing to fold.
+    """
+    doc = await documents_collection.find_one({"_id": ObjectId(doc_id)})
+    if doc is None:
+        return None
+    base, version = doc.get("base_version", 0), doc.get("version", 0)
+    base_filter = {"_id": doc["_id"], "base_version": base if base else {"$in": [0, None]}}
+    entries = await journal_entries(doc, base, version)
+    if not entries:
+        if version <= base:
+            await documents_collection.update_one(base_filter, {"$set": {"pending_edits": 0}})
+            return None
+        switched = await documents_collection.find_one_and_update(
+            {**base_filter, "version": version},
+            {"$set": {"base_version": version, "pending_edits": 0}, "$push": {"snapshots": version}},
+        )
+        if switched is None:
+            return None
+        await _trim_history(doc, version)
+        return version
+    folded = sum(len(entry["edits"]) for entry in entries)
+
+    chunks = await _affected_chunks(doc, base, version, entries)
+    codec = default_codec()
+    new_chunks, old_ids = [], []
+    for original, chunk in zip(chunks, apply_entries(chunks, entries)):
+        if chunk is original:
+            continue
+        new_chunk = {key: value for key, value in chunk.items() if key not in ("_id", "valid_to")}
+        new_chunk.update({
+            "codec": codec,
+            "columns": [encode_column(column, codec) for column in chunk["columns"]],
+            "parent_rows": encode_ints(chunk["parent_rows"], codec) if chunk["parent_rows"] is not None else None,
+            "valid_from": version,
+        })
+        new_chunk["bytes"] = chunk_bytes(new_chunk)
+        new_chunks.append(new_chunk)
+        old_ids.append(original["_id"])
+
+    if new_chunks:
+        await sheet_chunks_collection.insert_many(new_chunks)
+        await sheet_chunks_collection.update_many({"_id": {"$in": old_ids}}, {"$set": {"valid_to": version}})
+    switched = await documents_collection.find_one_and_update(
+        base_filter,
+        {"$set": {"base_version": version}, "$push": {"snapshots": version}, "$inc": {"pending_edits": -folded}},
+    )
+    if switched is None:
+        # Another compaction got there first; drop this one.
+        await sheet_chunks_collection.delete_many({"_id": {"$in": [chunk["_id"] for chunk in new_chunks]}})
+        await sheet_chunks_collection.update_many({"_id": {"$in": old_ids}}, {"$unset": {"valid_to": ""}})
+        return None
+
+    await _trim_history(doc, version)
+    return version
+
+
+async def _trim_history(doc: Dict, version: int) -> None:
+    """Drops the history older than HISTORY_VERSIONS versions once `version` is the base snapshot."""
+    if HISTORY_VERSIONS:
+        # History starts at the newest snapshot that still covers HISTORY_VERSIONS versions.
+        kept = [snapshot for snapshot in [*doc.get("snapshots", []), version] if snapshot <= version - HISTORY_VERSIONS]
+        if kept and max(kept) > doc.get("history_start", 0):
+            await drop_history(await documents_collection.find_one({"_id": doc["_id"]}), max(kept))
+
+
+async def _run_compaction(doc_id: str) -> None:
+    try:
+        await compact_document(doc_id)
+    except Exception:
+        logger.exception("Compaction of document %s failed", doc_id)
+    finally:
+        _compactions.pop(doc_id, None)
+
+
+def schedule_compaction(doc_id: str) -> None:
+    """Compacts the document's journal in the background, once at a time per document."""
+    if doc_id not in _compactions:
+        _compactions[doc_id] = asyncio.create_task(_run_compaction(doc_id))
@@ -0,0 +1,299 @@
+# streaming.py
+import json
+import zipfile
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+
+from bson import ObjectId
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import orjson
+except ImportError:  # falls back to the standard json module
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # MessagePack responses are optional
+    msgpack = None
+
+from mongodb import sheet_chunks_collection
+from services.block_store import (
+    ID_HEADERS, header_celldata, rows_to_celldata, tables_to_rows, tables_to_sheets,
+)
+from services.document_store import chunk_columns, document_catalog, load_document_tables
+from services.viewport import sheet_layout
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+ZIP_MEDIA_TYPE = "application/zip"
+
+# Bytes collected before a piece of the response is sent.
+FLUSH_BYTES = 64 * 1024
+
+# Rows expanded to FortuneSheet cells at a time (a cell is a dict, rows are lists).
+CELLDATA_BATCH_ROWS = 1000
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class StreamedList:
+    """
+    A list encoded batch by batch as it is produced.
+
+    `batches` is called once, when the list is reached in the response;
+    `count` (the total number of items) is only needed for MessagePack, whose
+    arrays start with their length.
+    """
+
+    def __init__(self, batches: Callable[[], AsyncIterator[List]], count: Optional[int] = None):
+        self.batches = batches
+        self.count = count
+
+
+def _is_streamed(value) -> bool:
+    return isinstance(value, StreamedList) or (
+        isinstance(value, dict) and any(isinstance(item, StreamedList) for item in value.values())
+    )
+
+
+# === 🔹 Encoders === #
+async def _json_parts(value) -> AsyncIterator[bytes]:
+    if isinstance(value, StreamedList):
+        yield b"["
+        first = True
+        async for batch in value.batches():
+            plain = []
+            for item in batch:
+                if not _is_streamed(item):
+                    plain.append(item)
+                    continue
+                if plain:
+                    yield (b"" if first else b",") + dumps(plain)[1:-1]
+                    first, plain = False, []
+                if not first:
+                    yield b","
+                first = False
+                async for part in _json_parts(item):
+                    yield part
+            if plain:
+                yield (b"" if first else b",") + dumps(plain)[1:-1]
+                first = False
+        yield b"]"
+    elif _is_streamed(value):
+        yield b"{"
+        for position, (key, item) in enumerate(value.items()):
+            yield (b"," if position else b"") + dumps(key) + b":"
+            async for part in _json_parts(item):
+                yield part
+        yield b"}"
+    else:
+        yield dumps(value)
+
+
+async def _msgpack_parts(value, packer) -> AsyncIterator[bytes]:
+    if isinstance(value, StreamedList):
+        if value.count is None:
+            raise ValueError("MessagePack arrays need their length up front")
+        yield packer.pack_array_header(value.count)
+        async for batch in value.batches():
+            buffer = bytearray()
+            for item in batch:
+                if not _is_streamed(item):
+                    buffer += packer.pack(item)
+                    continue
+                yield bytes(buffer)
+                buffer = bytearray()
+                async for part in _msgpack_parts(item, packer):
+                    yield part
+            yield bytes(buffer)
+    elif _is_streamed(value):
+        yield packer.pack_map_header(len(value))
+        for key, item in value.items():
+            yield packer.pack(key)
+            async for part in _msgpack_parts(item, packer):
+                yield part
+    else:
+        yield packer.pack(value)
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Media type of the response for an Accept header: MessagePack if asked for, else JSON."""
+    if accept and "msgpack" in accept:
+        if msgpack is None:
+            raise ValueError("MessagePack responses need the msgpack package")
+        return MSGPACK_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+async def encode(value, media_type: str = JSON_MEDIA_TYPE) -> AsyncIterator[bytes]:
+    """
+    Encodes a response incrementally: plain values are encoded at once, while
+    StreamedList values are encoded batch by batch, so only the batch being
+    encoded is held in memory. Pieces are sent as soon as FLUSH_BYTES are ready.
+    """
+    if media_type == MSGPACK_MEDIA_TYPE:
+        parts = _msgpack_parts(value, msgpack.Packer(default=_default, use_bin_type=True))
+    else:
+        parts = _json_parts(value)
+    buffer = bytearray()
+    async for part in parts:
+        buffer += part
+        if len(buffer) >= FLUSH_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+# === 🔹 ZIP Archives === #
+class _ZipSink:
+    """
+    Write-only target for zipfile. It can't seek, so zipfile writes each entry
+    in one pass (sizes go in a data descriptor after the data) and what it
+    writes can be sent right away.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data) -> int:
+        self.buffer += data
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+async def zip_stream(parts: AsyncIterator[Tuple[str, Union[str, bytes]]]) -> AsyncIterator[bytes]:
+    """
+    Builds a ZIP archive while its files are being produced.
+
+    `parts` gives (file name, piece of content) pairs; consecutive pieces with
+    the same name make up one file (strings are encoded as UTF-8). Pieces are
+    compressed as they come and the compressed bytes are sent every
+    FLUSH_BYTES, so neither the files nor the archive are ever held whole.
+    """
+    sink = _ZipSink()
+    archive = zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED)
+    entry, entry_name, pending = None, None, bytearray()
+    try:
+        async for name, piece in parts:
+            if name != entry_name:
+                if entry is not None:
+                    await run_in_threadpool(entry.write, bytes(pending))
+                    entry.close()
+                    pending.clear()
+                # Sizes aren't known up front: allow files over 4 GB.
+                entry, entry_name = archive.open(name, "w", force_zip64=True), name
+            pending += piece.encode("utf-8") if isinstance(piece, str) else piece
+            if len(pending) >= FLUSH_BYTES:
+                # Compression runs off the event loop.
+                await run_in_threadpool(entry.write, bytes(pending))
+                pending.clear()
+                if len(sink.buffer) >= FLUSH_BYTES:
+                    yield sink.take()
+        if entry is not None:
+            await run_in_threadpool(entry.write, bytes(pending))
+    finally:
+        # Also runs when the client goes away mid-download.
+        if entry is not None:
+            entry.close()
+        archive.close()
+    yield sink.take()
+
+
+# === 🔹 Document Sheets, Chunk by Chunk === #
+async def _chunk_rows(chunk: Dict, width: int) -> List[List[str]]:
+    """Rows of one chunk (ID columns first), padded to the sheet's width."""
+    if "columns" not in chunk:
+        stored = await sheet_chunks_collection.find_one({"_id": chunk["_id"]}, {"columns": 1, "codec": 1})
+        chunk = {**chunk, **stored}
+    columns = chunk_columns(chunk)[0]
+    id_values = [chunk["file_ids"].get(key, "") for key in ID_HEADERS]
+    padding = [""] * (width - len(ID_HEADERS) - len(columns))
+    return [id_values + list(values) + padding for values in zip(*columns)]
+
+
+def _rows_sheet(name: str, layout: Dict) -> Dict:
+    width = len(layout["headers"])
+
+    async def batches():
+        for chunk in layout["chunks"]:
+            yield await _chunk_rows(chunk, width)
+
+    return {
+        "name": name,
+        "headers": layout["headers"],
+        "types": layout["types"],
+        "rows": StreamedList(batches, layout["total_rows"]),
+    }
+
+
+def _celldata_sheet(name: str, layout: Dict) -> Dict:
+    width = len(layout["headers"])
+
+    async def batches():
+        yield header_celldata(layout["headers"])
+        row_idx = 1
+        for chunk in layout["chunks"]:
+            rows = await _chunk_rows(chunk, width)
+            for start in range(0, len(rows), CELLDATA_BATCH_ROWS):
+                batch = rows[start:start + CELLDATA_BATCH_ROWS]
+                yield rows_to_celldata(batch, row_idx, width)
+                row_idx += len(batch)
+
+    return {"name": name, "celldata": StreamedList(batches, width * (layout["total_rows"] + 1))}
+
+
+SHEET_STREAMS = {"rows": _rows_sheet, "celldata": _celldata_sheet}
+TABLE_FORMATS = {"rows": tables_to_rows, "celldata": tables_to_sheets}
+
+
+async def document_sheets(doc: Dict, format: str = "rows", version: Optional[int] = None) -> StreamedList:
+    """
+    The sheets of a document, read and encoded one chunk at a time.
+
+    Args:
+        doc (Dict): The document record.
+        format (str): "rows" (headers and plain row arrays) or "celldata" (FortuneSheet).
+        version (int): Read the document as it was at this version.
+
+    Returns:
+        StreamedList: The sheets, in the same shape as tables_to_rows / tables_to_sheets.
+    """
+    if "tables" in doc or "sheets" in doc:
+        # Not migrated yet: the data is embedded in the document record anyway.
+        sheets = TABLE_FORMATS[format](await load_document_tables(doc, version=version))
+
+        async def embedded():
+            yield sheets
+
+        return StreamedList(embedded, len(sheets))
+
+    names = [sheet["name"] for sheet in (await document_catalog(doc, version))["sheets"]]
+
+    async def batches():
+        for name in names:
+            layout = await sheet_layout(doc, name, version)
+            if layout is not None:
+                yield [SHEET_STREAMS[format](name, layout)]
+
+    return StreamedList(batches, len(names))
@@ -0,0 +1,171 @@
+# viewport.py
+from bisect import bisect_right
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from mongodb import sheet_chunks_collection
+from services import typed_columns
+from services.block_store import ID_HEADERS
+from services.chunk_edits import apply_entries, chunk_key, row_id, touched_keys
+from services.document_store import CHUNK_SORT, active_chunks_query, chunk_columns, journal_entries, read_point
+
+# Chunk fields needed to lay out a sheet, without any column data.
+META_PROJECTION = {
+    "file_seq": 1, "block_seq": 1, "chunk": 1, "row_start": 1, "row_count": 1,
+    "file_ids": 1, "schema": 1, "codec": 1, "row_ids": 1, "generation": 1,
+}
+
+
+async def sheet_layout(doc: Dict, sheet: str, version: Optional[int] = None) -> Optional[Dict]:
+    """
+    Chunks of a sheet (metadata only) with their global row offsets and the
+    sheet's headers. Chunks with pending journal edits are read in full and
+    edited in memory.
+    """
+    snapshot, version = read_point(doc, version)
+    query = {**active_chunks_query(doc, snapshot, version), "sheet": sheet}
+    chunks = await sheet_chunks_collection.find(query, META_PROJECTION).sort(CHUNK_SORT).to_list(None)
+    if not chunks:
+        return None
+
+    entries = await journal_entries(doc, snapshot, version)
+    touched = touched_keys(entries)
+    edited_ids = [chunk["_id"] for chunk in chunks if chunk_key(chunk) in touched]
+    if edited_ids:
+        full_chunks = await sheet_chunks_collection.find({"_id": {"$in": edited_ids}}).to_list(None)
+        edited = {chunk["_id"]: chunk for chunk in apply_entries(full_chunks, entries, links=False)}
+        chunks = [edited.get(chunk["_id"], chunk) for chunk in chunks]
+
+    headers, types, offsets, total = [], [], [], 0
+    for chunk in chunks:
+        schema = chunk.get("schema")
+        if schema and len(schema["headers"]) > len(headers):
+            headers, types = schema["headers"], schema.get("types") or []
+        offsets.append(total)
+        total += chunk["row_count"]
+    return {
+        "chunks": chunks,
+        "offsets": offsets,
+        "total_rows": total,
+        "version": version,
+        "headers": ID_HEADERS + headers,
+        "types": [typed_columns.CODE] * len(ID_HEADERS) + list(types),
+    }
+
+
+async def _read_columns(chunks: List[Dict], first_column: int, column_count: int) -> Dict:
+    """Decodes columns [first_column, first_column + column_count) of the given chunks."""
+    # Chunks edited in memory already hold their columns as plain lists.
+    decoded = {
+        chunk["_id"]: chunk["columns"][first_column:first_column + column_count]
+        for chunk in chunks if "columns" in chunk
+    }
+    stored_ids = [chunk["_id"] for chunk in chunks if "columns" not in chunk]
+    if stored_ids:
+        projection = {"columns": {"$slice": [first_column, column_count]}, "parent_rows": 1, "codec": 1}
+        cursor = sheet_chunks_collection.find({"_id": {"$in": stored_ids}}, projection)
+        decoded.update({chunk["_id"]: chunk_columns(chunk)[0] async for chunk in cursor})
+    return decoded
+
+
+async def _sort_order(layout: Dict, column: int, descending: bool) -> np.ndarray:
+    """Global row numbers of the sheet ordered by one column (typed when possible)."""
+    chunks = layout["chunks"]
+    if column < len(ID_HEADERS):
+        values = [
+            chunk["file_ids"].get(ID_HEADERS[column], "")
+            for chunk in chunks for _ in range(chunk["row_count"])
+        ]
+    else:
+        decoded = await _read_columns(chunks, column - len(ID_HEADERS), 1)
+        values = []
+        for chunk in chunks:
+            chunk_values = decoded.get(chunk["_id"]) or [[]]
+            column_values = chunk_values[0] if chunk_values else []
+            values.extend(column_values + [""] * (chunk["row_count"] - len(column_values)))
+
+    typed = typed_columns.decode_column(layout["types"][column], values)
+    keys = typed.sort_keys() if typed is not None else np.asarray(values, dtype=np.str_)
+    order = np.argsort(keys, kind="stable")
+    return order[::-1] if descending else order
+
+
+async def read_viewport(doc: Dict, sheet: str, row_start: int = 0, row_count: int = 100,
+                        col_start: int = 0, col_count: Optional[int] = None,
+                        sort: Optional[str] = None, descending: bool = False,
+                        version: Optional[int] = None) -> Optional[Dict]:
+    """
+    Reads a window of rows and columns of one sheet straight from its chunks.
+
+    Only chunk metadata is read to lay the sheet out; column data is fetched
+    only for the chunks that hold rows of the window, and only for the columns
+    of the window (a $slice projection over the per-column blobs). Sorting reads
+    the one sort column of the whole sheet.
+
+    Args:
+        doc (Dict): The document record.
+        sheet (str): Sheet name, e.g. "C170".
+        row_start (int), row_count (int): Row window (0-based, header excluded).
+        col_start (int), col_count (int): Column window, ID columns included.
+        sort (str): Header to sort by, e.g. "VL_ITEM".
+        descending (bool): Sort in descending order.
+        version (int): Read the sheet as it was at this version.
+
+    Returns:
+        Dict: The window with the sheet's total row and column counts, or None if
+            the sheet does not exist.
+    """
+    layout = await sheet_layout(doc, sheet, version)
+    if layout is None:
+        return None
+    headers, total_rows = layout["headers"], layout["total_rows"]
+    row_start, col_start = max(row_start, 0), max(col_start, 0)
+    col_stop = len(headers) if col_count is None else min(col_start + max(col_count, 0), len(headers))
+    row_stop = min(row_start + max(row_count, 0), total_rows)
+
+    if sort:
+        if sort not in headers:
+            raise ValueError(f"Unknown sort column: {sort}")
+        order = await _sort_order(layout, headers.index(sort), descending)
+        window = order[row_start:row_stop].tolist()
+    else:
+        window = list(range(row_start, row_stop))
+
+    # === 🔹 Fetch only the chunks and columns the window needs === #
+    chunks, offsets = layout["chunks"], layout["offsets"]
+    positions = [bisect_right(offsets, row) - 1 for row in window]
+    data_start = max(col_start - len(ID_HEADERS), 0)
+    data_count = max(col_stop - max(col_start, len(ID_HEADERS)), 0)
+    decoded = {}
+    if data_count and window:
+        needed = {chunks[position]["_id"]: chunks[position] for position in positions}
+        decoded = await _read_columns(list(needed.values()), data_start, data_count)
+
+    rows, row_ids = [], []
+    for row, position in zip(window, positions):
+        chunk = chunks[position]
+        offset = row - offsets[position]
+        id_values = [chunk["file_ids"].get(key, "") for key in ID_HEADERS]
+        data = [
+            column[offset] if offset < len(column) else ""
+            for column in decoded.get(chunk["_id"], [])
+        ]
+        data.extend([""] * (data_count - len(data)))
+        full_row = id_values[col_start:col_stop] + data
+        rows.append(full_row)
+        row_ids.append(row_id(chunk, offset))
+
+    return {
+        "sheet": sheet,
+        "version": layout["version"],
+        "total_rows": total_rows,
+        "total_columns": len(headers),
+        "row_start": row_start,
+        "col_start": col_start,
+        "headers": headers[col_start:col_stop],
+        "sort": sort,
+        "descending": descending,
+        "row_ids": row_ids,
+        "rows": rows,
+    }
@@ -0,0 +1,89 @@
+# conftest.py
+import glob
+import os
+import sys
+import time
+
+import mongomock_motor
+import pytest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+SAMPLES_DIR = os.path.join(APP_DIR, "saved_files", "67d3f2dafd38eb6919e72080")
+sys.path.insert(0, APP_DIR)
+
+import mongodb  # noqa: E402
+
+# The services bind the collections of the mongodb module at import time, so
+# they are swapped for in-memory ones before anything imports the app.
+mongodb.client = mongomock_motor.AsyncMongoMockClient()
+mongodb.db = mongodb.client["Tax-Track_PROD"]
+for _name, _collection in list(vars(mongodb).items()):
+    if _name.endswith("_collection"):
+        setattr(mongodb, _name, mongodb.db.get_collection(_collection.name))
+
+
+async def _connected():
+    pass
+
+
+mongodb.check_mongo_connection = _connected
+
+import main  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+def sample_files(pattern: str = "*") -> list:
+    """Paths of the sample SPED files matching `pattern`, sorted by name."""
+    return sorted(glob.glob(os.path.join(SAMPLES_DIR, pattern)))
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    """
+    A TestClient on the app, run from an empty directory (uploads and the
+    parse cache are written under ./saved_files). The collections are
+    emptied once the module's tests are done.
+    """
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("app"))
+    try:
+        with TestClient(main.app) as test_client:
+            yield test_client
+            for name in test_client.portal.call(mongodb.db.list_collection_names):
+                test_client.portal.call(mongodb.db.drop_collection, name)
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture(scope="module")
+def upload(client):
+    """Uploads files for a company and waits for the ingest job; returns the document id."""
+
+    def upload_files(paths, company_id):
+        files = [("files", (os.path.basename(path), open(path, "rb"), "text/plain")) for path in paths]
+        try:
+            response = client.post("/upload/", files=files, data={"company_id": company_id})
+        finally:
+            for _, (_, handle, _) in files:
+                handle.close()
+        assert response.status_code == 200, response.text
+        job_id = response.json()["data"][0]["job_id"]
+        for _ in range(1200):
+            job = client.get(f"/upload/jobs/{job_id}").json()
+            if job["status"] in ("done", "failed"):
+                break
+            time.sleep(0.1)
+        assert job["status"] == "done", job
+        return job["doc_id"]
+
+    return upload_files
+
+
+@pytest.fixture(scope="module")
+def stored(client):
+    """Runs a coroutine function on the app's event loop (e.g. to read the stored records)."""
+
+    def call(function, *args):
+        return client.portal.call(function, *args)
+
+    return call
@@ -0,0 +1,62 @@
+# test_chunk_codec.py
+import pytest
+
+import services.document_store as document_store
+from services.block_store import BlockTable
+from services.chunk_codec import (
+    JSON_CODEC, ZSTD_CODEC, decode_column, decode_ints, encode_column, encode_ints,
+)
+from services.document_store import _table_chunks, _table_from_chunks, chunk_columns
+
+
+@pytest.fixture(params=[JSON_CODEC, ZSTD_CODEC])
+def codec(request):
+    if request.param == ZSTD_CODEC:
+        pytest.importorskip("zstandard")
+    return request.param
+
+
+def test_columns_round_trip(codec):
+    values = ["C170", "", "Clínica São José", "1234,56", "|", '"quoted"']
+    assert decode_column(encode_column(values, codec), codec) == values
+    assert decode_column(encode_column([], codec), codec) == []
+
+
+def test_row_numbers_round_trip(codec):
+    rows = [-1, 0, 1, 2 ** 40]
+    assert decode_ints(encode_ints(rows, codec), codec) == rows
+    assert decode_ints(None, codec) is None
+
+
+def test_tables_round_trip_through_chunks(monkeypatch):
+    monkeypatch.setattr(document_store, "CHUNK_ROWS", 2)
+    file_ids = {"ID_DT_INI": "01042021", "ID_DT_FIN": "30042021", "ID_CNPJ": "01588099000157"}
+    table = BlockTable(
+        "C170", ["REG", "NUM_ITEM", "VL_ITEM"], file_ids,
+        columns=[["C170"] * 5, ["1", "2", "1", "2", "3"], ["1,00", "", "2,50", "3", "4,75"]],
+        parent="C100", parent_rows=[0, 0, 1, 1, 1],
+    )
+    chunks = list(_table_chunks("doc", "company", 3, 7, table))
+
+    assert [chunk["row_count"] for chunk in chunks] == [2, 2, 1]
+    assert [chunk["row_start"] for chunk in chunks] == [0, 2, 4]
+    assert "schema" in chunks[0] and all("schema" not in chunk for chunk in chunks[1:])
+    assert chunk_columns(chunks[1]) == ([["C170"] * 2, ["1", "2"], ["2,50", "3"]], [1, 1])
+
+    rebuilt = _table_from_chunks(chunks)
+    assert rebuilt.headers == table.headers
+    assert rebuilt.columns == table.columns
+    assert list(rebuilt.parent_rows) == list(table.parent_rows)
+    assert (rebuilt.parent, rebuilt.file_ids, rebuilt.num_rows) == ("C100", file_ids, 5)
+
+
+def test_empty_tables_keep_their_headers():
+    table = BlockTable("C190", ["REG", "CST_ICMS"], {})
+    chunks = list(_table_chunks("doc", "company", 0, 0, table))
+    assert len(chunks) == 1 and chunks[0]["row_count"] == 0
+    assert _table_from_chunks(chunks).headers == ["REG", "CST_ICMS"]
+
+
+def test_legacy_chunks_hold_plain_lists():
+    chunk = {"columns": [["0000"], ["015"]], "parent_rows": None, "row_count": 1}
+    assert chunk_columns(chunk) == ([["0000"], ["015"]], None)
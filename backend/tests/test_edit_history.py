@@ -0,0 +1,165 @@
+# test_edit_history.py
+import io
+import zipfile
+
+import pytest
+from bson import ObjectId
+
+import services.sheet_edits as sheet_edits
+from conftest import sample_files
+from mongodb import documents_collection, sheet_chunks_collection
+from services.block_store import tables_from_sheets, tables_to_sheets
+
+PISCOFINS = sample_files("PISCOFINS_202402*.txt")
+
+
+@pytest.fixture
+def doc_id(upload, request):
+    return upload(PISCOFINS, request.node.name)
+
+
+def values(client, doc_id, sheet="C170", column="VL_ITEM", **params):
+    """(version, row ids, values of one column) of a sheet, or the response if it failed."""
+    response = client.get(f"/documents/{doc_id}/sheets/{sheet}/rows", params={"row_count": 5000, **params})
+    if response.status_code != 200:
+        return response
+    window = response.json()
+    position = window["headers"].index(column)
+    return window["version"], window["row_ids"], [row[position] for row in window["rows"]]
+
+
+def set_value(client, doc_id, row, value, sheet="C170", column="VL_ITEM"):
+    edit = {"op": "set", "sheet": sheet, "row_id": row, "column": column, "value": value}
+    response = client.patch(f"/documents/{doc_id}/sheets", json={"edits": [edit]})
+    assert response.status_code == 200, response.text
+    return response.json()["version"]
+
+
+def document(stored, doc_id):
+    return stored(documents_collection.find_one, {"_id": ObjectId(doc_id)})
+
+
+def txt_export(client, doc_id):
+    response = client.get(f"/export/documents/{doc_id}/txt")
+    assert response.status_code == 200, response.text
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    (name,) = archive.namelist()
+    return archive.read(name)
+
+
+def test_earlier_versions_stay_readable(client, doc_id):
+    start, rows, original = values(client, doc_id)
+    first = set_value(client, doc_id, rows[0], "1,00")
+    second = set_value(client, doc_id, rows[1], "2,00")
+
+    assert values(client, doc_id, version=start)[2] == original
+    assert values(client, doc_id, version=first)[2] == ["1,00", *original[1:]]
+    assert values(client, doc_id)[2] == ["1,00", "2,00", *original[2:]]
+    assert client.get(f"/documents/{doc_id}/sheets/C170/rows", params={"version": second + 1}).status_code == 400
+
+
+def test_compaction_keeps_every_version(client, stored, doc_id):
+    start, rows, original = values(client, doc_id)
+    first = set_value(client, doc_id, rows[0], "1,00")
+    second = set_value(client, doc_id, rows[1], "2,00")
+
+    assert stored(sheet_edits.compact_document, doc_id) == second
+    record = document(stored, doc_id)
+    assert record["base_version"] == second and record["pending_edits"] == 0
+
+    assert values(client, doc_id)[2] == ["1,00", "2,00", *original[2:]]
+    assert values(client, doc_id, version=first)[2] == ["1,00", *original[1:]]
+    assert values(client, doc_id, version=start)[2] == original
+    # Edits go on from the new snapshot.
+    set_value(client, doc_id, rows[2], "3,00")
+    assert values(client, doc_id)[2][:3] == ["1,00", "2,00", "3,00"]
+    assert stored(sheet_edits.compact_document, doc_id) == second + 1
+    assert values(client, doc_id, version=first)[2] == ["1,00", *original[1:]]
+
+
+def test_history_is_dropped_past_the_retention(client, stored, doc_id, monkeypatch):
+    monkeypatch.setattr(sheet_edits, "HISTORY_VERSIONS", 1)
+    start, rows, original = values(client, doc_id)
+    first = set_value(client, doc_id, rows[0], "1,00")
+    stored(sheet_edits.compact_document, doc_id)
+    set_value(client, doc_id, rows[1], "2,00")
+    stored(sheet_edits.compact_document, doc_id)
+
+    assert values(client, doc_id, version=start).status_code == 400
+    assert values(client, doc_id, version=first)[2] == ["1,00", *original[1:]]
+
+
+def test_versions_survive_uploads_and_sheet_deletes(client, upload, doc_id, request):
+    start, rows, original = values(client, doc_id)
+    edited = set_value(client, doc_id, rows[0], "1,00")
+
+    # The same period uploaded again replaces the edited data...
+    assert upload(PISCOFINS, request.node.name) == doc_id
+    uploaded, _, latest = values(client, doc_id)
+    assert uploaded > edited and latest == original
+    # ...and the edited version can still be read.
+    assert values(client, doc_id, version=edited)[2] == ["1,00", *original[1:]]
+
+    stubs = client.get(f"/documents/{doc_id}", params={"format": "stubs"}).json()
+    names = [sheet["name"] for sheet in stubs["sheets"]]
+    response = client.delete(f"/documents/{request.node.name}/sheet/{names.index('0150')}")
+    assert response.status_code == 200, response.text
+    assert values(client, doc_id, "0150", "NOME").status_code == 404
+    assert values(client, doc_id, "0150", "NOME", version=uploaded)[0] == uploaded
+    assert values(client, doc_id, version=start)[2] == original
+
+
+def test_saving_the_grid_keeps_the_raw_file(client, stored, doc_id):
+    with open(PISCOFINS[0], "rb") as f:
+        raw = f.read()
+    sheets = client.get(f"/documents/{doc_id}", params={"format": "celldata"}).json()["sheets"]
+    version = document(stored, doc_id)["version"]
+
+    assert client.put(f"/documents/{doc_id}", json={"sheets": sheets}).status_code == 200
+    record = document(stored, doc_id)
+    assert record["version"] == version
+    assert all(partition.get("file_hash") for partition in record["partitions"].values())
+    assert txt_export(client, doc_id) == raw
+
+    tables = tables_from_sheets(sheets)
+    (c170,) = [table for table in tables if table.name == "C170"]
+    c170.columns[c170.headers.index("VL_ITEM")][0] = "1,23"
+    assert client.put(f"/documents/{doc_id}", json={"sheets": tables_to_sheets(tables)}).status_code == 200
+
+    assert len(client.get(f"/documents/{doc_id}/edits").json()["entries"]) == 1
+    exported = txt_export(client, doc_id)
+    changed = [(old, new) for old, new in zip(raw.split(b"\r\n"), exported.split(b"\r\n")) if old != new]
+    assert len(changed) == 1
+    old, new = changed[0]
+    assert old.split(b"|")[7] != b"1,23" and new.split(b"|")[7] == b"1,23"
+    assert old.split(b"|")[:7] == new.split(b"|")[:7] and old.split(b"|")[8:] == new.split(b"|")[8:]
+    # The signature after the closing record is kept.
+    assert exported[exported.index(b"|9999|"):] == raw[raw.index(b"|9999|"):]
+
+
+def test_uploads_replace_a_period_and_drop_old_generations(client, stored, upload, request, monkeypatch):
+    monkeypatch.setattr(sheet_edits, "HISTORY_VERSIONS", 1)
+    company = request.node.name
+    march = sample_files("PISCOFINS_202403*.txt")
+    doc_id = upload(PISCOFINS + march, company)
+    march_partitions = {
+        key: partition for key, partition in document(stored, doc_id)["partitions"].items() if "01032024" in key
+    }
+    _, rows, original = values(client, doc_id)
+    set_value(client, doc_id, rows[0], "1,00")
+
+    # The period is replaced in the same document; March is left as it was.
+    assert upload(PISCOFINS, company) == doc_id
+    replaced = values(client, doc_id)
+    assert replaced[2] == original
+    assert upload(PISCOFINS, company) == doc_id
+    record = document(stored, doc_id)
+    assert {key: record["partitions"][key] for key in march_partitions} == march_partitions
+
+    # Only the generation replaced by the last upload is kept, for the version before it.
+    assert len(record["retired"]) == 1
+    assert values(client, doc_id, version=replaced[0] - 1).status_code == 400
+    assert values(client, doc_id, version=replaced[0])[2] == original
+    live = {partition["generation"] for partition in record["partitions"].values()}
+    generations = stored(sheet_chunks_collection.distinct, "generation", {"doc_id": doc_id})
+    assert set(generations) == live | {record["retired"][0]["generation"]}
@@ -0,0 +1,176 @@
+# test_exports.py
+import asyncio
+import csv
+import io
+import random
+import zipfile
+
+import pytest
+from openpyxl import load_workbook
+
+import services.export_utils as export_utils
+from conftest import sample_files
+from services.export_utils import RowBatch, XlsxBuilder
+from services.streaming import FLUSH_BYTES, zip_stream
+
+PISCOFINS = sample_files("PISCOFINS_202402*.txt")
+
+
+@pytest.fixture(scope="module")
+def doc_id(upload):
+    return upload(PISCOFINS, "exports")
+
+
+def unzip(response):
+    assert response.status_code == 200, response.text
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    return {name: archive.read(name) for name in archive.namelist()}
+
+
+def workbook_values(data):
+    workbook = load_workbook(io.BytesIO(data), read_only=True)
+    return {sheet.title: list(sheet.iter_rows(values_only=True)) for sheet in workbook.worksheets}
+
+
+# === ZIP === #
+def test_zip_is_streamed_without_seeking():
+    # Random bytes don't compress, so the archive outgrows a flush.
+    big = random.Random(0).randbytes(3 * FLUSH_BYTES)
+
+    async def parts():
+        yield "a.txt", "first "
+        yield "a.txt", "file"
+        for start in range(0, len(big), 1000):
+            yield "b.bin", big[start:start + 1000]
+        yield "c/d.txt", ""
+
+    async def collect():
+        return [piece async for piece in zip_stream(parts())]
+
+    pieces = asyncio.run(collect())
+    # The archive goes out while it is being written...
+    assert len(pieces) > 1 and all(pieces)
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(pieces)))
+    assert archive.testzip() is None
+    assert {name: archive.read(name) for name in archive.namelist()} == {
+        "a.txt": b"first file", "b.bin": big, "c/d.txt": b"",
+    }
+    # ...into a sink that can't seek: sizes follow each entry in a data descriptor.
+    assert all(info.flag_bits & 0x08 for info in archive.infolist())
+
+
+# === XLSX === #
+def c170_batch(rows, id_values=("01022024", "29022024", "04331031000186")):
+    headers = ["REG", "NUM_ITEM", "DESCR_COMPL", "VL_ITEM", "QTD_LIN"]
+    return RowBatch("C170", list(id_values), headers, ["code", "code", "text", "decimal", "integer"], rows)
+
+
+def built(*batches):
+    builder = XlsxBuilder()
+    for batch in batches:
+        builder.add(batch)
+    output = io.BytesIO()
+    builder.save(output)
+    return workbook_values(output.getvalue())
+
+
+def test_xlsx_cells_are_typed():
+    sheets = built(c170_batch([
+        ["C170", "1", "A & B <c>", "1234,56", "7"],
+        ["C170", "2", "  padded", "", "x"],
+    ]))
+    assert sheets == {"C170": [
+        ("ID_DT_INI", "ID_DT_FIN", "ID_CNPJ", "REG", "NUM_ITEM", "DESCR_COMPL", "VL_ITEM", "QTD_LIN"),
+        ("01022024", "29022024", "04331031000186", "C170", "1", "A & B <c>", 1234.56, 7),
+        # Empty and unreadable numbers keep their text.
+        ("01022024", "29022024", "04331031000186", "C170", "2", "  padded", None, "x"),
+    ]}
+
+
+def test_xlsx_sheets_continue_past_the_row_limit(monkeypatch):
+    assert export_utils.XLSX_MAX_ROWS == 1048576
+    # Header and three rows per worksheet.
+    monkeypatch.setattr(export_utils, "XLSX_MAX_ROWS", 4)
+    rows = [["C170", str(n), "", "1,00", str(n)] for n in range(1, 8)]
+    sheets = built(c170_batch(rows[:2]), c170_batch(rows[2:5], ("01032024", "31032024", "04331031000186")),
+                   c170_batch(rows[5:]))
+    assert list(sheets) == ["C170", "C170 (2)", "C170 (3)"]
+    assert all(sheet[0][0] == "ID_DT_INI" for sheet in sheets.values())
+    assert [row[-1] for sheet in sheets.values() for row in sheet[1:]] == list(range(1, 8))
+    assert sheets["C170 (2)"][1][0] == "01032024"
+
+
+def test_xlsx_export_of_a_document_and_of_its_sheets(client, doc_id):
+    (name, data), = unzip(client.get(f"/export/documents/{doc_id}/xlsx")).items()
+    assert name == "exports.xlsx"
+    stored = workbook_values(data)
+    c170 = stored["C170"]
+    position = c170[0].index("VL_ITEM")
+    assert all(isinstance(row[position], float) for row in c170[1:])
+
+    # The grid sent back by the client gives the same workbook.
+    sheets = client.get(f"/documents/{doc_id}", params={"format": "celldata"}).json()["sheets"]
+    files = unzip(client.post("/export/xlsx/", json=[{"file_name": "grid", "sheets": sheets}]))
+    assert workbook_values(files["grid.xlsx"]) == stored
+
+
+# === CSV === #
+def test_csv_quotes_only_where_needed():
+    batch = c170_batch([["C170", "1", 'A "quoted", name', "10,50", "2"], ["C170", "2", "line\nbreak", "", ""]])
+    text = export_utils._csv_text(batch, ",", ".", header=True)
+    assert text.split("\r\n")[:2] == [
+        "ID_DT_INI,ID_DT_FIN,ID_CNPJ,REG,NUM_ITEM,DESCR_COMPL,VL_ITEM,QTD_LIN",
+        '01022024,29022024,04331031000186,C170,1,"A ""quoted"", name",10.50,2',
+    ]
+    assert '"line\nbreak"' in text and text.endswith("\r\n")
+
+
+def test_csv_delimiter_and_decimal_choice(client, doc_id):
+    url = f"/export/documents/{doc_id}/csv"
+    default = unzip(client.get(url, params={"blocks": "C170"}))
+    excel = unzip(client.get(url, params={"blocks": "C170", "delimiter": ";", "decimal": ","}))
+    assert list(default) == list(excel) == ["C170/01022024_29022024_04331031000186.csv"]
+
+    (comma,) = [list(csv.reader(io.StringIO(data.decode("utf-8")))) for data in default.values()]
+    (semicolon,) = [list(csv.reader(io.StringIO(data.decode("utf-8")), delimiter=";")) for data in excel.values()]
+    position = comma[0].index("VL_ITEM")
+    values = [row[position] for row in comma[1:]]
+    assert all("." in value and "," not in value for value in values)
+    assert [row[position] for row in semicolon[1:]] == [value.replace(".", ",") for value in values]
+    # Codes and text are the same either way.
+    code = comma[0].index("COD_ITEM")
+    assert [row[:code + 1] for row in semicolon] == [row[:code + 1] for row in comma]
+
+    assert client.get(url, params={"delimiter": ":"}).status_code == 400
+    assert client.get(url, params={"decimal": ";"}).status_code == 400
+
+
+# === Parquet === #
+def test_parquet_dataset_is_hive_partitioned_and_typed(client, doc_id, tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    import pyarrow
+    import pyarrow.dataset
+
+    files = unzip(client.get(f"/export/documents/{doc_id}/parquet", params={"blocks": "C170,M210"}))
+    assert sorted(files) == [
+        "C170/ID_CNPJ=04331031000186/ID_DT_INI=01022024/part-0.parquet",
+        "M210/ID_CNPJ=04331031000186/ID_DT_INI=01022024/part-0.parquet",
+    ]
+    part = parquet.read_table(io.BytesIO(files[sorted(files)[0]]))
+    # Partition values live in the folder names only.
+    assert "ID_CNPJ" not in part.column_names and "ID_DT_INI" not in part.column_names
+    assert part.schema.field("ID_DT_FIN").type == pyarrow.string()
+    assert part.schema.field("VL_ITEM").type == pyarrow.float64()
+    assert part.schema.field("NUM_ITEM").type == pyarrow.string()
+    assert part.column("VL_ITEM").null_count == 0
+
+    for name, data in files.items():
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_bytes(data)
+    partitioning = pyarrow.dataset.partitioning(
+        pyarrow.schema([("ID_CNPJ", pyarrow.string()), ("ID_DT_INI", pyarrow.string())]), flavor="hive",
+    )
+    dataset = parquet.read_table(tmp_path / "C170", partitioning=partitioning)
+    assert set(dataset.column("ID_CNPJ").to_pylist()) == {"04331031000186"}
+    assert set(dataset.column("ID_DT_INI").to_pylist()) == {"01022024"}
+    assert dataset.num_rows == part.num_rows
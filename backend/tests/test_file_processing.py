@@ -0,0 +1,110 @@
+# test_file_processing.py
+import pytest
+
+from conftest import sample_files
+from services.file_processing import EncodingDetector, detect_encoding, iter_sped_lines, parse_txt
+from services.layouts import EFD_CONTRIBUICOES, EFD_ICMS_IPI, detect_layout
+from services.record_index import RecordIndex
+
+
+@pytest.fixture(scope="module")
+def icms():
+    index = RecordIndex()
+    path = sample_files("SpedEFD-*abr2021.txt")[0]
+    return path, {table.name: table for table in parse_txt(path, index)}, index
+
+
+@pytest.fixture(scope="module")
+def contribuicoes():
+    path = sample_files("PISCOFINS_20240201_*.txt")[0]
+    return path, {table.name: table for table in parse_txt(path)}
+
+
+def test_detect_layout_from_the_0000_record():
+    icms_0000 = ["0000", "015", "1", "01042021", "30042021", "INTEGRAL", "01588099000157"]
+    contribuicoes_0000 = ["0000", "006", "0", "", "", "01022024", "29022024", "AQUACLARA"]
+    assert detect_layout(icms_0000) == (EFD_ICMS_IPI, "015")
+    assert detect_layout(contribuicoes_0000) == (EFD_CONTRIBUICOES, "006")
+
+
+def test_parse_reads_the_layout_and_file_ids_of_each_sample(icms, contribuicoes):
+    _, icms_tables, _ = icms
+    _, contribuicoes_tables = contribuicoes
+    assert {table.layout for table in icms_tables.values()} == {EFD_ICMS_IPI}
+    assert {table.layout for table in contribuicoes_tables.values()} == {EFD_CONTRIBUICOES}
+    assert icms_tables["C170"].id_values == ["01042021", "30042021", "01588099000157"]
+    assert contribuicoes_tables["M210"].id_values == ["01022024", "29022024", "04331031000186"]
+
+
+def test_parse_stops_at_the_closing_record(icms):
+    path, tables, _ = icms
+    with open(path, "rb") as f:
+        lines = f.read().split(b"\r\n")
+    closing = next(position for position, line in enumerate(lines) if line.startswith(b"|9999|"))
+    assert tables["9999"].num_rows == 1
+    assert sum(table.num_rows for table in tables.values()) == closing + 1
+
+
+def test_child_rows_point_at_their_parent_record(icms):
+    _, tables, _ = icms
+    children, parents = tables["C170"], tables["C100"]
+    assert children.parent == "C100"
+    assert len(children.parent_rows) == children.num_rows
+    assert list(children.parent_rows) == sorted(children.parent_rows)
+    assert 0 <= min(children.parent_rows) and max(children.parent_rows) < parents.num_rows
+
+
+def test_index_addresses_the_raw_lines(icms):
+    path, tables, index = icms
+    assert index.layout_name == EFD_ICMS_IPI
+    assert index.count("C170") == tables["C170"].num_rows
+    with open(path, "rb") as f:
+        data = f.read()
+    for ordinal in (0, index.count("C170") - 1):
+        offset, length = index.offsets["C170"][ordinal], index.lengths["C170"][ordinal]
+        line = data[offset:offset + length].decode(index.encoding)
+        assert line.strip("|").split("|")[:2] == [tables["C170"].columns[i][ordinal] for i in range(2)]
+    parent = index.parents["C170"][0]
+    assert 0 in index.children("C170", parent)
+
+
+def test_iter_sped_lines_gives_byte_offsets_and_splits_bare_cr(tmp_path):
+    path = tmp_path / "lines.txt"
+    path.write_bytes(b"|0000|a|\r\n|0001|b|\r|0990|3|\n|9999|4|")
+    lines = list(iter_sped_lines(str(path), "utf-8"))
+    assert lines == [
+        (0, 8, "|0000|a|"),
+        (10, 8, "|0001|b|"),
+        (19, 8, "|0990|3|"),
+        (28, 8, "|9999|4|"),
+    ]
+
+
+def test_detect_encoding_reads_the_whole_file(tmp_path):
+    # An ASCII head says nothing about the accents further down.
+    latin = tmp_path / "latin.txt"
+    latin.write_bytes(b"|0000|" + b"x" * 8192 + b"|\r\n|0150|Cl\xednica|\r\n")
+    assert detect_encoding(str(latin)) == "latin-1"
+
+    # A multi-byte character split across two reads is still UTF-8.
+    utf8 = tmp_path / "utf8.txt"
+    utf8.write_bytes(b"x" * (1024 * 1024 - 1) + "ção".encode("utf-8"))
+    assert detect_encoding(str(utf8)) == "utf-8"
+
+
+def test_encoding_is_told_while_the_bytes_go_by():
+    detector = EncodingDetector()
+    accent = "ção".encode("utf-8")
+    detector.feed(b"|0150|" + accent[:1])
+    detector.feed(accent[1:] + b"|")
+    assert detector.close() == "utf-8"
+
+    detector = EncodingDetector()
+    detector.feed(b"|0150|Cl\xednica|")
+    detector.feed("ção".encode("utf-8"))
+    assert detector.close() == "latin-1"
+
+    # A file cut in the middle of a character is not UTF-8.
+    detector = EncodingDetector()
+    detector.feed(accent[:1])
+    assert detector.close() == "latin-1"
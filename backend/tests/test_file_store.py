@@ -0,0 +1,64 @@
+# test_file_store.py
+import glob
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import services.parse_pool as parse_pool
+from conftest import sample_files
+from services.file_processing import PARSER_VERSION
+from services.file_store import (
+    OBJECTS_DIR, add_reference, load_cached, load_index, object_path, read_manifest, save_upload,
+)
+
+PISCOFINS = sample_files("PISCOFINS_202402*.txt")[0]
+
+
+@pytest.fixture(autouse=True)
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def upload(path, company_id):
+    with open(path, "rb") as f:
+        return save_upload(io.BytesIO(f.read()), os.path.basename(path), company_id)
+
+
+def test_same_bytes_are_stored_once():
+    first = upload(PISCOFINS, "company-a")
+    second = upload(PISCOFINS, "company-b")
+
+    assert first["hash"] == second["hash"] and first["path"] == second["path"] == object_path(first["hash"])
+    assert first["encoding"] == "latin-1"
+    assert glob.glob(os.path.join(OBJECTS_DIR, "**", "*"), recursive=True) == [
+        os.path.dirname(first["path"]), first["path"],
+    ]
+    with open(PISCOFINS, "rb") as original, open(first["path"], "rb") as stored:
+        assert stored.read() == original.read()
+    for company_id in ("company-a", "company-b"):
+        assert read_manifest(company_id)[os.path.basename(PISCOFINS)]["hash"] == first["hash"]
+
+
+def test_concurrent_references_are_all_kept():
+    names = [f"file-{n}.txt" for n in range(50)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda name: add_reference("company", name, "0" * 64, 1), names))
+    assert sorted(read_manifest("company")) == sorted(names)
+    assert not glob.glob(os.path.join("saved_files", "company", "*.tmp"))
+
+
+def test_parse_results_are_cached_by_hash(monkeypatch):
+    saved = upload(PISCOFINS, "company")
+    tables, stats = parse_pool._parse_with_stats(saved["path"], saved["hash"], saved["encoding"])
+    assert load_cached(saved["hash"], PARSER_VERSION) is not None
+    assert load_index(saved["hash"], PARSER_VERSION).encoding == "latin-1"
+
+    def parse_again(*args, **kwargs):
+        raise AssertionError("the cached result should be used")
+
+    monkeypatch.setattr(parse_pool, "parse_txt", parse_again)
+    cached, cached_stats = parse_pool._parse_with_stats(saved["path"], saved["hash"])
+    assert cached_stats == stats
+    assert [(table.name, table.columns) for table in cached] == [(table.name, table.columns) for table in tables]
@@ -0,0 +1,99 @@
+# test_parsing_logic.py
+import pytest
+
+from conftest import sample_files
+from services.block_store import BlockTable
+from services.parsing_logic import chain_codes, flatten_chain, flatten_tables, group_files, record_chain
+
+FEB = {"ID_DT_INI": "01022024", "ID_DT_FIN": "29022024", "ID_CNPJ": "04331031000186"}
+MAR = {"ID_DT_INI": "01032024", "ID_DT_FIN": "31032024", "ID_CNPJ": "04331031000186"}
+
+
+def table(name, headers, rows, file_ids=FEB, parent=None, parent_rows=None):
+    columns = [[row[position] for row in rows] for position in range(len(headers))]
+    return BlockTable(name, headers, file_ids, columns=columns, parent=parent, parent_rows=parent_rows)
+
+
+def c_block(file_ids=FEB):
+    """C010 > C100 > C170 of one file; the last C170 points past the C100 rows."""
+    return {
+        "C010": table("C010", ["REG", "CNPJ"], [["C010", "111"], ["C010", "222"]], file_ids),
+        "C100": table("C100", ["REG", "NUM_DOC"], [["C100", "10"], ["C100", "20"], ["C100", "30"]], file_ids,
+                      parent="C010", parent_rows=[0, 1, -1]),
+        "C170": table("C170", ["REG", "NUM_ITEM"], [["C170", str(n)] for n in range(1, 6)], file_ids,
+                      parent="C100", parent_rows=[0, 0, 1, 2, 3]),
+    }
+
+
+def test_chain_codes_follow_the_layout_hierarchy():
+    assert chain_codes("C170") == ["C170", "C100", "C010"]
+    assert chain_codes("M215") == ["M215", "M210", "M200"]
+    assert chain_codes("0000") == ["0000"]
+
+
+def test_record_chain_goes_from_the_top_ancestor_to_the_leaf():
+    tables = c_block()
+    assert [t.name for t in record_chain(tables["C170"], tables)] == ["C010", "C100", "C170"]
+    # A chain stops where the parent table is not in the file.
+    del tables["C010"]
+    assert [t.name for t in record_chain(tables["C170"], tables)] == ["C100", "C170"]
+
+
+def test_flatten_chain_joins_every_ancestor():
+    flat = flatten_chain(c_block()["C170"], c_block())
+    assert flat.name == "C010 > C100 > C170"
+    assert flat.headers == ["C010.CNPJ", "C100.NUM_DOC", "REG", "NUM_ITEM"]
+    assert flat.num_rows == 5 and flat.file_ids == FEB
+    rows = [[column[row] for column in flat.columns] for row in range(flat.num_rows)]
+    assert rows == [
+        ["111", "10", "C170", "1"],
+        ["111", "10", "C170", "2"],
+        ["222", "20", "C170", "3"],
+        # C100 30 has no C010...
+        ["", "30", "C170", "4"],
+        # ...and this C170 has no C100 at all.
+        ["", "", "C170", "5"],
+    ]
+
+
+def test_flatten_chain_of_an_m_block():
+    tables = {
+        "M200": table("M200", ["REG", "VL_TOT_CONT_NC_PER"], [["M200", "100,00"]]),
+        "M210": table("M210", ["REG", "COD_CONT"], [["M210", "01"], ["M210", "51"]],
+                      parent="M200", parent_rows=[0, -1]),
+        "M215": table("M215", ["REG", "IND_AJ_BC"], [["M215", "0"], ["M215", "1"], ["M215", "1"]],
+                      parent="M210", parent_rows=[0, 1, -1]),
+    }
+    flat = flatten_chain(tables["M215"], tables)
+    assert flat.name == "M200 > M210 > M215"
+    assert flat.headers == ["M200.VL_TOT_CONT_NC_PER", "M210.COD_CONT", "REG", "IND_AJ_BC"]
+    assert flat.columns[:2] == [["100,00", "", ""], ["01", "51", ""]]
+
+
+def test_flatten_chain_needs_parent_links():
+    tables = c_block()
+    assert flatten_chain(tables["C010"], tables) is None
+
+
+def test_flatten_tables_gives_one_view_per_file():
+    feb, mar = c_block(), c_block(MAR)
+    # Sheet order: both files' tables of one code side by side.
+    tables = [feb["C010"], mar["C010"], feb["C100"], mar["C100"], feb["C170"], mar["C170"]]
+    assert [sorted(file_tables) for file_tables in group_files(tables)] == [["C010", "C100", "C170"]] * 2
+
+    flattened = flatten_tables(tables, "C170")
+    assert [flat.file_ids for flat in flattened] == [FEB, MAR]
+    assert flatten_tables(tables, "M210") == []
+
+
+@pytest.fixture(scope="module")
+def doc_id(upload):
+    return upload(sample_files("PISCOFINS_2024020*.txt"), "flatten")
+
+
+def test_flatten_endpoint(client, doc_id):
+    response = client.get(f"/documents/{doc_id}/flatten/C170")
+    assert response.status_code == 200, response.text
+    sheets = response.json()["sheets"]
+    assert sheets and all(sheet["name"] == "C010 > C100 > C170" for sheet in sheets)
+    assert client.get(f"/documents/{doc_id}/flatten/0000").status_code == 404
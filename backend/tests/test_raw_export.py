@@ -0,0 +1,86 @@
+# test_raw_export.py
+import io
+import zipfile
+
+import pytest
+from bson import ObjectId
+
+from conftest import sample_files
+from mongodb import documents_collection
+
+ABR2021 = sample_files("SpedEFD-*abr2021.txt")
+
+
+def txt_files(client, doc_id, **params):
+    response = client.get(f"/export/documents/{doc_id}/txt", params=params)
+    assert response.status_code == 200, response.text
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    return {name: archive.read(name) for name in archive.namelist()}
+
+
+def raw(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.fixture(scope="module")
+def all_samples(upload):
+    return upload(sample_files(), "raw-export")
+
+
+def test_unedited_documents_export_the_uploaded_bytes(client, all_samples):
+    exported = txt_files(client, all_samples)
+    assert len(exported) == 7
+    assert sorted(exported.values()) == sorted(raw(path) for path in sample_files())
+
+
+def test_period_filter(client, all_samples):
+    exported = txt_files(client, all_samples, periods="01042021")
+    assert list(exported.values()) == [raw(ABR2021[0])]
+
+
+def test_block_filter_keeps_the_original_lines(client, all_samples):
+    exported = txt_files(client, all_samples, periods="01042021", blocks="0000,9999")
+    (data,) = exported.values()
+    original = raw(ABR2021[0]).split(b"\r\n")
+    kept = [line for line in original if line.startswith((b"|0000|", b"|9999|"))]
+    assert data.split(b"\r\n")[:2] == kept
+
+
+def test_edited_records_keep_the_file_encoding(client, upload):
+    doc_id = upload(ABR2021, "raw-export-accents")
+    sheet = "0150 (EFD_ICMS_IPI)"
+    url = f"/documents/{doc_id}/sheets/{sheet}/rows"
+    response = client.get(url, params={"row_count": 5000})
+    assert response.status_code == 200, response.text
+    window = response.json()
+    names = [row[window["headers"].index("NOME")] for row in window["rows"]]
+    row = window["row_ids"][next(i for i, name in enumerate(names) if "DEL CASTRO" in name)]
+
+    edit = {"op": "set", "sheet": sheet, "row_id": row, "column": "BAIRRO", "value": "Ação"}
+    assert client.patch(f"/documents/{doc_id}/sheets", json={"edits": [edit]}).status_code == 200
+
+    (exported,) = txt_files(client, doc_id).values()
+    changed = [
+        (old, new) for old, new in zip(raw(ABR2021[0]).split(b"\r\n"), exported.split(b"\r\n")) if old != new
+    ]
+    assert len(changed) == 1
+    old, new = changed[0]
+    # The file is latin-1; the other fields (mis-encoded ones included) keep their bytes.
+    assert new == old.replace(b"|RODOLFO TEOFILO|", b"|A\xe7\xe3o|")
+
+
+def test_documents_without_raw_files_are_rebuilt_from_rows(client, stored, upload):
+    doc_id = upload(sample_files("PISCOFINS_202402*.txt"), "raw-export-rows")
+    partitions = stored(documents_collection.find_one, {"_id": ObjectId(doc_id)})["partitions"]
+    stored(documents_collection.update_one, {"_id": ObjectId(doc_id)},
+           {"$unset": {f"partitions.{key}.file_hash": "" for key in partitions}})
+
+    (exported,) = txt_files(client, doc_id).values()
+    original = raw(sample_files("PISCOFINS_202402*.txt")[0])
+    # The same records, written block by block as UTF-8 text, padded to their
+    # layout's fields and without the signature.
+    lines = original.decode("latin-1").splitlines()
+    records = lines[:next(i for i, line in enumerate(lines) if line.startswith("|9999|")) + 1]
+    rebuilt = exported.decode("utf-8").splitlines()
+    assert sorted(line.rstrip("|") for line in rebuilt) == sorted(line.rstrip("|") for line in records)
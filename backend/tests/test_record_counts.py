@@ -0,0 +1,136 @@
+# test_record_counts.py
+import io
+import zipfile
+from collections import Counter
+
+import pytest
+
+from conftest import sample_files
+from services.record_counts import RecordCounts
+
+PISCOFINS = sample_files("PISCOFINS_202402*.txt")
+
+
+def records(data: bytes):
+    """Fields of every record up to 9999 (the signature that follows is not read)."""
+    result = []
+    for line in data.decode("latin-1").splitlines():
+        fields = line.strip().strip("|").split("|")
+        if fields[0].isalnum():
+            result.append(fields)
+        if fields[0] == "9999":
+            break
+    return result
+
+
+def wrong_counters(data: bytes):
+    """The counters of a file that do not match its records, as (record, field, value)."""
+    fields = records(data)
+    per_record = Counter(record[0] for record in fields)
+    per_block = Counter(record[0][0] for record in fields)
+    wrong = []
+    for record in fields:
+        code = record[0]
+        if code.endswith("990") and code[0] != "9" and int(record[1]) != per_block[code[0]]:
+            wrong.append((code, "", record[1]))
+        elif code == "9900" and int(record[2]) != per_record[record[1]]:
+            wrong.append((code, record[1], record[2]))
+        elif code == "9990" and int(record[1]) != per_block["9"]:
+            wrong.append((code, "", record[1]))
+        elif code == "9999" and int(record[1]) != len(fields):
+            wrong.append((code, "", record[1]))
+    listed = {record[1] for record in fields if record[0] == "9900"}
+    wrong += [("9900", code, "missing") for code in per_record if code not in listed]
+    wrong += [("9900", code, "listed") for code in listed if code not in per_record]
+    return wrong
+
+
+def totals(data: bytes):
+    fields = records(data)
+    return {
+        **{record[0]: int(record[1]) for record in fields if record[0].endswith("990") or record[0] == "9999"},
+        **{f"9900 {record[1]}": int(record[2]) for record in fields if record[0] == "9900"},
+    }
+
+
+def test_counts_follow_the_rows_written():
+    counts = RecordCounts()
+    written = counts.rows([
+        ["0000", "x"], ["0001", "0"], ["0990", "3"],
+        ["C001", "0"], ["C100", "1"], ["C100", "2"], ["C990", "3"],
+        ["9001", "0"], ["9900", "0000", "1"], ["9900", "C100", "1"], ["9900", "C001", "1"],
+        ["9990", "7"], ["9999", "20"],
+    ])
+    assert written[2] == ["0990", "3"] and written[-1] == ["C990", "4"]
+
+    closing = counts.closing_records()
+    assert closing[0] == ["9001", "0"]
+    # The file's own 9900 order is kept; types it did not list are added before block 9.
+    assert [record[1:] for record in closing if record[0] == "9900"] == [
+        ["0000", "1"], ["C100", "2"], ["C001", "1"], ["0001", "1"], ["0990", "1"], ["C990", "1"],
+        ["9001", "1"], ["9900", "10"], ["9990", "1"], ["9999", "1"],
+    ]
+    assert closing[-2:] == [["9990", "13"], ["9999", "20"]]
+
+
+def test_partial_exports_get_no_block_9():
+    counts = RecordCounts()
+    counts.rows([["C100", "1"]])
+    assert counts.closing_records() == []
+
+
+@pytest.fixture
+def doc_id(upload, request):
+    return upload(PISCOFINS, request.node.name)
+
+
+def txt_export(client, doc_id):
+    response = client.get(f"/export/documents/{doc_id}/txt")
+    assert response.status_code == 200, response.text
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    (name,) = archive.namelist()
+    return archive.read(name)
+
+
+def test_counters_are_recomputed_after_deletes_and_inserts(client, doc_id):
+    with open(PISCOFINS[0], "rb") as f:
+        raw = f.read()
+    assert wrong_counters(raw) == []
+
+    c170 = client.get(f"/documents/{doc_id}/sheets/C170/rows", params={"row_count": 5000}).json()
+    (m220,) = client.get(f"/documents/{doc_id}/sheets/M220/rows").json()["row_ids"]
+    edits = [
+        {"op": "delete", "sheet": "C170", "row_id": c170["row_ids"][0]},
+        {"op": "delete", "sheet": "C170", "row_id": c170["row_ids"][1]},
+        {"op": "insert", "sheet": "C170", "after_row_id": c170["row_ids"][5], "values": c170["rows"][5][3:]},
+        {"op": "delete", "sheet": "M220", "row_id": m220},
+    ]
+    response = client.patch(f"/documents/{doc_id}/sheets", json={"edits": edits})
+    assert response.status_code == 200, response.text
+
+    exported = txt_export(client, doc_id)
+    assert wrong_counters(exported) == []
+    before, after = totals(raw), totals(exported)
+    assert after["C990"] == before["C990"] - 1
+    assert after["M990"] == before["M990"] - 1
+    assert after["9900 C170"] == before["9900 C170"] - 1
+    # M220 is gone, and with it its 9900 record.
+    assert "9900 M220" not in after
+    assert after["9900 9900"] == before["9900 9900"] - 1
+    assert after["9990"] == before["9990"] - 1
+    assert after["9999"] == before["9999"] - 3
+    # Everything after the closing record (the signature) is kept.
+    signature = raw[raw.index(b"\r\n|9999|"):].split(b"\r\n", 2)[2]
+    assert exported.endswith(b"\r\n" + signature)
+
+
+def test_unchanged_counts_keep_the_original_lines(client, doc_id):
+    with open(PISCOFINS[0], "rb") as f:
+        raw = f.read()
+    row = client.get(f"/documents/{doc_id}/sheets/C170/rows", params={"row_count": 1}).json()["row_ids"][0]
+    edit = {"op": "set", "sheet": "C170", "row_id": row, "column": "VL_ITEM", "value": "1,00"}
+    assert client.patch(f"/documents/{doc_id}/sheets", json={"edits": [edit]}).status_code == 200
+
+    exported = txt_export(client, doc_id)
+    changed = [line for line, original in zip(exported.split(b"\r\n"), raw.split(b"\r\n")) if line != original]
+    assert len(changed) == 1 and changed[0].startswith(b"|C170|")
@@ -0,0 +1,104 @@
+# test_sheet_edits.py
+import pytest
+
+from conftest import sample_files
+from services.block_store import ID_HEADERS
+from services.chunk_edits import apply_entries
+
+
+@pytest.fixture
+def doc_id(upload, request):
+    return upload(sample_files("PISCOFINS_202402*.txt"), request.node.name)
+
+
+def window(client, doc_id, sheet="C170", **params):
+    response = client.get(f"/documents/{doc_id}/sheets/{sheet}/rows", params={"row_count": 5000, **params})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def patch(client, doc_id, edits, base_version=None):
+    body = {"edits": edits}
+    if base_version is not None:
+        body["base_version"] = base_version
+    return client.patch(f"/documents/{doc_id}/sheets", json=body)
+
+
+def test_set_insert_and_delete(client, doc_id):
+    before = window(client, doc_id)
+    column = before["headers"].index("VL_ITEM")
+    first, second, third = before["row_ids"][:3]
+
+    response = patch(client, doc_id, [
+        {"op": "set", "sheet": "C170", "row_id": first, "column": "VL_ITEM", "value": "1,23"},
+        {"op": "delete", "sheet": "C170", "row_id": second},
+        {"op": "insert", "sheet": "C170", "after_row_id": third, "values": {"REG": "C170", "VL_ITEM": "4,56"}},
+        {"op": "update_row", "sheet": "C170", "row_id": third, "values": {"VL_ITEM": "7,89"}},
+    ], base_version=before["version"])
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["version"] == before["version"] + 1 and result["applied"] == 4
+    (inserted,) = result["inserted_row_ids"]
+
+    after = window(client, doc_id)
+    assert after["version"] == result["version"]
+    assert after["total_rows"] == before["total_rows"]
+    assert after["row_ids"][:3] == [first, third, inserted]
+    assert [row[column] for row in after["rows"][:3]] == ["1,23", "7,89", "4,56"]
+    assert after["rows"][3:] == before["rows"][3:]
+
+
+def test_journal_lists_what_changed(client, doc_id):
+    before = window(client, doc_id, "0150")
+    row, column = before["row_ids"][0], before["headers"].index("NOME")
+    patch(client, doc_id, [{"op": "set", "sheet": "0150", "row_id": row, "column": "NOME", "value": "Novo"}])
+    # The journal numbers the stored columns, without the ID columns of the grid.
+    stored = str(column - len(ID_HEADERS))
+
+    edits = client.get(f"/documents/{doc_id}/edits").json()
+    (entry,) = edits["entries"]
+    (edit,) = entry["edits"]
+    assert edit["row_id"] == row and edit["values"] == {stored: "Novo"}
+    assert edit["previous"] == {stored: before["rows"][0][column]}
+
+
+def test_stale_base_version_is_a_conflict(client, doc_id):
+    before = window(client, doc_id, row_count=1)
+    version, row = before["version"], before["row_ids"][0]
+    edit = {"op": "set", "sheet": "C170", "row_id": row, "column": "VL_ITEM", "value": "1,00"}
+
+    assert patch(client, doc_id, [edit], base_version=version).status_code == 200
+    conflict = patch(client, doc_id, [{**edit, "value": "2,00"}], base_version=version)
+    assert conflict.status_code == 409
+
+    # Nothing of the rejected batch was recorded.
+    after = window(client, doc_id, row_count=1)
+    assert after["version"] == version + 1
+    assert after["rows"][0][after["headers"].index("VL_ITEM")] == "1,00"
+    assert len(client.get(f"/documents/{doc_id}/edits").json()["entries"]) == 1
+
+
+@pytest.mark.parametrize("edits", [
+    [],
+    [{"op": "rename", "sheet": "C170", "row_id": "0:0"}],
+    [{"op": "set", "sheet": "C170", "row_id": "0:99999", "column": "VL_ITEM", "value": "1"}],
+    [{"op": "set", "sheet": "C170", "row_id": "0:0", "column": "NOPE", "value": "1"}],
+])
+def test_invalid_edits_are_rejected(client, doc_id, edits):
+    version = window(client, doc_id, row_count=1)["version"]
+    response = patch(client, doc_id, edits)
+    assert response.status_code == 400
+    assert window(client, doc_id, row_count=1)["version"] == version
+
+
+def test_replay_skips_edits_of_rows_already_gone():
+    chunk = {"generation": "g", "file_seq": 0, "block_seq": 1, "chunk": 0, "row_start": 0,
+             "row_count": 2, "columns": [["a", "b"]], "parent_rows": None}
+    key = {"generation": "g", "key": [0, 1, 0]}
+    entries = [{"edits": [
+        {**key, "op": "delete", "row_id": "0:0"},
+        {**key, "op": "set", "row_id": "0:0", "values": {"0": "x"}},
+        {**key, "op": "set", "row_id": "0:1", "values": {"0": "y"}},
+    ]}]
+    (edited,) = apply_entries([chunk], entries)
+    assert edited["columns"] == [["y"]] and edited["row_ids"] == ["0:1"]
@@ -0,0 +1,60 @@
+# test_typed_columns.py
+import numpy as np
+import pytest
+
+from services.typed_columns import (
+    CODE, DATE, DECIMAL, INTEGER, decode_column, decode_date, decode_decimal, decode_integer,
+)
+
+
+def test_decimals_are_scaled_to_the_longest_fraction():
+    column = decode_decimal(["1234,56", "0,5", "-3", "", ",25", "-,5"])
+    assert column.kind == DECIMAL
+    assert column.scale == 2
+    assert column.values.tolist() == [123456, 50, -300, 0, 25, -50]
+    assert column.valid.tolist() == [True, True, True, False, True, True]
+    assert column.total() == 123456 + 50 - 300 + 25 - 50
+    assert np.isnan(column.to_float()[3])
+    assert column.to_float()[0] == pytest.approx(1234.56)
+
+
+def test_decimals_keep_unreadable_cells_invalid():
+    column = decode_decimal(["10,00", "abc", "1.000,00"])
+    assert column.valid.tolist() == [True, False, False]
+    assert decode_decimal(["abc", "x"]) is None
+
+
+@pytest.mark.parametrize("decoder", [decode_decimal, decode_integer, decode_date])
+def test_empty_columns_decode_to_empty_columns(decoder):
+    column = decoder([])
+    assert len(column) == 0
+    assert column.valid.tolist() == []
+
+
+def test_integers():
+    column = decode_integer(["1", "-20", "", "x"])
+    assert column.kind == INTEGER
+    assert column.values.tolist()[:2] == [1, -20]
+    assert column.valid.tolist() == [True, True, False, False]
+    assert decode_integer(["a", "b"]) is None
+
+
+def test_dates_reject_days_past_the_end_of_the_month():
+    column = decode_date(["01042021", "31042021", "29022024", "", "2021-04-01"])
+    assert column.kind == DATE
+    assert column.valid.tolist() == [True, False, True, False, False]
+    assert column.values[0] == np.datetime64("2021-04-01")
+    assert column.values[2] == np.datetime64("2024-02-29")
+    assert np.isnat(column.values[1])
+
+
+def test_sort_keys_put_invalid_values_last():
+    column = decode_decimal(["2,5", "", "-1", "10"])
+    assert np.argsort(column.sort_keys(), kind="stable").tolist() == [2, 0, 3, 1]
+    dates = decode_date(["02012024", "", "01012024"])
+    assert np.argsort(dates.sort_keys(), kind="stable").tolist() == [2, 0, 1]
+
+
+def test_codes_are_not_decoded():
+    assert decode_column(CODE, ["001", "002"]) is None
+    assert decode_column(DECIMAL, ["1,0"]).values.tolist() == [10]
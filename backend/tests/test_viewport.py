@@ -0,0 +1,71 @@
+# test_viewport.py
+import pytest
+
+from conftest import sample_files
+
+
+@pytest.fixture(scope="module")
+def doc_id(upload):
+    return upload(sample_files("PISCOFINS_202402*.txt") + sample_files("PISCOFINS_202403*.txt"), "viewport")
+
+
+def rows_of(client, doc_id, sheet, **params):
+    response = client.get(f"/documents/{doc_id}/sheets/{sheet}/rows", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def decimal(value):
+    return float(value.replace(",", ".")) if value else None
+
+
+def test_windows_tile_the_sheet(client, doc_id):
+    whole = rows_of(client, doc_id, "C170", row_count=5000)
+    assert whole["total_rows"] == len(whole["rows"]) == 196
+    assert len(set(whole["row_ids"])) == 196
+
+    first = rows_of(client, doc_id, "C170", row_start=0, row_count=150)
+    rest = rows_of(client, doc_id, "C170", row_start=150, row_count=150)
+    assert first["rows"] + rest["rows"] == whole["rows"]
+    assert first["row_ids"] + rest["row_ids"] == whole["row_ids"]
+    assert rest["row_start"] == 150 and len(rest["rows"]) == 46
+
+
+def test_column_window(client, doc_id):
+    whole = rows_of(client, doc_id, "C170", row_count=10)
+    window = rows_of(client, doc_id, "C170", row_count=10, col_start=3, col_count=2)
+    assert window["total_columns"] == whole["total_columns"] == len(whole["headers"])
+    assert window["headers"] == whole["headers"][3:5]
+    assert window["rows"] == [row[3:5] for row in whole["rows"]]
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_sorting_by_a_decimal_column(client, doc_id, descending):
+    whole = rows_of(client, doc_id, "C170", row_count=5000)
+    column = whole["headers"].index("VL_ITEM")
+    by_id = dict(zip(whole["row_ids"], whole["rows"]))
+
+    first = rows_of(client, doc_id, "C170", row_count=100, sort="VL_ITEM", descending=descending)
+    rest = rows_of(client, doc_id, "C170", row_start=100, row_count=100, sort="VL_ITEM", descending=descending)
+    rows, row_ids = first["rows"] + rest["rows"], first["row_ids"] + rest["row_ids"]
+
+    assert sorted(row_ids) == sorted(whole["row_ids"])
+    assert all(by_id[row] == values for row, values in zip(row_ids, rows))
+    values = [decimal(row[column]) for row in rows if row[column]]
+    assert values == sorted(values, reverse=descending)
+    # Numeric, not text order: "10,00" sorts after "9,00".
+    assert values != sorted(values, key=str, reverse=descending)
+
+
+def test_bad_requests(client, doc_id):
+    url = f"/documents/{doc_id}/sheets"
+    assert client.get(f"{url}/C170/rows", params={"sort": "NOPE"}).status_code == 400
+    assert client.get(f"{url}/C170/rows", params={"row_count": 5001}).status_code == 400
+    assert client.get(f"{url}/Z999/rows").status_code == 404
+
+
+def test_whole_document_defaults_to_celldata(client, doc_id):
+    default = client.get(f"/documents/{doc_id}").json()
+    assert default["format"] == "celldata" and "celldata" in default["sheets"][0]
+    rows = client.get(f"/documents/{doc_id}", params={"format": "rows"}).json()
+    assert "rows" in rows["sheets"][0]
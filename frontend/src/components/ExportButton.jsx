@@ -1,7 +1,7 @@
 import React, { useState } from "react";
 import axios from "axios";
 
-const ExportButton = ({ sheets }) => {
+const ExportButton = ({ sheets, docId }) => {
   const [isExporting, setIsExporting] = useState(false);
   const [showOptions, setShowOptions] = useState(false);
 
@@ -20,7 +20,28 @@ const ExportButton = ({ sheets }) => {
     URL.revokeObjectURL(url);
   };
 
-  const exportFiles = async (exportType) => {
+  // CSV conventions Excel expects in pt-BR.
+  const EXCEL_BR_CSV = { delimiter: ";", decimal: "," };
+
+  const exportFiles = async (exportType, params = {}) => {
+    if (docId) {
+      // Stored documents are exported on the server, without sending the sheets back.
+      setIsExporting(true);
+      try {
+        const response = await axios.get(
+          `http://localhost:8000/export/documents/${docId}/${exportType}`,
+          { responseType: "blob", params }
+        );
+        downloadZip(response, `exported_files.${exportType}.zip`);
+      } catch (error) {
+        console.error("Export failed:", error);
+        alert("Export failed. Please try again.");
+      } finally {
+        setIsExporting(false);
+        setShowOptions(false);
+      }
+      return;
+    }
     if (sheets.length === 0) {
       alert("No data available for export.");
       return;
@@ -60,6 +81,7 @@ const ExportButton = ({ sheets }) => {
   
       const response = await axios.post(endpoint, exportPayload, {
         responseType: "blob",
+        params,
       });
       downloadZip(response, filename);
     } catch (error) {
@@ -97,6 +119,22 @@ const ExportButton = ({ sheets }) => {
           >
             Export CSV
           </button>
+          <button
+            onClick={() => exportFiles("csv", EXCEL_BR_CSV)}
+            disabled={isExporting}
+            className="bg-blue-400 text-white py-2 px-4 rounded-full shadow-md hover:bg-blue-500"
+          >
+            Export CSV (Excel)
+          </button>
+          {docId && (
+            <button
+              onClick={() => exportFiles("parquet")}
+              disabled={isExporting}
+              className="bg-purple-500 text-white py-2 px-4 rounded-full shadow-md hover:bg-purple-600"
+            >
+              Export Parquet
+            </button>
+          )}
         </div>
       )}
       <button
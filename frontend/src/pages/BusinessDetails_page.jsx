@@ -39,7 +39,10 @@ export default function BusinessDetails() {
   // 2) Load docs from /business/:businessId/files
   const fetchFiles = async () => {
     try {
-      const response = await axios.get(`http://localhost:8000/business/${businessId}/files`);
+      // catalog: only blocks, periods and row counts; the sheets are loaded when opened
+      const response = await axios.get(`http://localhost:8000/business/${businessId}/files`, {
+        params: { catalog: true },
+      });
       if (Array.isArray(response.data) && response.data.length > 0) {
         setFiles(response.data);
       } else {
@@ -184,9 +187,14 @@ export default function BusinessDetails() {
             <li key={idx} className="border p-2 rounded mt-2 flex items-center">
               <span className="mr-2">
                 Documento: {doc.id || doc.name || `Arquivo ${idx + 1}`}
+                {doc.sheets && (
+                  <span className="text-sm text-gray-500 ml-2">
+                    ({doc.sheets.length} blocos, {doc.periods?.length || 0} períodos, {doc.total_rows} linhas)
+                  </span>
+                )}
               </span>
               <button
-                onClick={() => navigate("/tablePage", { state: { doc } })}
+                onClick={() => navigate("/tablePage", { state: { docId: doc.id } })}
                 className="bg-blue-500 text-white px-2 py-1 rounded ml-auto"
               >
                 Abrir
@@ -30,6 +30,17 @@ export default function ImportArchives() {
     fetchCompanies();
   }, []);
 
+  // Poll the ingest job until the backend has parsed and stored the files
+  const waitForJob = async (jobId) => {
+    for (;;) {
+      const { data: job } = await axios.get(`http://localhost:8000/upload/jobs/${jobId}`);
+      if (job.status === "done" || job.status === "failed") {
+        return job;
+      }
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+    }
+  };
+
   const handleUpload = async () => {
     if (!files.length || !selectedCompany) {
       setError("Selecione uma empresa e pelo menos um arquivo.");
@@ -45,17 +56,14 @@ export default function ImportArchives() {
         headers: { "Content-Type": "multipart/form-data" },
       });
   
-      // data.data[0] should contain { company_id, sheets, mongo_inserted_id }
+      // data.data[0] should contain { company_id, job_id, status }
       if (data.data && data.data.length > 0) {
-        const doc = data.data[0];
-        navigate("/tablePage", {
-          state: {
-            doc: {
-              id: doc.mongo_inserted_id,
-              sheets: doc.sheets,
-            },
-          },
-        });
+        const job = await waitForJob(data.data[0].job_id);
+        if (job.status !== "done") {
+          setError("Falha ao processar os arquivos.");
+          return;
+        }
+        navigate("/tablePage", { state: { docId: job.doc_id } });
       }
     } catch (error) {
       console.error(error);
@@ -88,7 +88,9 @@ export default function TablePage() {
   const fetchDocument = async (id) => {
     console.log(`Fetching document with ID: ${id}...`);
     try {
-      const resp = await axios.get(`http://localhost:8000/documents/${id}`);
+      const resp = await axios.get(`http://localhost:8000/documents/${id}`, {
+        params: { format: "celldata" },
+      });
       console.log("Document fetched successfully:", resp.data);
       setDocId(resp.data.id);
       setSheets(validateSheets(resp.data.sheets));
@@ -190,11 +192,11 @@ export default function TablePage() {
         >
           Salvar
         </button>
-        <ExportButton sheets={sheets} />
+        <ExportButton sheets={sheets} docId={docId} />
       </div>
       <div style={{ flex: 1 }}>
         <Workbook {...workbookOptions} />
-        <ExportButton sheets={sheets} />
+        <ExportButton sheets={sheets} docId={docId} />
       </div>
     </div>
   );